@@ -0,0 +1,106 @@
+"""
+Benchmark command-rule lookup cost as the rule set grows.
+
+Compares, per lookup:
+  - the flat allowed_commands set lookup used without rules,
+  - a naive linear scan over fnmatch/regex rules,
+  - CompiledRules (trie + combined regex), cold and memoized.
+
+Usage:
+    python benchmarks/bench_policy.py [--lookups N]
+"""
+
+import argparse
+import fnmatch
+import random
+import re
+import string
+import time
+
+from cli_use.rules import compile_rules
+
+
+def make_specs(count: int) -> list:
+    rng = random.Random(count)
+    specs = []
+    for i in range(count):
+        name = "".join(rng.choice(string.ascii_lowercase) for _ in range(6)) + str(i)
+        kind = i % 4
+        if kind == 0:
+            specs.append({"command": name, "flags": ["--help"]})
+        elif kind == 1:
+            specs.append({"command": name + "*"})
+        elif kind == 2:
+            specs.append({"command": f"{name}-?.py"})
+        else:
+            specs.append({"regex": rf"{name}(\.\d+)?"})
+    return specs
+
+
+def linear_matcher(specs: list):
+    compiled = []
+    for spec in specs:
+        if "regex" in spec:
+            compiled.append(re.compile(spec["regex"] + r"\Z"))
+        else:
+            compiled.append(re.compile(fnmatch.translate(spec["command"])))
+
+    def match(command: str):
+        for regex in compiled:
+            if regex.match(command):
+                return regex
+        return None
+
+    return match
+
+
+def per_lookup_ns(fn, names: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name in names:
+            fn(name)
+    return (time.perf_counter() - start) / (repeat * len(names)) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'rules':>6} {'set':>10} {'linear':>12} {'compiled':>12} {'memoized':>12}  (ns/lookup)")
+    for count in (10, 100, 500, 1000):
+        specs = make_specs(count)
+        rng = random.Random(0)
+        names = []
+        for _ in range(args.lookups):
+            spec = rng.choice(specs)
+            base = spec.get("command") or spec["regex"].split("(")[0]
+            names.append(base.replace("*", "x").replace("?", "1"))
+        names += ["unknown-command"] * (args.lookups // 4)
+
+        allowed = {s["command"] for s in specs if "command" in s}
+        linear = linear_matcher(specs)
+
+        set_ns = per_lookup_ns(allowed.__contains__, names, 5)
+        linear_ns = per_lookup_ns(linear, names, 1)
+
+        # Cold: the memo cache is cleared before every lookup
+        rules = compile_rules(specs)
+
+        def cold_match(name, rules=rules):
+            rules._cache.clear()
+            return rules.match(name)
+
+        cold_ns = per_lookup_ns(cold_match, names, 1)
+
+        rules = compile_rules(specs)
+        per_lookup_ns(rules.match, names, 1)
+        rules_warm = per_lookup_ns(rules.match, names, 5)
+
+        print(
+            f"{count:>6} {set_ns:>10.0f} {linear_ns:>12.0f} {cold_ns:>12.0f} {rules_warm:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
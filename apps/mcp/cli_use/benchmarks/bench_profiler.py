@@ -0,0 +1,64 @@
+"""
+Benchmark the cost of the sampling profiler on CPU-bound Python work.
+
+Runs the same workload with the profiler off and with it sampling at several
+intervals, and reports throughput loss next to the overhead the profiler
+measured itself.
+
+Usage:
+    python benchmarks/bench_profiler.py [--seconds N] [--threads N]
+"""
+
+import argparse
+import threading
+import time
+
+from cli_use.profiler import StackSampler
+
+
+def workload(stop: threading.Event, counter: list, index: int) -> None:
+    done = 0
+    while not stop.is_set():
+        sorted(range(2000, 0, -1))
+        done += 1
+    counter[index] = done
+
+
+def run(seconds: float, threads: int, interval: float = 0.0) -> tuple:
+    stop = threading.Event()
+    counter = [0] * threads
+    workers = [
+        threading.Thread(target=workload, args=(stop, counter, i)) for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    profile = None
+    if interval:
+        profile = StackSampler(interval=interval, max_overhead=1.0).sample(seconds)
+    else:
+        time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counter) / seconds, profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    baseline, _ = run(args.seconds, args.threads)
+    print(f"{'interval':>10} {'ops/s':>12} {'slowdown':>10} {'measured':>10} {'samples':>8}")
+    print(f"{'off':>10} {baseline:>12.0f} {'-':>10} {'-':>10} {'-':>8}")
+    for interval in (0.01, 0.005, 0.001):
+        rate, profile = run(args.seconds, args.threads, interval)
+        print(
+            f"{interval * 1000:>8.0f}ms {rate:>12.0f} {1 - rate / baseline:>10.2%} "
+            f"{profile.overhead:>10.2%} {profile.samples:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
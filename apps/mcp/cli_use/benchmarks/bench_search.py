@@ -0,0 +1,115 @@
+"""
+Benchmark the search tool's ContentSearcher against shelled-out `grep -rn`.
+
+Usage:
+    python benchmarks/bench_search.py [PATH] [--pattern PATTERN] [--runs N]
+
+Without PATH a synthetic tree is generated in a temporary directory.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from cli_use.search import ContentSearcher
+
+
+def make_tree(root: str, files: int = 4000, lines: int = 400) -> None:
+    line = "lorem ipsum dolor sit amet consectetur adipiscing elit\n"
+    for i in range(files):
+        directory = os.path.join(root, f"pkg{i % 50}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"mod{i}.py"), "w") as f:
+            body = line * lines
+            if i % 97 == 0:
+                body += "def handle_request(payload):\n"
+            f.write(body)
+
+
+def timed(fn, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        count = fn()
+        samples.append((time.perf_counter() - start, count))
+    return samples
+
+
+def report(name: str, samples: list) -> None:
+    times = [t for t, _ in samples]
+    print(
+        f"{name:<28} median {statistics.median(times) * 1000:8.1f} ms"
+        f"   min {min(times) * 1000:8.1f} ms   matches {samples[-1][1]}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--pattern", default=r"def handle_\w+")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    tempdir = None
+    root = args.path
+    if root is None:
+        tempdir = tempfile.mkdtemp(prefix="bench_search_")
+        make_tree(tempdir)
+        root = tempdir
+
+    try:
+        if shutil.which("grep"):
+            report(
+                "grep -rnE",
+                timed(
+                    lambda: subprocess.run(
+                        ["grep", "-rnE", args.pattern, "."],
+                        cwd=root,
+                        capture_output=True,
+                        text=True,
+                    ).stdout.count("\n"),
+                    args.runs,
+                ),
+            )
+
+        serial = ContentSearcher(workers=1)
+        report(
+            "ContentSearcher (serial)",
+            timed(
+                lambda: sum(1 for _ in serial.search(root, args.pattern, max_results=10**9)),
+                args.runs,
+            ),
+        )
+
+        parallel = ContentSearcher(workers=args.workers, min_parallel_files=0)
+        try:
+            cold = timed(
+                lambda: sum(
+                    1 for _ in parallel.search(root, args.pattern, max_results=10**9)
+                ),
+                1,
+            )
+            report("ContentSearcher (cold pool)", cold)
+            report(
+                f"ContentSearcher ({parallel.workers} workers)",
+                timed(
+                    lambda: sum(
+                        1 for _ in parallel.search(root, args.pattern, max_results=10**9)
+                    ),
+                    args.runs,
+                ),
+            )
+        finally:
+            parallel.shutdown()
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark terminal output normalization on spinner-heavy logs.
+
+Generates a log of the kind PTY commands produce (colored spinner frames
+redrawn with carriage returns, progress bars, multi-line status blocks
+redrawn with cursor-up, and plain log lines), feeds it to each output mode in
+PTY-sized chunks, and reports throughput and how much smaller the result is.
+
+Usage:
+    python benchmarks/bench_terminal.py [--megabytes N] [--chunk BYTES]
+"""
+
+import argparse
+import random
+import time
+
+from cli_use.terminal import OUTPUT_MODES, TerminalNormalizer
+
+SPINNER = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+
+
+def generate_log(size: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.4:
+            # Spinner with a colored label, redrawn in place
+            label = f"Working on step {rng.randint(1, 999)}"
+            part = "".join(
+                f"\r\x1b[2K\x1b[36m{SPINNER[i % len(SPINNER)]}\x1b[0m {label}..."
+                for i in range(rng.randint(20, 80))
+            ) + f"\r\x1b[2K\x1b[32m✓\x1b[0m {label}\n"
+        elif kind < 0.7:
+            # Progress bar
+            part = "".join(
+                f"\rDownloading [{'#' * (p // 5):<20}] {p:3d}%" for p in range(0, 101, 2)
+            ) + "\n"
+        elif kind < 0.85:
+            # Status block of three lines redrawn with cursor-up
+            frames = []
+            for i in range(rng.randint(5, 20)):
+                frames.append(
+                    f"\x1b[1mtasks\x1b[0m {i}\n\x1b[33mqueued\x1b[0m {20 - i}\nelapsed {i}s\n"
+                    "\x1b[3A"
+                )
+            part = "".join(frames) + "\x1b[3B"
+        else:
+            part = f"\x1b[90m{time.time():.3f}\x1b[0m INFO processed item {rng.randint(1, 10**6)}\n"
+        data = part.encode()
+        parts.append(data)
+        total += len(data)
+    return b"".join(parts)
+
+
+def run(log: bytes, mode: str, chunk: int) -> tuple:
+    normalizer = TerminalNormalizer(mode)
+    out = []
+    started = time.perf_counter()
+    for i in range(0, len(log), chunk):
+        out.append(normalizer.feed(log[i : i + chunk]))
+    out.append(normalizer.close())
+    elapsed = time.perf_counter() - started
+    return elapsed, len("".join(out).encode())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=float, default=8.0)
+    parser.add_argument("--chunk", type=int, default=65536, help="Bytes per read")
+    args = parser.parse_args()
+
+    log = generate_log(int(args.megabytes * 1024 * 1024))
+    print(f"log: {len(log) / 1e6:.1f} MB, {args.chunk}-byte chunks")
+    print(f"{'mode':>10} {'seconds':>9} {'MB/s':>8} {'output MB':>10} {'reduction':>10}")
+    for mode in OUTPUT_MODES:
+        elapsed, size = run(log, mode, args.chunk)
+        print(
+            f"{mode:>10} {elapsed:>9.3f} {len(log) / 1e6 / elapsed:>8.1f} "
+            f"{size / 1e6:>10.2f} {len(log) / max(size, 1):>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,32 @@
-import asyncio
-
-from . import server
+import importlib
+import os
+import sys
 
 
 def main():
     """Main entry point for the package."""
-    asyncio.run(server.main())
+    if sys.argv[1:2] in (["worker"], ["replay"]):
+        # `cli_use worker ...` runs a remote worker agent and `cli_use replay ...`
+        # a load test instead of a server
+        from .cli import cli
+
+        return cli()
+
+    from . import server
+    from .audit import configure_logging
+    from .loopwatch import run_with_loop
+
+    configure_logging()
+    run_with_loop(server.main(), os.getenv("EVENT_LOOP", "asyncio"))
+
+
+def __getattr__(name):
+    # The server module builds its executor from the environment on import, so
+    # it is loaded lazily to keep helper modules (e.g. search pool workers)
+    # importable without ALLOWED_DIR.
+    if name == "server":
+        return importlib.import_module(".server", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Optionally expose other important items at package level
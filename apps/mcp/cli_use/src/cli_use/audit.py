@@ -0,0 +1,182 @@
+"""
+Non-blocking logging and command audit records.
+
+Log records are handed to a queue and written by a background listener
+thread, so neither diagnostic logging nor audit records perform I/O on the
+event loop. On stdio transport all diagnostics go to stderr, never to the
+protocol stream on stdout.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Dict, Optional
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warn": logging.WARNING,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("true", "1")
+
+
+def configure_logging() -> None:
+    """
+    Routes root logging through a queue to a stderr handler on a background
+    thread. Safe to call more than once.
+
+    Environment Variables:
+        LOG_LEVEL: debug, info, warn or error (default: info)
+        VERBOSE: Set to "true" or "1" to force debug logging (default: false)
+    """
+    global _log_listener
+
+    level = LOG_LEVELS.get(os.getenv("LOG_LEVEL", "info").strip().lower(), logging.INFO)
+    if _env_flag("VERBOSE"):
+        level = logging.DEBUG
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _log_listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats audit records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {"ts": round(record.created, 6)}
+        payload.update(getattr(record, "audit", {}))
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+
+class AuditLogger:
+    """
+    Writes command audit records as JSON lines to a rotating file.
+
+    Records are queued without blocking and written by a listener thread.
+    Successful commands are sampled at ``sample_rate``; denials, errors and
+    non-zero exits are always kept. Each record carries the sample rate it
+    was kept at so totals can be re-weighted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        sample_rate: float = 1.0,
+    ):
+        self.path = path
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.sampled_out = 0
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._logger = logging.getLogger(f"cli_use.audit.{id(self):x}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+        if not path:
+            return
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+        audit_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self._logger.addHandler(logging.handlers.QueueHandler(audit_queue))
+        self._listener = logging.handlers.QueueListener(audit_queue, file_handler)
+        self._listener.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> "AuditLogger":
+        """
+        Environment Variables:
+            AUDIT_LOG_FILE: Path of the JSON lines audit log (default: disabled)
+            AUDIT_LOG_MAX_BYTES: Size at which the log is rotated (default: 10 MiB)
+            AUDIT_LOG_BACKUPS: Number of rotated files to keep (default: 5)
+            AUDIT_SAMPLE_RATE: Fraction of successful commands recorded (default: 1.0)
+        """
+        return cls(
+            path=os.getenv("AUDIT_LOG_FILE") or None,
+            max_bytes=int(os.getenv("AUDIT_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            backup_count=int(os.getenv("AUDIT_LOG_BACKUPS", "5")),
+            sample_rate=float(os.getenv("AUDIT_SAMPLE_RATE", "1.0")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._listener is not None
+
+    def record(
+        self,
+        command: str,
+        decision: str,
+        duration: float,
+        exit_code: Optional[int] = None,
+        stdout_bytes: int = 0,
+        stderr_bytes: int = 0,
+        **extra: Any,
+    ) -> None:
+        """
+        Queues an audit record. Never blocks on I/O.
+
+        Args:
+            command: The command string as received.
+            decision: "allowed", "denied", "rejected", "timeout", "cancelled" or "error".
+            duration: Seconds from receipt to completion.
+            exit_code: Child exit code, when the command ran.
+            stdout_bytes / stderr_bytes: Size of the output in bytes, as read from the child.
+        """
+        if not self.enabled:
+            return
+        routine = decision == "allowed" and exit_code == 0
+        if routine and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        audit: Dict[str, Any] = {
+            "command": command,
+            "decision": decision,
+            "duration_ms": round(duration * 1000, 3),
+            "exit_code": exit_code,
+            "stdout_bytes": stdout_bytes,
+            "stderr_bytes": stderr_bytes,
+            "sample_rate": self.sample_rate if routine else 1.0,
+        }
+        audit.update(extra)
+        self._logger.info("command", extra={"audit": audit})
+
+    def close(self) -> None:
+        """Flushes queued records and stops the listener thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
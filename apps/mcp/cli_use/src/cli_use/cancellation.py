@@ -0,0 +1,195 @@
+"""
+Cancellation of running commands.
+
+A command runs on a scheduler thread while the tool call that started it
+awaits the result on the event loop. When the client cancels the request or
+its connection drops, the awaiting task is cancelled; the task then sets the
+command's CancelToken, and the thread running the command stops its process
+group: SIGTERM first, SIGKILL to whatever is left after a grace period.
+"""
+
+import asyncio
+import contextvars
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+# Seconds between SIGTERM and SIGKILL when a command is stopped
+DEFAULT_KILL_GRACE = 2.0
+
+
+class CommandCancelled(Exception):
+    """The command was stopped because nobody is waiting for its result."""
+
+    pass
+
+
+class CancelToken:
+    """
+    A one-shot cancellation flag shared between the event loop and the
+    thread running a command.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Sets the token and runs the registered callbacks (once)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], Any]) -> None:
+        """Calls ``callback()`` on cancellation, or right away if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
+
+
+def _signal_group(pgid: int, sig: int) -> bool:
+    """Signals a process group; False if no process is left in it."""
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Some member changed credentials; it still exists
+        pass
+    return True
+
+
+def terminate_process_group(
+    pgid: int,
+    grace: float = DEFAULT_KILL_GRACE,
+    reap: Optional[Callable[[], Any]] = None,
+) -> bool:
+    """
+    Stops every process in a process group: SIGTERM, then SIGKILL to
+    whatever is still running after ``grace`` seconds.
+
+    Args:
+        pgid: The process group, i.e. the pid of a child started in its own
+            session.
+        grace: Seconds the processes get to exit after SIGTERM.
+        reap: Called while waiting to reap the group leader without
+            blocking. A leader that has exited but was not reaped still counts
+            as a member of the group, so without it the full grace period is
+            always spent (unless another thread reaps the leader).
+
+    Returns:
+        bool: True if SIGKILL had to be sent.
+    """
+    if not _signal_group(pgid, signal.SIGTERM):
+        return False
+    deadline = time.monotonic() + grace
+    delay = 0.001
+    while True:
+        if reap is not None:
+            reap()
+        if not _signal_group(pgid, 0):
+            return False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+    return _signal_group(pgid, signal.SIGKILL)
+
+
+class InFlightCalls:
+    """
+    The tool calls running on each connection.
+
+    A connection binds its own set of calls (see bind()) for the lifetime of
+    its MCP session; calls register themselves with track(), and release()
+    cancels the ones still running when the connection closes. Calls made
+    outside of a bound connection (stdio) are tracked in a shared set.
+    """
+
+    def __init__(self):
+        self._current: contextvars.ContextVar[Set["asyncio.Task[Any]"]] = contextvars.ContextVar(
+            "cli_use_in_flight_calls"
+        )
+        self._unbound: Set["asyncio.Task[Any]"] = set()
+        self._connections: List[Set["asyncio.Task[Any]"]] = []
+        self._lock = threading.Lock()
+        self.cancelled = 0
+        self.released = 0
+
+    def bind(self) -> contextvars.Token:
+        """Gives the current context (one connection) its own set of calls."""
+        calls: Set["asyncio.Task[Any]"] = set()
+        with self._lock:
+            self._connections.append(calls)
+        return self._current.set(calls)
+
+    def release(self, token: contextvars.Token) -> int:
+        """
+        Cancels the calls of the connection bound with ``token`` that are
+        still running, and unbinds it.
+
+        Returns:
+            int: The number of calls cancelled.
+        """
+        calls = self._current.get()
+        self._current.reset(token)
+        with self._lock:
+            self._connections = [c for c in self._connections if c is not calls]
+        cancelled = 0
+        for task in list(calls):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        with self._lock:
+            self.released += cancelled
+        return cancelled
+
+    def current(self) -> Set["asyncio.Task[Any]"]:
+        """The live set of calls of the connection bound in the current context."""
+        return self._current.get(self._unbound)
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Registers the current task as a call of the current connection."""
+        task = asyncio.current_task()
+        calls = self._current.get(self._unbound)
+        if task is not None:
+            calls.add(task)
+        try:
+            yield
+        except asyncio.CancelledError:
+            with self._lock:
+                self.cancelled += 1
+            raise
+        finally:
+            calls.discard(task)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            running = len(self._unbound) + sum(len(calls) for calls in self._connections)
+            return {
+                "connections": len(self._connections),
+                "running": running,
+                "cancelled": self.cancelled,
+                "cancelled_on_disconnect": self.released,
+            }
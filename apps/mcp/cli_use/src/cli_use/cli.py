@@ -3,23 +3,31 @@ Command-line interface for cli_use.
 """
 
 import os
+import hmac
+import json
 import click
 import asyncio
 import logging
 import uvicorn
+from contextlib import asynccontextmanager
 from starlette.applications import Starlette
-from starlette.routing import Route
-from starlette.responses import JSONResponse, StreamingResponse
+from starlette.middleware import Middleware
+from starlette.routing import Mount, Route
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Dict, Any, Optional
+from uuid import UUID
 import sys
 
 from mcp.server.lowlevel import Server
 from mcp.server.sse import SseServerTransport
 
-from .server import server, executor
+from .audit import configure_logging
+from .loopwatch import LOOP_CHOICES, run_with_loop
+from .profiler import ProfilerBusyError, parse_seconds
+from .ratelimit import AdmissionMiddleware
+from .sessions import set_heartbeat_interval
+from .transport import CompressionMiddleware
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -55,82 +63,412 @@ def cli():
     default="stdio",
     help="Transport type",
 )
+@click.option(
+    "--loop",
+    type=click.Choice(LOOP_CHOICES),
+    default="asyncio",
+    envvar="EVENT_LOOP",
+    show_default=True,
+    help="Event loop implementation (uvloop must be installed separately)",
+)
 def start(
     port: int,
     transport: str,
+    loop: str,
 ) -> int:
     """Start the CLI MCP server."""
-    
-    logger.info(f"Starting CLI MCP server with {transport} transport")
+    configure_logging()
+    from .server import server
 
-    if transport == "stdio":
-        # Run the server with stdio transport
-        logger.info("Starting CLI MCP server with stdio transport")
-        return asyncio.run(_run_stdio(server))
+    logger.info(f"Starting CLI MCP server with {transport} transport on the {loop} event loop")
 
-    else:
-        return asyncio.run(_run_sse(port))
+    try:
+        if transport == "stdio":
+            # Run the server with stdio transport
+            logger.info("Starting CLI MCP server with stdio transport")
+            return run_with_loop(_run_stdio(server), loop)
 
+        else:
+            return run_with_loop(_run_sse(port), loop)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
 
-async def _run_sse(port: int) -> int:
-    """Run the server using SSE transport."""
+
+@cli.command()
+@click.option(
+    "--connect",
+    "address",
+    envvar="WORKER_CONNECT",
+    required=True,
+    help="Server worker socket: unix:/path/to.sock or tcp:host:port",
+)
+@click.option("--name", default=None, help="Unique worker name (default: host-pid)")
+@click.option(
+    "--label", "labels", multiple=True, help="Label the server can target (repeatable)"
+)
+@click.option(
+    "--slots", default=os.cpu_count() or 1, show_default=True, help="Commands run at once"
+)
+@click.option(
+    "--dir",
+    "directory",
+    default=".",
+    type=click.Path(exists=True, file_okay=False),
+    help="Working directory for commands the server sends without one",
+)
+@click.option(
+    "--root",
+    "roots",
+    multiple=True,
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory tree commands may run in (repeatable, default: --dir)",
+)
+@click.option("--token", envvar="WORKER_TOKEN", default=None, help="Shared worker secret")
+@click.option(
+    "--kill-grace",
+    envvar="KILL_GRACE_PERIOD",
+    default=2.0,
+    show_default=True,
+    help="Seconds between SIGTERM and SIGKILL for cancelled commands",
+)
+def worker(
+    address: str,
+    name: Optional[str],
+    labels: tuple,
+    slots: int,
+    directory: str,
+    roots: tuple,
+    token: Optional[str],
+    kill_grace: float,
+) -> None:
+    """Run a worker agent that executes commands dispatched by a server."""
+    from .workers import WorkerAgent, WorkerError
+
+    configure_logging()
+    agent = WorkerAgent(
+        address,
+        name=name,
+        labels=labels,
+        slots=slots,
+        directory=directory,
+        roots=roots,
+        token=token,
+        kill_grace=kill_grace,
+    )
     try:
-        # Set up Starlette app for SSE transport using standard MCP SSE transport
-        sse = SseServerTransport("/messages/")
+        agent.run_forever()
+    except WorkerError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        agent.stop()
 
-        async def handle_sse(request):
-            """Handle SSE connections using mcp.server.sse."""
-            logger.info(f"New SSE connection from {request.client}")
-            try:
+
+@cli.command()
+@click.argument("recording", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--transport",
+    type=click.Choice(["stdio", "sse"]),
+    default="sse",
+    show_default=True,
+    help="How to reach the server under test",
+)
+@click.option(
+    "--url", default="http://localhost:8003/sse", show_default=True, help="SSE endpoint"
+)
+@click.option(
+    "--server-command",
+    default="cli_use",
+    show_default=True,
+    help="Command starting a stdio server (one per replayed session)",
+)
+@click.option(
+    "--speed",
+    default="1",
+    show_default=True,
+    help="Time compression factor (e.g. 1, 10) or 'max' to send back to back",
+)
+@click.option("--concurrency", default=1, show_default=True, help="Sessions replayed at once")
+@click.option("--repeat", default=1, show_default=True, help="Passes over the recording")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON")
+def replay(
+    recording: str,
+    transport: str,
+    url: str,
+    server_command: str,
+    speed: str,
+    concurrency: int,
+    repeat: int,
+    as_json: bool,
+) -> None:
+    """Replay a RECORD_FILE recording against a server and report latencies."""
+    from .recording import load_sessions
+    from .replay import replay as run_replay, sse_connector, stdio_connector
+
+    if speed == "max":
+        factor = None
+    else:
+        try:
+            factor = float(speed)
+        except ValueError:
+            factor = 0.0
+        if factor <= 0:
+            raise click.BadParameter("must be a positive number or 'max'", param_hint="--speed")
+    try:
+        sessions = load_sessions(recording)
+    except (ValueError, OSError, EOFError) as e:
+        raise click.ClickException(f"Cannot read {recording}: {e}")
+    if not any(sessions):
+        raise click.ClickException(f"No client requests found in {recording}")
+
+    connect = sse_connector(url) if transport == "sse" else stdio_connector(server_command)
+    report = asyncio.run(run_replay(sessions, connect, factor, concurrency, repeat))
+    if as_json:
+        click.echo(json.dumps(report.summary(), indent=2))
+    else:
+        click.echo(report.format())
+
+
+async def _response_sent(scope, receive, send) -> None:
+    """Returned by handle_sse: connect_sse has already written the whole response."""
+
+
+def create_sse_app(port: int) -> Starlette:
+    """Build the Starlette app serving the MCP server over SSE."""
+    # The server module builds its executors from the environment on import,
+    # so it is only loaded by the commands that serve MCP (not by `worker`)
+    from .server import (
+        server,
+        admission,
+        scheduler,
+        collect_stats,
+        tenant_summary,
+        memory_diagnostics,
+        profiler,
+        recorder,
+        start_services,
+        stop_services,
+        tenants,
+        compression,
+        transport_metrics,
+        in_flight,
+        sse_sessions,
+        bind_admission_sessions,
+        forget_admission_sessions,
+    )
+
+    # Set up Starlette app for SSE transport using standard MCP SSE transport
+    sse = SseServerTransport("/messages/")
+    set_heartbeat_interval(sse_sessions.config.heartbeat_interval)
+    memory_diagnostics.register_gauge("sessions", lambda: len(sse_sessions))
+    # Bearer token for the cross-tenant /admin endpoints, which are off without it
+    admin_token = os.getenv("ADMIN_TOKEN") or None
+
+    def request_tenant(request):
+        """
+        The tenant named by the /t/{tenant}/... path or a ?tenant= query
+        parameter, or the default tenant.
+
+        Raises:
+            KeyError: If the named tenant does not exist.
+        """
+        tenant_name = request.path_params.get("tenant") or request.query_params.get("tenant")
+        return tenants.get(tenant_name) if tenant_name else tenants.default
+
+    def unknown_tenant(request):
+        tenant_name = request.path_params.get("tenant") or request.query_params.get("tenant")
+        return JSONResponse(
+            {"status": "error", "message": f"Unknown tenant '{tenant_name}'"},
+            status_code=404,
+        )
+
+    def is_known_session(session_id: str) -> bool:
+        """Whether ``session_id`` names a session open on the SSE transport."""
+        try:
+            return UUID(hex=session_id) in sse._read_stream_writers
+        except ValueError:
+            return False
+
+    async def handle_sse(request):
+        """
+        Handle SSE connections using mcp.server.sse.
+
+        The tenant is taken from the /t/{tenant}/sse path or a ?tenant= query
+        parameter and bound for the lifetime of the MCP session. The session
+        is closed early when it is reaped as idle, too old or stalled.
+        """
+        try:
+            tenant = request_tenant(request)
+        except KeyError:
+            return unknown_tenant(request)
+
+        logger.info(f"New SSE connection from {request.client} for tenant {tenant.name}")
+        token = tenants.bind(tenant)
+        calls = in_flight.bind()
+        admission_sessions = bind_admission_sessions()
+        try:
+            async with sse_sessions.open(
+                request._send, tenant.name, str(request.client), in_flight.current()
+            ) as session:
                 async with sse.connect_sse(
-                    request.scope, request.receive, request._send
+                    request.scope, request.receive, session.wrap_send(request._send)
                 ) as streams:
                     # Run the MCP server with the streams
+                    read_stream, write_stream = recorder.wrap(
+                        *transport_metrics.wrap(*session.wrap(*streams))
+                    )
                     await server.run(
-                        streams[0], streams[1], server.create_initialization_options()
+                        read_stream, write_stream, server.create_initialization_options()
                     )
-            except Exception as e:
-                logger.error(f"Error in handle_sse: {str(e)}")
-                raise
-            finally:
-                logger.info(f"SSE connection from {request.client} closed")
-
-        async def health_check(request):
-            """Health check endpoint."""
-            try:
-                return JSONResponse({"status": "healthy", "allowed_dir": executor.allowed_dir})
-            except Exception as e:
-                return JSONResponse(
-                    {"status": "error", "message": str(e)}, status_code=500
-                )
-
-        # Define startup and shutdown events
-        async def startup_event():
-            """Run on server startup."""
-            logger.info("Starting server...")
-            logger.info(f"Server started on port {port} with SSE endpoint at /sse")
-
-        async def shutdown_event():
-            """Run on server shutdown."""
-            logger.info("Shutting down server...")
-            logger.info("Server shut down")
-
-        # Create Starlette app with routes
-        from starlette.routing import Mount
-        
-        routes = [
-            Route("/sse", endpoint=handle_sse, methods=["GET"]),
-            Mount("/messages/", app=sse.handle_post_message),
-            Route("/health", endpoint=health_check, methods=["GET"]),
-        ]
-
-        starlette_app = Starlette(
-            routes=routes,
-            on_startup=[startup_event],
-            on_shutdown=[shutdown_event],
-            debug=True,
+        except Exception as e:
+            logger.error(f"Error in handle_sse: {str(e)}")
+            raise
+        finally:
+            # Stop the commands of this connection; nobody will read their output
+            in_flight.release(calls)
+            forget_admission_sessions(admission_sessions)
+            tenants.unbind(token)
+            logger.info(f"SSE connection from {request.client} closed")
+        return _response_sent
+
+    async def health_check(request):
+        """Health check endpoint, reporting the requesting tenant's directory and policy."""
+        try:
+            tenant = request_tenant(request)
+        except KeyError:
+            return unknown_tenant(request)
+        try:
+            return JSONResponse(
+                {
+                    "status": "healthy",
+                    "tenant": tenant.name,
+                    **tenant_summary(tenant),
+                    "scheduler": scheduler.snapshot(),
+                    "sessions": len(sse_sessions),
+                }
+            )
+        except Exception as e:
+            return JSONResponse(
+                {"status": "error", "message": str(e)}, status_code=500
+            )
+
+    async def admission_status(request):
+        """Current rate-limit and process budget usage."""
+        return JSONResponse(admission.snapshot())
+
+    async def stats(request):
+        """Runtime statistics of the requesting tenant, as returned by the show_stats tool."""
+        try:
+            tenant = request_tenant(request)
+        except KeyError:
+            return unknown_tenant(request)
+        return JSONResponse(collect_stats(tenant))
+
+    async def admin_stats(request):
+        """Runtime statistics across all tenants; needs ADMIN_TOKEN."""
+        if admin_token is None:
+            return JSONResponse(
+                {"status": "error", "message": "Admin endpoints are disabled"}, status_code=404
+            )
+        supplied = request.headers.get("authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {admin_token}".encode()):
+            return JSONResponse(
+                {"status": "error", "message": "Admin token required"},
+                status_code=401,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return JSONResponse(collect_stats())
+
+    async def debug_memory(request):
+        """Memory report (top allocation sites and growth); needs DEBUG_MEMORY=true."""
+        if not memory_diagnostics.enabled:
+            return JSONResponse(
+                {"status": "error", "message": "Memory diagnostics are disabled"},
+                status_code=404,
+            )
+        try:
+            report = await asyncio.to_thread(
+                memory_diagnostics.report,
+                limit=int(request.query_params.get("limit", "20")),
+                group_by=request.query_params.get("group_by", "lineno"),
+                diff=request.query_params.get("diff", "true").lower() != "false",
+            )
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+        return JSONResponse(report)
+
+    async def debug_profile(request):
+        """
+        Samples stacks for ?seconds=N (default 5) and returns collapsed stacks,
+        or a JSON summary plus stacks with ?format=json; needs DEBUG_PROFILER=true.
+        """
+        if not profiler.enabled:
+            return JSONResponse(
+                {"status": "error", "message": "Profiling is disabled"}, status_code=404
+            )
+        try:
+            profile = await profiler.profile(
+                parse_seconds(request.query_params.get("seconds", "5")),
+                include_idle=request.query_params.get("idle", "false").lower() == "true",
+            )
+        except ValueError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+        except ProfilerBusyError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=409)
+
+        if request.query_params.get("format") == "json":
+            return JSONResponse({**profile.summary(), "stacks": dict(profile.stacks)})
+        return PlainTextResponse(
+            profile.collapsed(),
+            headers={
+                "X-Profile-Samples": str(profile.samples),
+                "X-Profile-Overhead": f"{profile.overhead:.4f}",
+            },
         )
 
+    @asynccontextmanager
+    async def lifespan(app):
+        """Run on server startup and shutdown."""
+        logger.info("Starting server...")
+        start_services()
+        logger.info(f"Server started on port {port} with SSE endpoint at /sse")
+        yield
+        logger.info("Shutting down server...")
+        sse_sessions.stop()
+        stop_services()
+        logger.info("Server shut down")
+
+    routes = [
+        Route("/sse", endpoint=handle_sse, methods=["GET"]),
+        Route("/t/{tenant}/sse", endpoint=handle_sse, methods=["GET"]),
+        Mount("/messages/", app=sse.handle_post_message),
+        Route("/health", endpoint=health_check, methods=["GET"]),
+        Route("/t/{tenant}/health", endpoint=health_check, methods=["GET"]),
+        Route("/admission", endpoint=admission_status, methods=["GET"]),
+        Route("/stats", endpoint=stats, methods=["GET"]),
+        Route("/t/{tenant}/stats", endpoint=stats, methods=["GET"]),
+        Route("/admin/stats", endpoint=admin_stats, methods=["GET"]),
+        Route("/debug/memory", endpoint=debug_memory, methods=["GET"]),
+        Route("/debug/profile", endpoint=debug_profile, methods=["GET"]),
+    ]
+
+    return Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(CompressionMiddleware, config=compression, metrics=transport_metrics),
+            Middleware(
+                AdmissionMiddleware, controller=admission, is_known_session=is_known_session
+            ),
+        ],
+        lifespan=lifespan,
+        debug=True,
+    )
+
+
+async def _run_sse(port: int) -> int:
+    """Run the server using SSE transport."""
+    try:
+        starlette_app = create_sse_app(port)
+
         # Run with uvicorn
         logger.info(f"Starting CLI MCP server with SSE transport on port {port}")
         config = uvicorn.Config(starlette_app, host="0.0.0.0", port=port)
@@ -145,7 +483,11 @@ async def _run_sse(port: int) -> int:
 
 async def _run_stdio(app: Server) -> int:
     """Run the server using stdio transport."""
+    from .server import memory_diagnostics, start_services, stop_services
+
     try:
+        start_services()
+        memory_diagnostics.register_gauge("sessions", lambda: 1)
         stdin_reader = AsyncStdinReader()
         stdout_writer = AsyncStdoutWriter()
 
@@ -165,6 +507,8 @@ async def _run_stdio(app: Server) -> int:
     except Exception as e:
         logger.error(f"Error running server: {e}")
         return 1
+    finally:
+        stop_services()
 
 
 if __name__ == "__main__":
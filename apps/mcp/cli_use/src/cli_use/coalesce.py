@@ -0,0 +1,177 @@
+"""
+Single-flight coalescing of identical concurrent commands.
+
+When several sessions run the same read-only command in the same directory
+at the same time, only the first request spawns a process; the others attach
+to that in-flight execution and receive its result (or its exception).
+Coalescing is opt-in and limited to commands matching a read-only pattern
+list, since repeating a command with side effects is not the same as
+sharing one execution.
+"""
+
+import asyncio
+import fnmatch
+import os
+import shlex
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from .rules import SHELL_OPERATORS
+
+DEFAULT_COALESCE_COMMANDS = (
+    "ls,cat,pwd,head,tail,wc,which,du,df,"
+    "git status*,git diff*,git log*,git show*,git branch,git rev-parse*,"
+    "npm ls*,npm outdated*,pip list*,pip freeze*"
+)
+
+
+def parse_command_patterns(spec: str) -> List[str]:
+    """Splits a comma-separated pattern list, dropping empty entries."""
+    return [pattern.strip() for pattern in spec.split(",") if pattern.strip()]
+
+
+def matches_command(command_string: str, patterns: List[str]) -> bool:
+    """
+    Checks a command against patterns with the same semantics as the
+    scheduler's priority rules: plain words match the command name, patterns
+    with spaces or wildcards are fnmatch patterns over the whole command.
+    """
+    command_string = " ".join(command_string.split())
+    name = command_string.split(" ", 1)[0] if command_string else ""
+    for pattern in patterns:
+        if " " in pattern or any(c in pattern for c in "*?["):
+            if fnmatch.fnmatchcase(command_string, pattern):
+                return True
+        elif name == pattern:
+            return True
+    return False
+
+
+def normalize_command(command_string: str) -> str:
+    """
+    Canonical form of a command for coalescing: tokenized and re-quoted, so
+    ``git  status`` and ``git 'status'`` share a key.
+    """
+    try:
+        return shlex.join(shlex.split(command_string))
+    except ValueError:
+        return " ".join(command_string.split())
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    The first caller for a key starts the call as its own task; callers
+    arriving while it runs await the same task. A waiter being cancelled does
+    not cancel the shared call, so the remaining waiters still get the result;
+    once the last waiter is cancelled, the shared call is cancelled too.
+
+    Args:
+        enabled: When False, do() always runs the call directly.
+        patterns: Read-only command patterns eligible for coalescing.
+    """
+
+    def __init__(self, enabled: bool = False, patterns: Optional[List[str]] = None):
+        self.enabled = enabled
+        self.patterns = list(patterns or [])
+        self._calls: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self._waiters: Dict["asyncio.Task[Any]", int] = {}
+        self.executions = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        """
+        Environment Variables:
+            COALESCE_COMMANDS: Set to true to share identical concurrent
+                read-only commands (default: false)
+            COALESCE_PATTERNS: Comma-separated read-only command patterns
+                (default: a built-in list of listing and inspection commands)
+        """
+        return cls(
+            enabled=os.getenv("COALESCE_COMMANDS", "false").lower() == "true",
+            patterns=parse_command_patterns(
+                os.getenv("COALESCE_PATTERNS", DEFAULT_COALESCE_COMMANDS)
+            ),
+        )
+
+    def key_for(self, command_string: str, *scope: Hashable) -> Optional[Hashable]:
+        """
+        Returns the coalescing key for a command, or None when the command
+        must run on its own (coalescing off, shell operators, or not read-only).
+        ``scope`` distinguishes executions that must not be shared, such as the
+        working directory and policy version.
+        """
+        # Redirections and chains may write, so they never coalesce
+        if not self.enabled or any(op in command_string for op in SHELL_OPERATORS):
+            return None
+        if not matches_command(command_string, self.patterns):
+            return None
+        return (*scope, normalize_command(command_string))
+
+    def in_flight(self, key: Optional[Hashable]) -> bool:
+        """True if a call for ``key`` is running and do() would join it."""
+        task = self._calls.get(key) if key is not None else None
+        return task is not None and not task.done()
+
+    async def do(
+        self,
+        key: Optional[Hashable],
+        fn: Callable[[], Awaitable[Any]],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """
+        Runs ``fn()`` or joins the in-flight call with the same key. A key of
+        None always runs ``fn()`` directly.
+
+        ``on_done`` is called once the execution this call started has
+        finished, however it ended, even if this caller stopped waiting for
+        it; a call that joins an execution calls it right away. It releases
+        resources held for the execution, such as a process slot.
+        """
+        if key is None:
+            try:
+                return await fn()
+            finally:
+                if on_done is not None:
+                    on_done()
+
+        task = self._calls.get(key)
+        if task is None or task.done():
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            if on_done is not None:
+                task.add_done_callback(lambda done: on_done())
+        else:
+            self.hits += 1
+            if on_done is not None:
+                on_done()
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _finished(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieve the exception so it is not reported as unhandled when
+            # every waiter was cancelled
+            task.exception()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "hits": self.hits,
+        }
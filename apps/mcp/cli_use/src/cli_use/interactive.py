@@ -0,0 +1,529 @@
+"""
+Persistent interactive PTY sessions.
+
+run_command starts a new process for every call and returns once it exits.
+A PtySession instead keeps a program (a REPL, a debugger, ``claude``)
+running in its own pseudo-terminal between tool calls, so it is started
+once and driven repeatedly: input is written to the terminal, and output is
+kept in a bounded buffer that clients read from with an offset cursor.
+
+One background thread reads the output of every session, reaps programs
+that exit, frees sessions whose program exited once their output has been
+read, and closes sessions left idle for too long.
+
+Input typed into a session is not checked against the security policy, so
+only the programs in PTY_SESSION_COMMANDS can be opened.
+"""
+
+import fcntl
+import os
+import pty
+import secrets
+import selectors
+import struct
+import termios
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .cancellation import DEFAULT_KILL_GRACE, terminate_process_group
+
+DEFAULT_ROWS = 24
+DEFAULT_COLS = 80
+MAX_TERMINAL_SIZE = 1000
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class SessionError(Exception):
+    """The session does not exist, is closed, or cannot be opened."""
+
+    pass
+
+
+@dataclass
+class PtySessionConfig:
+    """
+    Limits for PtySessionManager.
+
+    Attributes:
+        max_sessions: Sessions open at once (0 disables sessions).
+        buffer_bytes: Output kept per session; older output is dropped.
+        idle_timeout: Seconds without input or reads after which a session
+            is closed (0 keeps idle sessions open).
+        kill_grace: Seconds between SIGTERM and SIGKILL when closing.
+        commands: Programs that may be opened as sessions, in addition to
+            being allowed by the policy. Must not include shells or
+            interpreters unless their users may run anything.
+    """
+
+    max_sessions: int = 8
+    buffer_bytes: int = 1024 * 1024
+    idle_timeout: float = 900.0
+    kill_grace: float = DEFAULT_KILL_GRACE
+    commands: FrozenSet[str] = field(default_factory=lambda: frozenset({"claude"}))
+
+    @classmethod
+    def from_env(cls) -> "PtySessionConfig":
+        """
+        Environment Variables:
+            PTY_SESSIONS_MAX: Interactive sessions open at once, 0 to disable (default: 8)
+            PTY_SESSION_BUFFER_BYTES: Output kept per session (default: 1 MiB)
+            PTY_SESSION_IDLE_TIMEOUT: Seconds before an idle session is closed (default: 900)
+            KILL_GRACE_PERIOD: Seconds between SIGTERM and SIGKILL (default: 2)
+            PTY_SESSION_COMMANDS: Comma-separated programs that may be opened as
+                sessions (default: claude)
+        """
+        commands = os.getenv("PTY_SESSION_COMMANDS", "claude").split(",")
+        return cls(
+            max_sessions=int(os.getenv("PTY_SESSIONS_MAX", "8")),
+            buffer_bytes=int(os.getenv("PTY_SESSION_BUFFER_BYTES", str(1024 * 1024))),
+            idle_timeout=float(os.getenv("PTY_SESSION_IDLE_TIMEOUT", "900")),
+            kill_grace=float(os.getenv("KILL_GRACE_PERIOD", str(DEFAULT_KILL_GRACE))),
+            commands=frozenset(command.strip() for command in commands if command.strip()),
+        )
+
+
+class OutputRing:
+    """
+    The last ``capacity`` bytes of a stream, addressed by absolute offset
+    (bytes written since the stream started).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._data = bytearray()
+        self.start = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def append(self, data: bytes) -> None:
+        self._data += data
+        excess = len(self._data) - self.capacity
+        if excess > 0:
+            del self._data[:excess]
+            self.start += excess
+
+    def read(self, offset: int, limit: int) -> Tuple[bytes, int]:
+        """
+        Returns up to ``limit`` bytes from ``offset`` and the offset they
+        start at, which is later than ``offset`` if that output was dropped.
+        """
+        offset = min(max(offset, self.start), self.end)
+        index = offset - self.start
+        return bytes(self._data[index : index + limit]), offset
+
+
+def _complete_utf8(data: bytes) -> int:
+    """Length of ``data`` without a trailing, incomplete UTF-8 sequence."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return len(data)
+        if byte >= 0xC0:
+            needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) if needed <= back else len(data) - back
+    return len(data)
+
+
+class PtySession:
+    """
+    A program running in its own pseudo-terminal.
+
+    ``on_exit`` is called once, from the thread that reaps the program.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        command: str,
+        owner: str,
+        pid: int,
+        fd: int,
+        rows: int,
+        cols: int,
+        buffer_bytes: int,
+        on_exit: Optional[Callable[[], None]] = None,
+    ):
+        self.id = session_id
+        self.command = command
+        self.owner = owner
+        self.pid = pid
+        self.fd = fd
+        self.rows = rows
+        self.cols = cols
+        self.output = OutputRing(buffer_bytes)
+        self.returncode: Optional[int] = None
+        self.closed = False
+        # Offset up to which the output has been read
+        self.read_offset = 0
+        self.on_exit = on_exit
+        self.created = time.monotonic()
+        self.last_active = self.created
+        self.lock = threading.Lock()
+        # Serializes writers, so concurrent inputs are not interleaved
+        self.input_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.returncode is None
+
+    def reap(self) -> bool:
+        """Collects the exit status if the program has exited; True once it has."""
+        with self.lock:
+            if self.returncode is not None:
+                return True
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                # Reaped elsewhere; the status is lost
+                self.returncode = -1
+            else:
+                if not pid:
+                    return False
+                self.returncode = os.waitstatus_to_exitcode(status)
+            on_exit, self.on_exit = self.on_exit, None
+        if on_exit is not None:
+            on_exit()
+        return True
+
+    def finished(self) -> bool:
+        """True once the program has exited and all of its output has been read."""
+        with self.lock:
+            return (
+                self.returncode is not None
+                and self.closed
+                and self.read_offset >= self.output.end
+            )
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "session": self.id,
+                "command": self.command,
+                "pid": self.pid,
+                "rows": self.rows,
+                "cols": self.cols,
+                "running": self.returncode is None,
+                "exit_code": self.returncode,
+                "offset": self.output.end,
+                "oldest_offset": self.output.start,
+                "idle_seconds": round(time.monotonic() - self.last_active, 3),
+            }
+
+
+class PtySessionManager:
+    """
+    Opens, drives and closes PtySessions.
+
+    Sessions are scoped by owner (the tenant): a session can only be used by
+    the owner that opened it. The reader thread is started with the first
+    session.
+
+    Args:
+        config: Session limits.
+    """
+
+    def __init__(self, config: Optional[PtySessionConfig] = None):
+        self.config = config or PtySessionConfig()
+        self._sessions: Dict[str, PtySession] = {}
+        self._lock = threading.Lock()
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._thread: Optional[threading.Thread] = None
+        # Sessions to register with / remove from the selector; only the
+        # reader thread touches the selector and closes terminals
+        self._added: List[PtySession] = []
+        self._removed: List[PtySession] = []
+        self._wake_r, self._wake_w = -1, -1
+        self.opened = 0
+        self.closed = 0
+        self.evicted = 0
+        self.finished = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.max_sessions > 0
+
+    def open(
+        self,
+        argv: List[str],
+        cwd: str,
+        env: Dict[str, str],
+        command: str,
+        owner: str,
+        rows: int = DEFAULT_ROWS,
+        cols: int = DEFAULT_COLS,
+        on_exit: Optional[Callable[[], None]] = None,
+    ) -> PtySession:
+        """
+        Starts ``argv`` in a new pseudo-terminal of ``rows`` x ``cols``.
+        ``on_exit`` is called once the program has exited and been reaped,
+        e.g. to release an admission process slot.
+
+        Raises:
+            SessionError: If sessions are disabled, the limit is reached or
+                the terminal size is invalid.
+        """
+        if not 1 <= rows <= MAX_TERMINAL_SIZE or not 1 <= cols <= MAX_TERMINAL_SIZE:
+            raise SessionError(f"Terminal size must be between 1 and {MAX_TERMINAL_SIZE}")
+        with self._lock:
+            if len(self._sessions) >= self.config.max_sessions:
+                raise SessionError(
+                    f"Session limit reached ({self.config.max_sessions} open); close a session first"
+                )
+            self._ensure_thread()
+            pid, fd = pty.fork()
+            if pid == 0:  # Child process: session leader with the terminal as its controlling tty
+                try:
+                    fcntl.ioctl(1, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+                    os.chdir(cwd)
+                    os.execve(argv[0], argv, env)
+                finally:
+                    os._exit(127)
+            os.set_blocking(fd, False)
+            session = PtySession(
+                secrets.token_hex(8),
+                command,
+                owner,
+                pid,
+                fd,
+                rows,
+                cols,
+                self.config.buffer_bytes,
+                on_exit,
+            )
+            self._sessions[session.id] = session
+            self._added.append(session)
+            self.opened += 1
+        self._wake()
+        return session
+
+    def get(self, session_id: str, owner: str) -> PtySession:
+        """
+        Raises:
+            SessionError: If no session ``session_id`` is open for ``owner``.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None or session.owner != owner:
+            raise SessionError(f"Unknown session '{session_id}'")
+        return session
+
+    def write(self, session_id: str, owner: str, data: bytes, timeout: float = 5.0) -> int:
+        """
+        Writes input to the session's terminal.
+
+        Returns:
+            int: The output offset before the input was written; output
+                produced in response starts there.
+
+        Raises:
+            SessionError: If the session is unknown or has exited, or its
+                program does not read its input within ``timeout`` seconds.
+        """
+        session = self.get(session_id, owner)
+        deadline = time.monotonic() + timeout
+        with session.input_lock:
+            # The session lock is only held for the checks: the reader thread
+            # needs it to drain the output the program echoes while it reads
+            with session.lock:
+                if session.closed or session.returncode is not None:
+                    raise SessionError(f"Session '{session_id}' has exited")
+                session.last_active = time.monotonic()
+                offset = session.output.end
+                # A private descriptor stays valid if the session is closed
+                # (and its fd number reused) while the input is written
+                fd = os.dup(session.fd)
+            try:
+                view = memoryview(data)
+                while view:
+                    try:
+                        view = view[os.write(fd, view) :]
+                    except BlockingIOError:
+                        if session.closed or session.returncode is not None:
+                            raise SessionError(f"Session '{session_id}' has exited")
+                        if time.monotonic() >= deadline:
+                            raise SessionError("The program is not reading its input")
+                        time.sleep(0.01)
+                    except OSError as e:
+                        raise SessionError(f"Cannot write to session '{session_id}': {e}")
+            finally:
+                os.close(fd)
+        return offset
+
+    def read(
+        self, session_id: str, owner: str, offset: int = 0, limit: int = READ_CHUNK_SIZE
+    ) -> Tuple[str, int, int]:
+        """
+        Reads buffered output without waiting.
+
+        Returns:
+            tuple[str, int, int]: The text, the offset it starts at (later
+                than ``offset`` if that output was dropped) and the offset to
+                read from next. A UTF-8 character split by the end of the
+                available output is left for the next read.
+        """
+        session = self.get(session_id, owner)
+        with session.lock:
+            session.last_active = time.monotonic()
+            data, start = session.output.read(offset, max(1, limit))
+            finished = session.closed and start + len(data) == session.output.end
+            if start > offset:
+                # Output was dropped; resume at the next character boundary
+                skip = 0
+                while skip < min(3, len(data)) and 0x80 <= data[skip] < 0xC0:
+                    skip += 1
+                data, start = data[skip:], start + skip
+            if not finished:
+                data = data[: _complete_utf8(data)]
+            session.read_offset = max(session.read_offset, start + len(data))
+        return data.decode("utf-8", errors="replace"), start, start + len(data)
+
+    def close(self, session_id: str, owner: str) -> PtySession:
+        """
+        Stops the session's program (its whole process group) and releases
+        the terminal. Buffered output is discarded.
+        """
+        session = self.get(session_id, owner)
+        self._close(session)
+        return session
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self._close(session)
+
+    def _close(self, session: PtySession, reason: str = "closed") -> None:
+        """Removes a session; ``reason`` is "closed", "evicted" or "finished"."""
+        with self._lock:
+            if self._sessions.pop(session.id, None) is None:
+                return
+            if reason == "evicted":
+                self.evicted += 1
+            elif reason == "finished":
+                self.finished += 1
+            else:
+                self.closed += 1
+        if not session.reap():
+            terminate_process_group(session.pid, self.config.kill_grace, reap=session.reap)
+            # The program got SIGKILL if it outlived the grace period
+            while not session.reap():
+                time.sleep(0.01)
+        with self._lock:
+            self._removed.append(session)
+        self._wake()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name="cli_use-pty-sessions", daemon=True)
+        self._thread.start()
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self) -> None:
+        selector = self._selector
+        next_check = time.monotonic()
+        while True:
+            with self._lock:
+                added, self._added = self._added, []
+                removed, self._removed = self._removed, []
+            for session in added:
+                selector.register(session.fd, selectors.EVENT_READ, session)
+            for session in removed:
+                self._release(session)
+            for key, _ in selector.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        while os.read(self._wake_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._drain(key.data)
+            now = time.monotonic()
+            if now >= next_check:
+                next_check = now + 1.0
+                self._check_sessions(now)
+
+    def _drain(self, session: PtySession) -> None:
+        while True:
+            try:
+                data = os.read(session.fd, READ_CHUNK_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                # EIO: every process holding the terminal has closed it
+                data = b""
+            if not data:
+                self._release(session)
+                return
+            with session.lock:
+                session.output.append(data)
+
+    def _release(self, session: PtySession) -> None:
+        with session.lock:
+            if session.closed:
+                return
+            session.closed = True
+            try:
+                self._selector.unregister(session.fd)
+            except (KeyError, ValueError):
+                pass
+            os.close(session.fd)
+
+    def _check_sessions(self, now: float) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.reap()
+            if session.finished():
+                # Nothing is left to read; free the slot for a new session
+                self._close(session, "finished")
+                continue
+            idle = now - session.last_active
+            if self.config.idle_timeout and idle > self.config.idle_timeout:
+                # Stopping a program can take the grace period; keep reading
+                # the other sessions meanwhile
+                threading.Thread(
+                    target=self._close, args=(session, "evicted"), daemon=True
+                ).start()
+
+    def buffered_bytes(self) -> int:
+        with self._lock:
+            return sum(len(session.output) for session in self._sessions.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            counters = {
+                "opened": self.opened,
+                "closed": self.closed,
+                "evicted": self.evicted,
+                "finished": self.finished,
+            }
+        return {
+            "open": len(sessions),
+            "running": sum(1 for session in sessions if session.running),
+            "buffered_bytes": sum(len(session.output) for session in sessions),
+            **counters,
+            "max_sessions": self.config.max_sessions,
+            "buffer_bytes": self.config.buffer_bytes,
+            "idle_timeout": self.config.idle_timeout,
+        }
@@ -0,0 +1,193 @@
+"""
+Event-loop lag watchdog.
+
+A watchdog thread periodically schedules a callback on the event loop and
+measures how late it runs. Lag is recorded in a histogram. When the callback
+is still pending after the stall threshold, the loop thread is blocked, and
+the watchdog logs the task and stack that are holding it at that moment.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Coroutine, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+LOOP_CHOICES = ("asyncio", "uvloop")
+
+# Bucket upper bounds in seconds, Prometheus style
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def run_with_loop(main: Coroutine[Any, Any, Any], loop: str = "asyncio") -> Any:
+    """
+    Runs ``main`` to completion on a new event loop of the given kind.
+
+    Raises:
+        ValueError: If ``loop`` is not one of LOOP_CHOICES.
+        RuntimeError: If uvloop is requested but not installed.
+    """
+    if loop not in LOOP_CHOICES:
+        raise ValueError(f"Unknown event loop '{loop}'. Use one of: {', '.join(LOOP_CHOICES)}")
+    if loop == "asyncio":
+        return asyncio.run(main)
+    try:
+        import uvloop
+    except ImportError:
+        main.close()
+        raise RuntimeError("uvloop is not installed. Run `pip install uvloop` to use it.")
+    if not hasattr(asyncio, "Runner"):
+        # Python 3.10 has no loop_factory; fall back to the policy API
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return asyncio.run(main)
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+        return runner.run(main)
+
+
+class LagHistogram:
+    """Cumulative-bucket histogram of lag samples, in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets, self.counts):
+                running += count
+                cumulative[f"{bound:g}"] = running
+            cumulative["+Inf"] = self.count
+            return {
+                "buckets": cumulative,
+                "count": self.count,
+                "sum": round(self.sum, 6),
+                "max": round(self.max, 6),
+            }
+
+
+class LoopWatchdog:
+    """
+    Measures event-loop lag from a background thread.
+
+    Args:
+        interval: Seconds between probes.
+        threshold: Lag in seconds after which the loop counts as stalled and
+            the blocking stack is logged.
+        on_stall: Optional callback receiving (lag so far, formatted stack).
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        threshold: float = 0.1,
+        on_stall: Optional[Callable[[float, str], None]] = None,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.on_stall = on_stall
+        self.histogram = LagHistogram()
+        self.stalls = 0
+        self.loop_kind: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "LoopWatchdog":
+        """
+        Environment Variables:
+            LOOP_LAG_INTERVAL_MS: Milliseconds between lag probes, 0 disables (default: 250)
+            LOOP_LAG_THRESHOLD_MS: Lag that counts as a stall and is logged (default: 100)
+        """
+        return cls(
+            interval=float(os.getenv("LOOP_LAG_INTERVAL_MS", "250")) / 1000,
+            threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000,
+        )
+
+    def start(self) -> None:
+        """
+        Starts watching the running loop. Must be called from the loop thread;
+        a watchdog left over from a previous loop is replaced.
+        """
+        loop = asyncio.get_running_loop()
+        if self.interval <= 0 or (self._thread is not None and self._loop is loop):
+            return
+        self.stop()
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self.loop_kind = type(loop).__module__.split(".")[0]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(loop, self._stop),
+            name="cli_use-loop-watchdog",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            done = threading.Event()
+            posted = time.perf_counter()
+            try:
+                loop.call_soon_threadsafe(self._beat, posted, done)
+            except RuntimeError:
+                # The loop was closed
+                return
+            if done.wait(self.threshold):
+                continue
+            self.stalls += 1
+            self._report_stall(time.perf_counter() - posted)
+            while not done.wait(self.interval):
+                if stop.is_set() or loop.is_closed():
+                    return
+
+    def _beat(self, posted: float, done: threading.Event) -> None:
+        self.histogram.observe(time.perf_counter() - posted)
+        done.set()
+
+    def _report_stall(self, lag: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>\n"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        where = f" in task {task.get_name()} ({task.get_coro()!r})" if task is not None else ""
+        logger.warning(
+            f"Event loop blocked for more than {lag * 1000:.0f} ms{where}; stack:\n{stack}"
+        )
+        if self.on_stall is not None:
+            self.on_stall(lag, stack)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loop": self.loop_kind,
+            "running": self._thread is not None,
+            "threshold_seconds": self.threshold,
+            "stalls": self.stalls,
+            "lag_seconds": self.histogram.snapshot(),
+        }
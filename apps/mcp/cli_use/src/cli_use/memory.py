@@ -0,0 +1,192 @@
+"""
+Memory diagnostics.
+
+Opt-in tracemalloc-based reporting for long-running servers: top allocation
+sites, diffs against the previous report, process RSS, and live gauges such
+as open sessions, queued jobs and buffered output bytes. Optionally records
+the peak allocation of each tool call so growth can be attributed to a tool.
+"""
+
+import contextlib
+import linecache
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Allocations made by the diagnostics themselves are noise in every report
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size, or the peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryDiagnostics:
+    """
+    Collects memory reports on demand.
+
+    Tracing costs CPU and memory for every allocation, so nothing is traced
+    unless the diagnostics are enabled; gauges and RSS work either way.
+
+    Args:
+        enabled: Start tracemalloc and serve allocation reports.
+        frames: Stack frames stored per allocation (more frames, more overhead).
+        track_requests: Record the peak allocation of each tool call.
+    """
+
+    def __init__(self, enabled: bool = False, frames: int = 10, track_requests: bool = False):
+        self.enabled = enabled
+        self.frames = max(1, frames)
+        self.track_requests = track_requests
+        self._gauges: Dict[str, Callable[[], int]] = {}
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._request_peaks: Dict[str, Dict[str, int]] = {}
+        # Tracked requests running now, and how many have started in total
+        self._active_requests = 0
+        self._started_requests = 0
+
+    @classmethod
+    def from_env(cls) -> "MemoryDiagnostics":
+        """
+        Environment Variables:
+            DEBUG_MEMORY: Enable tracemalloc and the /debug/memory endpoint (default: false)
+            DEBUG_MEMORY_FRAMES: Frames kept per allocation (default: 10)
+            DEBUG_MEMORY_REQUESTS: Record each tool call's peak allocation (default: false)
+        """
+        return cls(
+            enabled=os.getenv("DEBUG_MEMORY", "false").lower() == "true",
+            frames=int(os.getenv("DEBUG_MEMORY_FRAMES", "10")),
+            track_requests=os.getenv("DEBUG_MEMORY_REQUESTS", "false").lower() == "true",
+        )
+
+    def start(self) -> None:
+        """Starts tracing allocations if enabled."""
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def register_gauge(self, name: str, fn: Callable[[], int]) -> None:
+        """Adds a live count reported with every snapshot, e.g. open sessions."""
+        self._gauges[name] = fn
+
+    def gauges(self) -> Dict[str, int]:
+        values = {}
+        for name, fn in self._gauges.items():
+            try:
+                values[name] = int(fn())
+            except Exception:
+                # A gauge must never break the report
+                values[name] = -1
+        return values
+
+    @contextlib.contextmanager
+    def track_request(self, name: str) -> Iterator[None]:
+        """
+        Records the peak traced allocation while the block runs under ``name``.
+
+        The tracemalloc peak is process-wide and reset by every tracked
+        request, so a measurement that overlapped another request is only
+        approximate: it includes the other request's allocations and misses
+        any peak reached before the other request reset it. Such measurements
+        are counted as ``overlapped``.
+        """
+        if not (self.track_requests and tracemalloc.is_tracing()):
+            yield
+            return
+        with self._lock:
+            overlapped = self._active_requests > 0
+            self._active_requests += 1
+            self._started_requests += 1
+            started = self._started_requests
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            allocated = max(0, peak - start)
+            with self._lock:
+                self._active_requests -= 1
+                overlapped = overlapped or self._started_requests != started
+                stats = self._request_peaks.setdefault(
+                    name, {"count": 0, "overlapped": 0, "total_bytes": 0, "max_bytes": 0}
+                )
+                stats["count"] += 1
+                stats["overlapped"] += overlapped
+                stats["total_bytes"] += allocated
+                stats["max_bytes"] = max(stats["max_bytes"], allocated)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cheap summary for the stats tool; never takes a tracemalloc snapshot."""
+        summary: Dict[str, Any] = {
+            "tracing": tracemalloc.is_tracing(),
+            "rss_bytes": rss_bytes(),
+            "gauges": self.gauges(),
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            summary["traced_bytes"] = current
+            summary["traced_peak_bytes"] = peak
+        if self.track_requests:
+            with self._lock:
+                summary["request_peaks"] = {
+                    name: dict(stats) for name, stats in self._request_peaks.items()
+                }
+        return summary
+
+    def report(self, limit: int = 20, group_by: str = "lineno", diff: bool = True) -> Dict[str, Any]:
+        """
+        Full report: the summary plus the top allocation sites and, when a
+        previous report exists, the sites that grew the most since then.
+
+        Raises:
+            RuntimeError: If the diagnostics are disabled.
+            ValueError: If ``group_by`` is not one of GROUP_BY.
+        """
+        if not self.enabled:
+            raise RuntimeError("Memory diagnostics are disabled. Set DEBUG_MEMORY=true to enable.")
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+        self.start()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        report = self.snapshot()
+        report["top"] = [_format_stat(stat) for stat in snapshot.statistics(group_by)[:limit]]
+        with self._lock:
+            baseline, self._baseline = self._baseline, snapshot
+        if diff and baseline is not None:
+            changes = snapshot.compare_to(baseline, group_by)
+            report["diff"] = [
+                _format_stat(stat) for stat in changes[:limit] if stat.size_diff or stat.count_diff
+            ]
+        return report
+
+
+def _format_stat(stat: Any) -> Dict[str, Any]:
+    frames: List[str] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    entry = {"site": frames[0] if frames else "?", "size_bytes": stat.size, "count": stat.count}
+    if len(frames) > 1:
+        entry["traceback"] = frames
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
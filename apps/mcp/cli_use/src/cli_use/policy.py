@@ -0,0 +1,149 @@
+"""
+Hot-reloadable security policy.
+
+A PolicyStore owns the current immutable policy object and replaces it
+atomically when the policy file changes, on SIGHUP, or on explicit request.
+Readers grab ``store.current`` once and keep using that object, so commands
+already in flight finish under the policy they started with.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+from typing import Callable, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PolicyStore(Generic[T]):
+    """
+    Holds the active policy and swaps in new versions.
+
+    Args:
+        loader: Builds a policy object for the given version number. Raising
+            any exception rejects the reload and keeps the current policy.
+        path: Policy file to watch for changes, if any.
+    """
+
+    def __init__(self, loader: Callable[[int], T], path: Optional[str] = None):
+        self._loader = loader
+        self.path = path
+        self.version = 1
+        self._current = loader(self.version)
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[T], None]] = []
+        self._file_state = self._stat()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> T:
+        return self._current
+
+    def subscribe(self, listener: Callable[[T], None]) -> None:
+        """
+        Registers a callback invoked with each newly installed policy. Callbacks
+        run under the store's lock, in version order, and must not reload.
+        """
+        self._listeners.append(listener)
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def reload(self) -> T:
+        """
+        Builds and installs the next policy version.
+
+        Raises:
+            Exception: Whatever the loader raised; the current policy stays active.
+        """
+        with self._lock:
+            self._file_state = self._stat()
+            try:
+                policy = self._loader(self.version + 1)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Policy reload failed, keeping version {self.version}: {e}")
+                raise
+            self.version += 1
+            self._current = policy
+            self.last_error = None
+            logger.info(f"Security policy version {self.version} installed")
+            # Notify before releasing the lock, so overlapping reloads (SIGHUP
+            # and the file watcher) cannot push an older version last
+            for listener in self._listeners:
+                listener(policy)
+        return policy
+
+    def check_for_changes(self) -> bool:
+        """Reloads if the policy file changed since the last load."""
+        if self._stat() == self._file_state:
+            return False
+        try:
+            self.reload()
+        except Exception:
+            # Logged by reload(); retried on the next change
+            pass
+        return True
+
+    def start_watching(self, interval: float = 2.0) -> None:
+        """Polls the policy file for changes on a daemon thread."""
+        if not self.path or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.check_for_changes()
+
+        self._watcher = threading.Thread(
+            target=watch, name="cli_use-policy-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        self._watcher = None
+
+
+def install_sighup_handler(
+    stores: Callable[[], Iterable["PolicyStore"]],
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+) -> None:
+    """
+    Reloads every store returned by ``stores`` on SIGHUP (no-op where SIGHUP
+    is unavailable). A failed reload of one store does not affect the others.
+
+    The handler runs on the event loop, so the reloads are handed to the
+    loop's default executor: loading a policy reads files and may wait for
+    a reload already holding a store's lock.
+    """
+    if not hasattr(signal, "SIGHUP"):
+        return
+
+    def reload_all():
+        for store in stores():
+            try:
+                store.reload()
+            except Exception:
+                # Logged by reload(); the store keeps its current policy
+                pass
+
+    def on_sighup():
+        loop.run_in_executor(None, reload_all)
+
+    try:
+        loop = loop or asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, on_sighup)
+    except (NotImplementedError, RuntimeError, ValueError):
+        logger.warning("SIGHUP policy reload is not available in this environment")
@@ -0,0 +1,230 @@
+"""
+Sampling profiler.
+
+A background thread periodically captures the Python stacks of every thread
+via ``sys._current_frames()`` and aggregates them as collapsed stacks
+(``frame;frame;frame count``), the input format of flamegraph.pl, speedscope
+and inferno. Nothing runs while no profile is being taken. The time spent
+sampling is measured, and the sampling interval backs off whenever it
+exceeds the overhead budget.
+"""
+
+import asyncio
+import collections
+import math
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Counter, Dict, List, Optional
+
+# Leaf frames in these modules mean the thread is blocked, not busy
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "socket.py", "ssl.py")
+
+MAX_INTERVAL = 0.1
+
+
+class ProfilerBusyError(Exception):
+    """Another profile is already being taken."""
+
+    pass
+
+
+def parse_seconds(value: Any) -> float:
+    """
+    Parses a profile duration given as a query parameter or tool argument.
+
+    Raises:
+        ValueError: If ``value`` is not a finite, positive number.
+    """
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"seconds must be a number, got {value!r}")
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise ValueError("seconds must be a finite, positive number")
+    return seconds
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _is_idle(frame: Any) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_MODULES)
+
+
+@dataclass
+class Profile:
+    """Aggregated samples of one profiling run."""
+
+    stacks: Counter[str] = field(default_factory=collections.Counter)
+    samples: int = 0
+    duration: float = 0.0
+    sampling_seconds: float = 0.0
+    interval: float = 0.0
+
+    @property
+    def overhead(self) -> float:
+        """Fraction of wall time the sampler held the interpreter."""
+        return self.sampling_seconds / self.duration if self.duration else 0.0
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one ``frames count`` line per distinct stack."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "duration_seconds": round(self.duration, 3),
+            "interval_seconds": self.interval,
+            "overhead": round(self.overhead, 4),
+        }
+
+
+class StackSampler:
+    """
+    Samples all thread stacks at a fixed interval.
+
+    Args:
+        interval: Seconds between samples.
+        max_overhead: Fraction of wall time sampling may take; the interval is
+            doubled (up to MAX_INTERVAL) whenever it is exceeded.
+    """
+
+    def __init__(self, interval: float = 0.005, max_overhead: float = 0.02):
+        self.interval = max(0.001, interval)
+        self.max_overhead = max_overhead
+
+    def sample(self, seconds: float, include_idle: bool = False) -> Profile:
+        """Samples for ``seconds`` on the calling thread and returns the profile."""
+        profile = Profile(interval=self.interval)
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        interval = self.interval
+        started = time.perf_counter()
+        deadline = started + seconds
+
+        while True:
+            tick = time.perf_counter()
+            if tick >= deadline:
+                break
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (not include_idle and _is_idle(frame)):
+                    continue
+                labels: List[str] = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                labels.append(f"thread:{names.get(ident, ident)}")
+                profile.stacks[";".join(reversed(labels))] += 1
+            profile.samples += 1
+            profile.sampling_seconds += time.perf_counter() - tick
+
+            elapsed = time.perf_counter() - started
+            if profile.sampling_seconds > self.max_overhead * elapsed and interval < MAX_INTERVAL:
+                interval = min(interval * 2, MAX_INTERVAL)
+            time.sleep(max(0.0, min(interval, deadline - time.perf_counter())))
+
+        profile.duration = time.perf_counter() - started
+        profile.interval = interval
+        return profile
+
+
+class Profiler:
+    """
+    Runs one sampling profile at a time on demand.
+
+    Args:
+        enabled: Allow profiles to be taken at all.
+        max_seconds: Upper bound for a single profile's duration.
+        interval: Initial sampling interval in seconds.
+        max_overhead: Overhead budget passed to the sampler.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_seconds: float = 60.0,
+        interval: float = 0.005,
+        max_overhead: float = 0.02,
+    ):
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """
+        Environment Variables:
+            DEBUG_PROFILER: Enable /debug/profile and the debug_profile tool (default: false)
+            PROFILER_MAX_SECONDS: Longest allowed profile (default: 60)
+            PROFILER_INTERVAL_MS: Initial sampling interval in milliseconds (default: 5)
+            PROFILER_MAX_OVERHEAD: Fraction of wall time sampling may use (default: 0.02)
+        """
+        return cls(
+            enabled=os.getenv("DEBUG_PROFILER", "false").lower() == "true",
+            max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", "60")),
+            interval=float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000,
+            max_overhead=float(os.getenv("PROFILER_MAX_OVERHEAD", "0.02")),
+        )
+
+    def run(self, seconds: float, include_idle: bool = False) -> Profile:
+        """
+        Takes a profile on the calling thread.
+
+        Raises:
+            RuntimeError: If profiling is disabled.
+            ValueError: If ``seconds`` is not a finite, positive number.
+            ProfilerBusyError: If another profile is in progress.
+        """
+        if not self.enabled:
+            raise RuntimeError("Profiling is disabled. Set DEBUG_PROFILER=true to enable.")
+        seconds = parse_seconds(seconds)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already being taken")
+        try:
+            sampler = StackSampler(self.interval, self.max_overhead)
+            profile = sampler.sample(min(seconds, self.max_seconds), include_idle)
+        finally:
+            self._lock.release()
+        self.runs += 1
+        self.last = profile.summary()
+        return profile
+
+    async def profile(self, seconds: float, include_idle: bool = False) -> Profile:
+        """Takes a profile on a dedicated thread without blocking the event loop."""
+        result: Dict[str, Any] = {}
+        done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def target():
+            try:
+                result["profile"] = self.run(seconds, include_idle)
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                loop.call_soon_threadsafe(done.set)
+
+        # A dedicated thread keeps the default executor free and gives the
+        # sampler a stable identity to exclude from its own samples
+        threading.Thread(target=target, name="cli_use-profiler", daemon=True).start()
+        await done.wait()
+        if "error" in result:
+            raise result["error"]
+        return result["profile"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "runs": self.runs, "last": self.last}
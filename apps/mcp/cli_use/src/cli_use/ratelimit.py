@@ -0,0 +1,376 @@
+"""
+Admission control for tool calls.
+
+Token buckets bound the rate of tool calls per session and globally, and
+counters bound the number of concurrently running child processes. Checks
+never block: a rejected request gets a retry-after hint immediately.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs
+
+# Retry hint returned when a process slot is unavailable; slots free up
+# when a command finishes, which cannot be predicted from a refill rate.
+PROCESS_RETRY_AFTER = 1.0
+# Sessions without calls for this long are dropped from the tables
+SESSION_IDLE_TTL = 600.0
+# Key charged for calls naming a session the transport does not know
+ANONYMOUS_KEY = "anonymous"
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at ``rate`` tokens/second.
+
+    Not thread-safe on its own; AdmissionController serializes access.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until ``tokens`` are available (0 when available now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def consume(self, tokens: float = 1.0) -> None:
+        if not self.unlimited:
+            self._refill()
+            self._tokens -= tokens
+
+    def snapshot(self) -> Dict[str, float]:
+        if self.unlimited:
+            return {"rate": 0, "capacity": 0, "available": None}
+        self._refill()
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "available": round(self._tokens, 3),
+        }
+
+
+@dataclass
+class AdmissionConfig:
+    """
+    Limits enforced by AdmissionController. A rate or limit of 0 disables it.
+    """
+
+    session_rate: float = 10.0
+    session_burst: float = 20.0
+    global_rate: float = 50.0
+    global_burst: float = 100.0
+    max_processes: int = 8
+    max_session_processes: int = 4
+
+    @classmethod
+    def from_env(cls) -> "AdmissionConfig":
+        """
+        Environment Variables:
+            RATE_LIMIT_SESSION: Tool calls per second per session (default: 10)
+            RATE_LIMIT_SESSION_BURST: Burst size per session (default: 20)
+            RATE_LIMIT_GLOBAL: Tool calls per second across sessions (default: 50)
+            RATE_LIMIT_GLOBAL_BURST: Global burst size (default: 100)
+            MAX_CONCURRENT_PROCESSES: Child processes running at once (default: 8)
+            MAX_SESSION_PROCESSES: Child processes per session (default: 4)
+        """
+        return cls(
+            session_rate=float(os.getenv("RATE_LIMIT_SESSION", "10")),
+            session_burst=float(os.getenv("RATE_LIMIT_SESSION_BURST", "20")),
+            global_rate=float(os.getenv("RATE_LIMIT_GLOBAL", "50")),
+            global_burst=float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "100")),
+            max_processes=int(os.getenv("MAX_CONCURRENT_PROCESSES", "8")),
+            max_session_processes=int(os.getenv("MAX_SESSION_PROCESSES", "4")),
+        )
+
+
+@dataclass
+class AdmissionDecision:
+    """Outcome of an admission check."""
+
+    admitted: bool
+    retry_after: float = 0.0
+    reason: str = ""
+
+
+@dataclass
+class _SessionState:
+    bucket: TokenBucket
+    processes: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+    # The session disconnected; drop it once its last process has exited
+    forgotten: bool = False
+
+
+class AdmissionController:
+    """
+    Tracks call-rate and process budgets per session and globally.
+    """
+
+    def __init__(
+        self,
+        config: Optional[AdmissionConfig] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.config = config or AdmissionConfig()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(self.config.global_rate, self.config.global_burst, clock)
+        self._sessions: Dict[str, _SessionState] = {}
+        self._processes = 0
+        self.rejected_calls = 0
+        self.rejected_processes = 0
+
+    def _session(self, key: str) -> _SessionState:
+        state = self._sessions.get(key)
+        now = self._clock()
+        if state is None:
+            self._prune(now)
+            state = _SessionState(
+                TokenBucket(self.config.session_rate, self.config.session_burst, self._clock),
+                last_seen=now,
+            )
+            self._sessions[key] = state
+        state.last_seen = now
+        return state
+
+    def _prune(self, now: float) -> None:
+        stale = [
+            key
+            for key, state in self._sessions.items()
+            if state.processes == 0 and now - state.last_seen > SESSION_IDLE_TTL
+        ]
+        for key in stale:
+            del self._sessions[key]
+
+    def admit_call(self, session_key: str) -> AdmissionDecision:
+        """
+        Charges one tool call to the session and global buckets. Nothing is
+        charged when either bucket rejects.
+        """
+        with self._lock:
+            session = self._session(session_key)
+            session_wait = session.bucket.wait_time()
+            global_wait = self._global.wait_time()
+            if session_wait or global_wait:
+                self.rejected_calls += 1
+                reason = (
+                    "session call rate exceeded"
+                    if session_wait >= global_wait
+                    else "global call rate exceeded"
+                )
+                return AdmissionDecision(False, max(session_wait, global_wait), reason)
+            session.bucket.consume()
+            self._global.consume()
+            return AdmissionDecision(True)
+
+    def try_acquire_process(self, session_key: str) -> AdmissionDecision:
+        """
+        Reserves a child-process slot. Callers must call release_process()
+        once the process has exited.
+        """
+        with self._lock:
+            session = self._session(session_key)
+            if self.config.max_processes and self._processes >= self.config.max_processes:
+                self.rejected_processes += 1
+                return AdmissionDecision(
+                    False, PROCESS_RETRY_AFTER, "global process limit reached"
+                )
+            if (
+                self.config.max_session_processes
+                and session.processes >= self.config.max_session_processes
+            ):
+                self.rejected_processes += 1
+                return AdmissionDecision(
+                    False, PROCESS_RETRY_AFTER, "session process limit reached"
+                )
+            session.processes += 1
+            self._processes += 1
+            return AdmissionDecision(True)
+
+    def release_process(self, session_key: str) -> None:
+        with self._lock:
+            self._processes = max(0, self._processes - 1)
+            session = self._sessions.get(session_key)
+            if session is not None:
+                session.processes = max(0, session.processes - 1)
+                if session.forgotten and not session.processes:
+                    del self._sessions[session_key]
+
+    def forget_session(self, session_key: str) -> None:
+        """
+        Drops a session's budget once it has disconnected. A session with
+        processes still running is dropped when the last one is released.
+        """
+        with self._lock:
+            state = self._sessions.get(session_key)
+            if state is None:
+                return
+            if state.processes:
+                state.forgotten = True
+            else:
+                del self._sessions[session_key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current budget usage, suitable for JSON serialization."""
+        with self._lock:
+            return {
+                "global": {
+                    "calls": self._global.snapshot(),
+                    "processes": self._processes,
+                    "max_processes": self.config.max_processes,
+                },
+                # Session ids are the bearer tokens of the message endpoint,
+                # so only a digest of each is shown
+                "sessions": {
+                    _digest(key): {
+                        "calls": state.bucket.snapshot(),
+                        "processes": state.processes,
+                        "max_processes": self.config.max_session_processes,
+                    }
+                    for key, state in self._sessions.items()
+                },
+                "rejected": {
+                    "calls": self.rejected_calls,
+                    "processes": self.rejected_processes,
+                },
+            }
+
+
+def _digest(session_key: str) -> str:
+    return hashlib.sha256(session_key.encode()).hexdigest()[:12]
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware charging JSON-RPC ``tools/call`` requests posted to the
+    SSE message endpoint against the admission controller.
+
+    Rejected requests get ``429 Too Many Requests`` with a Retry-After header
+    before the message reaches the MCP session.
+
+    The ``session_id`` query parameter is client-supplied and only validated
+    by the transport after admission, so calls are charged to it only when
+    ``is_known_session`` accepts it. Every other id shares ANONYMOUS_KEY:
+    made-up ids cannot mint fresh budgets or grow the session table.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        path_suffix: str = "/messages/",
+        is_known_session: Optional[Callable[[str], bool]] = None,
+    ):
+        self.app = app
+        self.controller = controller
+        self.path_suffix = path_suffix
+        self.is_known_session = is_known_session or (lambda session_id: False)
+
+    def _session_key(self, scope) -> str:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        session_id = query.get("session_id", [""])[0]
+        if session_id and self.is_known_session(session_id):
+            return session_id
+        return ANONYMOUS_KEY
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or not scope.get("path", "").endswith(self.path_suffix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        calls = _count_tool_calls(bytes(body))
+        if calls:
+            session_key = self._session_key(scope)
+            for _ in range(calls):
+                decision = self.controller.admit_call(session_key)
+                if not decision.admitted:
+                    await _send_rejection(send, decision)
+                    return
+
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": bytes(body), "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay_receive, send)
+
+
+def _count_tool_calls(body: bytes) -> int:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        # Malformed bodies are rejected by the transport itself
+        return 0
+    messages = payload if isinstance(payload, list) else [payload]
+    return sum(
+        1 for m in messages if isinstance(m, dict) and m.get("method") == "tools/call"
+    )
+
+
+async def _send_rejection(send, decision: AdmissionDecision) -> None:
+    retry_after = max(1, math.ceil(decision.retry_after))
+    body = json.dumps(
+        {
+            "error": "rate_limited",
+            "reason": decision.reason,
+            "retry_after": round(decision.retry_after, 3),
+        }
+    ).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(retry_after).encode()),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,257 @@
+"""
+JSON-RPC traffic recording.
+
+When recording is enabled, every message of every MCP session is appended
+to a JSON lines log (gzip-compressed if the file name ends in ``.gz``).
+The first line is a header; each following line is one message::
+
+    {"v": 1, "started": 1760000000.0}
+    {"t": 0.012, "s": 1, "d": ">", "m": {"jsonrpc": "2.0", "id": 1, ...}}
+
+``t`` is seconds since the recorder started, ``s`` the session number, and
+``d`` the direction (``>`` client to server, ``<`` server to client). Lines
+are written by a background thread so recording adds no I/O to the request
+path. ``cli_use replay`` re-drives a recording against a server.
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+CLIENT_TO_SERVER = ">"
+SERVER_TO_CLIENT = "<"
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _dump(message: Any) -> Dict[str, Any]:
+    """JSON form of a SessionMessage (or an exception passed through the stream)."""
+    root = getattr(message, "message", None)
+    if root is None:
+        return {"error": repr(message)}
+    return root.model_dump(by_alias=True, mode="json", exclude_none=True)
+
+
+class _RecordingReadStream:
+    """Wraps a session read stream and records every received message."""
+
+    def __init__(self, inner: Any, recorder: "TrafficRecorder", session: int):
+        self._inner = inner
+        self._recorder = recorder
+        self._session = session
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._inner.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._inner.__anext__()
+        self._recorder.record(self._session, CLIENT_TO_SERVER, message)
+        return message
+
+    async def receive(self):
+        message = await self._inner.receive()
+        self._recorder.record(self._session, CLIENT_TO_SERVER, message)
+        return message
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class _RecordingWriteStream:
+    """Wraps a session write stream and records every sent message."""
+
+    def __init__(self, inner: Any, recorder: "TrafficRecorder", session: int):
+        self._inner = inner
+        self._recorder = recorder
+        self._session = session
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._inner.__aexit__(*exc_info)
+
+    async def send(self, message: Any) -> None:
+        self._recorder.record(self._session, SERVER_TO_CLIENT, message)
+        await self._inner.send(message)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class TrafficRecorder:
+    """
+    Records MCP session traffic to a file.
+
+    Args:
+        path: Recording file, or None to disable recording.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.enabled = bool(path)
+        self.messages = 0
+        self._sessions = 0
+        self._lock = threading.Lock()
+        self._queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        if self.enabled:
+            self._thread = threading.Thread(
+                target=self._write, args=(_open(path, "a"),), name="cli_use-recorder", daemon=True
+            )
+            self._queue.put(json.dumps({"v": FORMAT_VERSION, "started": time.time()}))
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> "TrafficRecorder":
+        """
+        Environment Variables:
+            RECORD_FILE: Append all JSON-RPC traffic to this file (default: disabled)
+        """
+        return cls(os.getenv("RECORD_FILE") or None)
+
+    def wrap(self, read_stream: Any, write_stream: Any) -> Tuple[Any, Any]:
+        """Returns streams that record a new session's traffic (or the originals)."""
+        if not self.enabled:
+            return read_stream, write_stream
+        with self._lock:
+            self._sessions += 1
+            session = self._sessions
+        return (
+            _RecordingReadStream(read_stream, self, session),
+            _RecordingWriteStream(write_stream, self, session),
+        )
+
+    def record(self, session: int, direction: str, message: Any) -> None:
+        entry = {
+            "t": round(time.monotonic() - self._started, 6),
+            "s": session,
+            "d": direction,
+            "m": _dump(message),
+        }
+        self.messages += 1
+        self._queue.put(json.dumps(entry, separators=(",", ":")))
+
+    def _write(self, stream: IO[str]) -> None:
+        with stream:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    return
+                try:
+                    stream.write(line + "\n")
+                    # Flush when idle so the log is usable while the server runs
+                    if self._queue.empty():
+                        stream.flush()
+                except OSError as e:
+                    logger.error(f"Cannot write traffic recording {self.path}: {e}")
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "sessions": self._sessions,
+            "messages": self.messages,
+        }
+
+
+@dataclass
+class RecordedRequest:
+    """A client request from a recording, with its offset in its session."""
+
+    offset: float
+    method: str
+    params: Optional[Dict[str, Any]]
+
+
+def iter_recording(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields ``(run, entry)`` for each message of a recording. Every server
+    start appends a header line and begins a new run with its own clock and
+    session numbers.
+
+    A recording whose writer did not exit cleanly may end in a partial line,
+    or, compressed, without the gzip trailer; it is read up to the last
+    complete message.
+
+    Raises:
+        ValueError: If the file is not a recording of a supported version.
+        OSError: If the file cannot be read or is not valid gzip.
+    """
+    run = 0
+    with _open(path, "r") as f:
+        lines = enumerate(f, 1)
+        while True:
+            try:
+                number, line = next(lines)
+            except StopIteration:
+                return
+            except EOFError:
+                logger.warning(f"{path} is truncated; reading the messages before the cut")
+                return
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if line.endswith("\n"):
+                    raise ValueError(f"{path}:{number}: not a recorded message")
+                logger.warning(f"{path}:{number}: skipping the partial last line")
+                return
+            if "v" in entry:
+                if entry["v"] != FORMAT_VERSION:
+                    raise ValueError(f"{path}:{number}: unsupported recording version {entry['v']}")
+                run += 1
+                continue
+            yield run, entry
+
+
+def load_sessions(path: str) -> List[List[RecordedRequest]]:
+    """
+    Loads the client requests of each recorded session, in order, with
+    offsets relative to the session's first request. The handshake
+    (initialize) is left out since the replaying client performs its own.
+    """
+    sessions: Dict[Tuple[int, int], List[RecordedRequest]] = {}
+    starts: Dict[Tuple[int, int], float] = {}
+    for run, entry in iter_recording(path):
+        message = entry["m"]
+        if entry["d"] != CLIENT_TO_SERVER or "method" not in message or "id" not in message:
+            continue
+        if message["method"] == "initialize":
+            continue
+        key = (run, entry["s"])
+        start = starts.setdefault(key, entry["t"])
+        sessions.setdefault(key, []).append(
+            RecordedRequest(entry["t"] - start, message["method"], message.get("params"))
+        )
+    return list(sessions.values())
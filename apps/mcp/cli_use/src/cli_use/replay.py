@@ -0,0 +1,227 @@
+"""
+Replay recorded MCP traffic as a load test.
+
+Each recorded session is re-driven on its own client connection. At a finite
+speed, requests are sent at their recorded offsets divided by the speed,
+without waiting for earlier responses, which preserves the recorded overlap.
+At max speed, each session sends its requests back to back. Latency,
+throughput and error rates are reported per method.
+"""
+
+import asyncio
+import contextlib
+import math
+import os
+import shlex
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, List, Optional
+
+import mcp.types as types
+from mcp import ClientSession
+
+from .recording import RecordedRequest
+
+Connect = Callable[[], AsyncContextManager[ClientSession]]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values (0 for no values)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class MethodStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    tool_errors: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+        return {
+            "count": len(values),
+            "errors": self.errors,
+            "tool_errors": self.tool_errors,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p90_ms": round(percentile(values, 90) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+        }
+
+
+class ReplayReport:
+    """
+    Aggregates replay results.
+
+    Protocol errors (JSON-RPC errors, timeouts, lost connections) count as
+    errors; failed tool results are counted separately as tool errors, since
+    a denied command is a valid response.
+    """
+
+    def __init__(self):
+        self.methods: Dict[str, MethodStats] = {}
+        self.total = MethodStats()
+        self.sessions = 0
+        self.failed_sessions = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add(self, method: str, latency: float, error: bool = False, tool_error: bool = False) -> None:
+        for stats in (self.methods.setdefault(method, MethodStats()), self.total):
+            stats.latencies.append(latency)
+            stats.errors += error
+            stats.tool_errors += tool_error
+
+    def summary(self) -> Dict[str, Any]:
+        duration = (self.finished or time.perf_counter()) - self.started
+        requests = len(self.total.latencies)
+        return {
+            "duration_seconds": round(duration, 3),
+            "sessions": self.sessions,
+            "failed_sessions": self.failed_sessions,
+            "requests": requests,
+            "throughput_rps": round(requests / duration, 2) if duration > 0 else 0.0,
+            "error_rate": round(self.total.errors / requests, 4) if requests else 0.0,
+            "overall": self.total.summary(),
+            "methods": {name: stats.summary() for name, stats in sorted(self.methods.items())},
+        }
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{summary['requests']} requests in {summary['duration_seconds']}s "
+            f"({summary['throughput_rps']} req/s) over {summary['sessions']} session(s), "
+            f"error rate {summary['error_rate']:.2%}",
+            "",
+            f"{'method':<24} {'count':>7} {'errors':>7} {'tool_err':>8} "
+            f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+        ]
+        rows = list(summary["methods"].items()) + [("(all)", summary["overall"])]
+        for name, stats in rows:
+            lines.append(
+                f"{name:<24} {stats['count']:>7} {stats['errors']:>7} {stats['tool_errors']:>8} "
+                f"{stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+            )
+        return "\n".join(lines)
+
+
+def _is_tool_error(result: types.Result) -> bool:
+    """Tool failures are flagged with isError or, by this server, error=True content."""
+    if getattr(result, "isError", False):
+        return True
+    content = getattr(result, "content", None) or []
+    return any(isinstance(item, dict) and item.get("error") for item in content)
+
+
+async def _send(session: ClientSession, request: RecordedRequest, report: ReplayReport) -> None:
+    payload: Dict[str, Any] = {"method": request.method}
+    if request.params is not None:
+        payload["params"] = request.params
+    started = time.perf_counter()
+    error = tool_error = False
+    try:
+        result = await session.send_request(
+            types.ClientRequest.model_validate(payload), types.Result
+        )
+        tool_error = _is_tool_error(result)
+    except Exception:
+        error = True
+    report.add(request.method, time.perf_counter() - started, error, tool_error)
+
+
+async def _replay_session(
+    connect: Connect,
+    requests: List[RecordedRequest],
+    speed: Optional[float],
+    report: ReplayReport,
+) -> None:
+    async with connect() as session:
+        if speed is None:
+            for request in requests:
+                await _send(session, request, report)
+            return
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        pending = []
+        for request in requests:
+            delay = start + request.offset / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pending.append(asyncio.ensure_future(_send(session, request, report)))
+        await asyncio.gather(*pending)
+
+
+async def replay(
+    sessions: List[List[RecordedRequest]],
+    connect: Connect,
+    speed: Optional[float] = 1.0,
+    concurrency: int = 1,
+    repeat: int = 1,
+) -> ReplayReport:
+    """
+    Replays recorded sessions.
+
+    Args:
+        sessions: Requests per recorded session (see recording.load_sessions).
+        connect: Opens an initialized client session to the target server.
+        speed: Time compression factor, or None to send as fast as possible.
+        concurrency: Sessions replayed at the same time.
+        repeat: Number of passes over the recorded sessions.
+
+    Returns:
+        ReplayReport: Aggregated latency and error statistics.
+    """
+    report = ReplayReport()
+    queue: "asyncio.Queue[List[RecordedRequest]]" = asyncio.Queue()
+    for _ in range(max(1, repeat)):
+        for requests in sessions:
+            if requests:
+                queue.put_nowait(requests)
+
+    async def worker():
+        while not queue.empty():
+            requests = queue.get_nowait()
+            report.sessions += 1
+            try:
+                await _replay_session(connect, requests, speed, report)
+            except Exception:
+                report.failed_sessions += 1
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    report.finished = time.perf_counter()
+    return report
+
+
+def sse_connector(url: str) -> Connect:
+    """Connects to a server's SSE endpoint, e.g. http://localhost:8003/sse."""
+    from mcp.client.sse import sse_client
+
+    @contextlib.asynccontextmanager
+    async def connect() -> AsyncIterator[ClientSession]:
+        async with sse_client(url) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                yield session
+
+    return connect
+
+
+def stdio_connector(command: str) -> Connect:
+    """Starts a stdio server per session with ``command`` (e.g. ``cli_use``)."""
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    argv = shlex.split(command)
+    params = StdioServerParameters(command=argv[0], args=argv[1:], env=dict(os.environ))
+
+    @contextlib.asynccontextmanager
+    async def connect() -> AsyncIterator[ClientSession]:
+        async with stdio_client(params) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                yield session
+
+    return connect
@@ -0,0 +1,347 @@
+"""
+Compiled command rules for the security policy.
+
+Rules pair a command pattern with per-command flag and path restrictions.
+They are compiled once when the policy is loaded:
+
+- literal names and prefix globs (``npm*``) are stored in a character trie,
+- every other glob/regex pattern hangs off the trie node of its literal
+  prefix (``py*.test`` under ``py``), with all patterns sharing a node
+  merged into one alternation regex,
+
+so looking up the rule for a command costs one trie walk plus a regex match
+only on the nodes along that walk, independent of how many unrelated rules
+the policy holds. Deny and allow rules get a trie each, and a matching deny
+rule always wins. Results are memoized on the compiled object, which is
+replaced on every policy reload.
+"""
+
+import fnmatch
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Lookups memoized per compiled rule set before the cache is reset
+MATCH_CACHE_SIZE = 4096
+
+_GLOB_CHARS = set("*?[")
+
+# Operators that chain, pipe or redirect commands. A command string containing
+# any of them needs a shell and is validated part by part; coalescing skips it.
+SHELL_OPERATORS = ("&&", "||", "|", ">", ">>", "<", "<<", ";")
+
+
+@dataclass(frozen=True)
+class CommandRule:
+    """
+    Restrictions for commands matching one pattern.
+
+    Attributes:
+        pattern: The glob or regex the rule was declared with.
+        allow: False for deny rules, which reject the command outright.
+        flags: Allowed flags, or None to defer to the global flag policy.
+        allow_all_flags: Accept any flag not explicitly denied.
+        deny_flags: Flags that are always rejected.
+        paths: Compiled regex that path arguments (relative to the allowed
+            directory) must match, or None for no extra restriction.
+    """
+
+    pattern: str
+    allow: bool = True
+    flags: Optional[frozenset] = None
+    allow_all_flags: bool = False
+    deny_flags: frozenset = frozenset()
+    paths: Optional["re.Pattern[str]"] = None
+
+    def flag_allowed(self, flag: str) -> Optional[bool]:
+        """
+        Returns True/False when the rule decides on ``flag``, or None when the
+        global flag policy should decide. ``--opt=value`` is checked as
+        ``--opt`` as well.
+        """
+        name = flag.split("=", 1)[0]
+        if flag in self.deny_flags or name in self.deny_flags:
+            return False
+        if self.allow_all_flags:
+            return True
+        if self.flags is None:
+            return None
+        return flag in self.flags or name in self.flags
+
+    def path_allowed(self, relative_path: str) -> bool:
+        if self.paths is None:
+            return True
+        return bool(self.paths.match(relative_path))
+
+
+class _TrieNode:
+    __slots__ = ("children", "exact", "prefix", "patterns", "combined")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.exact: Optional[CommandRule] = None
+        self.prefix: Optional[CommandRule] = None
+        # (declaration index, regex source) of patterns with this literal prefix
+        self.patterns: List[Tuple[int, str]] = []
+        self.combined: Optional["re.Pattern[str]"] = None
+
+
+class _RuleIndex:
+    """
+    Trie over the command patterns of one kind of rule (allow or deny).
+
+    Exact names win over prefix globs, longer prefixes win over shorter ones,
+    and glob/regex patterns are consulted last, where the first declared
+    matching rule wins.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, bool, CommandRule]]):
+        self._root = _TrieNode()
+        self._pattern_rules: List[CommandRule] = []
+
+        for source, is_regex, rule in rules:
+            if not is_regex and not any(c in _GLOB_CHARS for c in source):
+                node = self._insert(source)
+                node.exact = node.exact or rule
+            elif (
+                not is_regex
+                and source.endswith("*")
+                and not any(c in _GLOB_CHARS for c in source[:-1])
+            ):
+                node = self._insert(source[:-1])
+                node.prefix = node.prefix or rule
+            else:
+                regex = _strip_anchors(source if is_regex else fnmatch.translate(source))
+                # Validate each rule on its own for a useful error message
+                re.compile(regex)
+                literal = _literal_prefix(source) if is_regex else _glob_prefix(source)
+                node = self._insert(literal)
+                node.patterns.append((len(self._pattern_rules), regex))
+                self._pattern_rules.append(rule)
+
+        self._compile_nodes(self._root)
+
+    def _compile_nodes(self, node: _TrieNode) -> None:
+        if node.patterns:
+            alternatives = "|".join(
+                f"(?P<r{index}>(?:{regex}))" for index, regex in node.patterns
+            )
+            node.combined = re.compile(f"(?:{alternatives})\\Z")
+        for child in node.children.values():
+            self._compile_nodes(child)
+
+    def _insert(self, key: str) -> _TrieNode:
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        return node
+
+    def match(self, command: str) -> Optional[CommandRule]:
+        return self._match_trie(command) or self._match_patterns(command)
+
+    def _match_trie(self, command: str) -> Optional[CommandRule]:
+        node = self._root
+        best = node.prefix
+        for char in command:
+            node = node.children.get(char)
+            if node is None:
+                return best
+            if node.prefix is not None:
+                best = node.prefix
+        return node.exact or best
+
+    def _match_patterns(self, command: str) -> Optional[CommandRule]:
+        best: Optional[int] = None
+        node = self._root
+        depth = 0
+        while node is not None:
+            if node.combined is not None:
+                m = node.combined.match(command)
+                if m is not None:
+                    index = next(i for i, _ in node.patterns if m.group(f"r{i}") is not None)
+                    best = index if best is None else min(best, index)
+            if depth == len(command):
+                break
+            node = node.children.get(command[depth])
+            depth += 1
+        return self._pattern_rules[best] if best is not None else None
+
+    def describe(self, lines: List[str]) -> None:
+        seen = set()
+
+        def walk(node: _TrieNode):
+            for rule in (node.exact, node.prefix):
+                if rule is not None and id(rule) not in seen:
+                    seen.add(id(rule))
+                    lines.append(_describe_rule(rule))
+            for char in sorted(node.children):
+                walk(node.children[char])
+
+        walk(self._root)
+        lines.extend(_describe_rule(rule) for rule in self._pattern_rules)
+
+
+class CompiledRules:
+    """
+    Rule set compiled for constant-cost lookup by command name.
+
+    Deny rules win: a command matching any deny rule is rejected, however
+    specific the allow rules it also matches. Among allow rules, exact names
+    win over prefix globs, longer prefixes win over shorter ones, and
+    glob/regex patterns are consulted last, where the first declared
+    matching rule wins.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, bool, CommandRule]]):
+        self._deny = _RuleIndex([entry for entry in rules if not entry[2].allow])
+        self._allow = _RuleIndex([entry for entry in rules if entry[2].allow])
+        self._cache: Dict[str, Optional[CommandRule]] = {}
+        self.size = len(rules)
+
+    def match(self, command: str) -> Optional[CommandRule]:
+        """Returns the rule governing ``command``, or None if no rule matches."""
+        try:
+            return self._cache[command]
+        except KeyError:
+            pass
+
+        rule = self._deny.match(command) or self._allow.match(command)
+
+        if len(self._cache) >= MATCH_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[command] = rule
+        return rule
+
+    def describe(self) -> List[str]:
+        """Human-readable summary lines, used by show_security_rules."""
+        lines: List[str] = []
+        self._deny.describe(lines)
+        self._allow.describe(lines)
+        return lines
+
+
+def _glob_prefix(glob: str) -> str:
+    """Literal characters before the first glob wildcard."""
+    for i, char in enumerate(glob):
+        if char in _GLOB_CHARS:
+            return glob[:i]
+    return glob
+
+
+def _literal_prefix(regex: str) -> str:
+    """
+    Literal characters every match of ``regex`` starts with. Conservative:
+    stops at the first metacharacter and drops a character that is followed
+    by an optional quantifier.
+    """
+    if regex.startswith("^"):
+        regex = regex[1:]
+    if "|" in regex:
+        return ""
+    prefix = []
+    for char in regex:
+        if char in "?*{":
+            if prefix:
+                prefix.pop()
+            break
+        if not (char.isalnum() or char in "-_/:@=,%"):
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+
+def _strip_anchors(regex: str) -> str:
+    """Removes a leading ^ and trailing $ / \\Z so the rule can be embedded."""
+    if regex.startswith("^"):
+        regex = regex[1:]
+    if regex.endswith(r"\Z"):
+        regex = regex[:-2]
+    elif regex.endswith("$") and not regex.endswith(r"\$"):
+        regex = regex[:-1]
+    return regex
+
+
+def _describe_rule(rule: CommandRule) -> str:
+    if not rule.allow:
+        return f"{rule.pattern}: denied"
+    parts = []
+    if rule.allow_all_flags:
+        parts.append("all flags")
+    elif rule.flags is not None:
+        parts.append("flags " + (", ".join(sorted(rule.flags)) or "none"))
+    if rule.deny_flags:
+        parts.append("never " + ", ".join(sorted(rule.deny_flags)))
+    if rule.paths is not None:
+        parts.append("restricted paths")
+    return f"{rule.pattern}: " + ("; ".join(parts) or "allowed")
+
+
+def compile_rules(specs: Sequence[Dict[str, Any]]) -> CompiledRules:
+    """
+    Compiles rule declarations from a policy file.
+
+    Each entry has either ``command`` (exact name or glob) or ``regex``, and
+    optionally ``allow`` (default true), ``flags`` (list or "all"),
+    ``deny_flags`` (list) and ``paths`` (globs relative to the allowed
+    directory; ``**`` crosses directories).
+
+    Raises:
+        ValueError: If an entry is malformed or a pattern does not compile.
+    """
+    compiled: List[Tuple[str, bool, CommandRule]] = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Rule {index} must be an object")
+        unknown = set(spec) - {"command", "regex", "allow", "flags", "deny_flags", "paths"}
+        if unknown:
+            raise ValueError(f"Rule {index} has unknown keys: {', '.join(sorted(unknown))}")
+        if ("command" in spec) == ("regex" in spec):
+            raise ValueError(f"Rule {index} needs exactly one of 'command' or 'regex'")
+
+        is_regex = "regex" in spec
+        source = str(spec["regex"] if is_regex else spec["command"])
+        flags = spec.get("flags")
+        allow_all_flags = isinstance(flags, str) and flags.lower() == "all"
+        paths = spec.get("paths")
+        try:
+            rule = CommandRule(
+                pattern=source,
+                allow=bool(spec.get("allow", True)),
+                flags=None if flags is None or allow_all_flags else frozenset(flags),
+                allow_all_flags=allow_all_flags,
+                deny_flags=frozenset(spec.get("deny_flags", [])),
+                paths=_compile_paths(paths) if paths is not None else None,
+            )
+            compiled.append((source, is_regex, rule))
+        except re.error as e:
+            raise ValueError(f"Rule {index} ({source!r}) is invalid: {e}")
+    try:
+        return CompiledRules(compiled)
+    except re.error as e:
+        raise ValueError(f"Invalid rule pattern: {e}")
+
+
+def _compile_paths(globs: Sequence[str]) -> "re.Pattern[str]":
+    alternatives = []
+    for glob in globs:
+        glob = glob.strip("/")
+        parts = []
+        i = 0
+        while i < len(glob):
+            if glob.startswith("**", i):
+                parts.append(".*")
+                i += 2
+                if glob.startswith("/", i):
+                    parts[-1] = "(?:.*/)?"
+                    i += 1
+            elif glob[i] == "*":
+                parts.append("[^/]*")
+                i += 1
+            elif glob[i] == "?":
+                parts.append("[^/]")
+                i += 1
+            else:
+                parts.append(re.escape(glob[i]))
+                i += 1
+        alternatives.append("".join(parts) or "")
+    return re.compile("(?:" + "|".join(alternatives) + r")\Z")
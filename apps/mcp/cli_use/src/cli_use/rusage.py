@@ -0,0 +1,271 @@
+"""
+Per-command resource accounting.
+
+Children are reaped with ``wait4``, which returns the kernel's resource usage
+of the child together with every descendant it waited for, so the figures
+cover the whole tree started by the shell (pipelines, subshells, compilers
+spawned by make). Descendants that are never reaped, such as daemons left
+running in the background, are not included.
+"""
+
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from .cancellation import DEFAULT_KILL_GRACE, CancelToken, CommandCancelled, terminate_process_group
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# Distinct command names tracked by ResourceStats; the rest are pooled
+MAX_TRACKED_COMMANDS = 1000
+OTHER_COMMANDS = "(other)"
+
+# Fields of ResourceUsage that are summed per command
+_SUMMED = (
+    "cpu_user_seconds",
+    "cpu_system_seconds",
+    "block_input_ops",
+    "block_output_ops",
+    "voluntary_context_switches",
+    "involuntary_context_switches",
+)
+
+
+@dataclass(frozen=True)
+class ResourceUsage:
+    """Resource usage of a command and its descendants."""
+
+    cpu_user_seconds: float = 0.0
+    cpu_system_seconds: float = 0.0
+    max_rss_bytes: int = 0
+    block_input_ops: int = 0
+    block_output_ops: int = 0
+    voluntary_context_switches: int = 0
+    involuntary_context_switches: int = 0
+
+    @classmethod
+    def from_rusage(cls, usage: Any) -> "ResourceUsage":
+        return cls(
+            cpu_user_seconds=round(usage.ru_utime, 6),
+            cpu_system_seconds=round(usage.ru_stime, 6),
+            max_rss_bytes=usage.ru_maxrss * _MAXRSS_UNIT,
+            block_input_ops=usage.ru_inblock,
+            block_output_ops=usage.ru_oublock,
+            voluntary_context_switches=usage.ru_nvcsw,
+            involuntary_context_switches=usage.ru_nivcsw,
+        )
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "ResourceUsage":
+        """Builds usage reported by a remote worker, ignoring unknown fields."""
+        return cls(**{k: v for k, v in values.items() if k in cls.__dataclass_fields__})
+
+    @property
+    def cpu_seconds(self) -> float:
+        return self.cpu_user_seconds + self.cpu_system_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def wait_with_rusage(
+    process: subprocess.Popen,
+    timeout: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Optional[ResourceUsage]:
+    """
+    Reaps ``process`` with wait4 and sets its returncode.
+
+    Returns:
+        ResourceUsage: Usage of the child tree, or None if the child had
+            already been reaped elsewhere.
+
+    Raises:
+        subprocess.TimeoutExpired: If the process is still running after
+            ``timeout`` seconds (it is left running).
+        CommandCancelled: If ``cancel`` is set while waiting (the process is
+            left running).
+    """
+    if process.returncode is not None:
+        return None
+    try:
+        if timeout is None and cancel is None:
+            _, status, usage = os.wait4(process.pid, 0)
+        else:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            delay = 0.0005
+            while True:
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                if cancel is not None and cancel.cancelled:
+                    raise CommandCancelled(f"Command {cancel.reason}")
+                remaining = deadline - time.monotonic() if deadline is not None else 0.05
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(process.args, timeout)
+                delay = min(delay * 2, remaining, 0.05)
+                time.sleep(delay)
+    except ChildProcessError:
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return ResourceUsage.from_rusage(usage)
+
+
+def _reap_nowait(process: subprocess.Popen) -> None:
+    try:
+        wait_with_rusage(process, timeout=0)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+def _join_readers(
+    readers: List[threading.Thread],
+    deadline: Optional[float],
+    cancel: Optional[CancelToken],
+    args: Any,
+    timeout: Optional[float],
+) -> None:
+    """
+    Waits for the output readers. Background processes that inherited the
+    pipes keep them open after the command itself exited, so the wait is
+    bounded by the command's deadline and cancel token.
+
+    Raises:
+        subprocess.TimeoutExpired: If the deadline passes first.
+        CommandCancelled: If ``cancel`` is set first.
+    """
+    for reader in readers:
+        while reader.is_alive():
+            if cancel is not None and cancel.cancelled:
+                raise CommandCancelled(f"Command {cancel.reason}")
+            remaining = deadline - time.monotonic() if deadline is not None else 0.05
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(args, timeout)
+            reader.join(min(remaining, 0.05))
+
+
+def run_with_rusage(
+    args: List[str],
+    timeout: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    grace: float = DEFAULT_KILL_GRACE,
+    **popen_kwargs: Any,
+) -> subprocess.CompletedProcess:
+    """
+    Like ``subprocess.run(args, capture_output=True, text=True, timeout=...)``,
+    with the child tree's ResourceUsage attached as ``result.rusage`` and the
+    size of the raw output as ``result.stdout_bytes``/``result.stderr_bytes``.
+
+    The command runs in its own session, so on timeout or cancellation its
+    whole process group is stopped (see terminate_process_group), not just
+    the shell. The timeout also covers background processes that keep the
+    output pipes open after the command exited.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command runs longer than ``timeout``.
+        CommandCancelled: If ``cancel`` is set before the command exits.
+    """
+    process = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+        **popen_kwargs,
+    )
+    output: Dict[str, str] = {}
+    sizes: Dict[str, int] = {}
+
+    def read(name: str, pipe) -> None:
+        # Each reader owns its pipe: closing it from another thread would
+        # block while a descendant still holds the write end
+        with pipe:
+            data = pipe.buffer.read()
+        # Decoded as text=True would, while the byte count is at hand
+        sizes[name] = len(data)
+        text = data.decode(pipe.encoding, pipe.errors)
+        output[name] = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    readers = [
+        threading.Thread(target=read, args=("stdout", process.stdout), daemon=True),
+        threading.Thread(target=read, args=("stderr", process.stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        usage = wait_with_rusage(process, timeout, cancel)
+        _join_readers(readers, deadline, cancel, args, timeout)
+    except (subprocess.TimeoutExpired, CommandCancelled) as e:
+        terminate_process_group(process.pid, grace, reap=lambda: _reap_nowait(process))
+        wait_with_rusage(process)
+        for reader in readers:
+            reader.join(timeout=1)
+        if isinstance(e, subprocess.TimeoutExpired):
+            e.output, e.stderr = output.get("stdout"), output.get("stderr")
+        raise
+    result = subprocess.CompletedProcess(
+        args, process.returncode, output.get("stdout", ""), output.get("stderr", "")
+    )
+    result.rusage = usage
+    result.stdout_bytes = sizes.get("stdout", 0)
+    result.stderr_bytes = sizes.get("stderr", 0)
+    return result
+
+
+def command_name(command_string: str) -> str:
+    """The program a command string runs first (``git`` for ``git status | head``)."""
+    try:
+        parts = shlex.split(command_string)
+    except ValueError:
+        parts = command_string.split()
+    return os.path.basename(parts[0]) if parts else ""
+
+
+class ResourceStats:
+    """Aggregates resource usage per command name."""
+
+    def __init__(self, max_commands: int = MAX_TRACKED_COMMANDS):
+        self.max_commands = max_commands
+        self._lock = threading.Lock()
+        self._commands: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, command_string: str, usage: ResourceUsage) -> None:
+        name = command_name(command_string)
+        with self._lock:
+            entry = self._commands.get(name)
+            if entry is None:
+                if len(self._commands) >= self.max_commands:
+                    name = OTHER_COMMANDS
+                entry = self._commands.setdefault(
+                    name, {"count": 0, "max_rss_bytes": 0, **dict.fromkeys(_SUMMED, 0)}
+                )
+            entry["count"] += 1
+            for key in _SUMMED:
+                entry[key] += getattr(usage, key)
+            entry["max_rss_bytes"] = max(entry["max_rss_bytes"], usage.max_rss_bytes)
+
+    def snapshot(self, limit: int = 20) -> Dict[str, Any]:
+        """The ``limit`` commands with the most CPU time, heaviest first."""
+        with self._lock:
+            entries = [(name, dict(entry)) for name, entry in self._commands.items()]
+        entries.sort(
+            key=lambda item: item[1]["cpu_user_seconds"] + item[1]["cpu_system_seconds"],
+            reverse=True,
+        )
+        commands = {}
+        for name, entry in entries[:limit]:
+            cpu = entry["cpu_user_seconds"] + entry["cpu_system_seconds"]
+            entry["cpu_user_seconds"] = round(entry["cpu_user_seconds"], 6)
+            entry["cpu_system_seconds"] = round(entry["cpu_system_seconds"], 6)
+            entry["cpu_seconds_mean"] = round(cpu / entry["count"], 6)
+            commands[name] = entry
+        return {"tracked": len(entries), "commands": commands}
+
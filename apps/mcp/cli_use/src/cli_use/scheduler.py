@@ -0,0 +1,238 @@
+"""
+Priority scheduling for command execution.
+
+Commands are queued by priority class and executed by a fixed pool of
+worker threads, so short interactive commands are picked up ahead of batch
+builds. Each class also maps to nice/ionice levels for the spawned child.
+"""
+
+import asyncio
+import fnmatch
+import heapq
+import itertools
+import os
+import shutil
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class PriorityClass:
+    """
+    Scheduling parameters for one priority level.
+
+    Attributes:
+        name: Priority name accepted by the run_command tool.
+        rank: Queue order; lower ranks are dequeued first.
+        nice: Nice increment applied to the child process.
+        ionice_class: ionice scheduling class (2 = best-effort), or None to
+            leave the I/O priority untouched.
+        ionice_level: ionice level within the class (0 = highest, 7 = lowest).
+    """
+
+    name: str
+    rank: int
+    nice: int = 0
+    ionice_class: Optional[int] = None
+    ionice_level: int = 4
+
+
+PRIORITY_CLASSES: Dict[str, PriorityClass] = {
+    "interactive": PriorityClass("interactive", 0, nice=0, ionice_class=2, ionice_level=0),
+    "normal": PriorityClass("normal", 1),
+    "batch": PriorityClass("batch", 2, nice=10, ionice_class=2, ionice_level=7),
+}
+
+DEFAULT_PRIORITY = "normal"
+
+DEFAULT_COMMAND_PRIORITIES = (
+    "interactive=ls,cat,pwd,echo,head,tail,wc,which,git status*,git diff*,git log*,git show*;"
+    "batch=npm run build*,npm install*,npm ci*,npx nx *,make*,cargo build*,cargo test*,"
+    "pytest*,python -m pytest*,docker build*,uv sync*"
+)
+
+PriorityRules = List[Tuple[str, str]]
+
+
+def parse_priority_rules(spec: str) -> PriorityRules:
+    """
+    Parses a priority spec of the form
+    ``interactive=ls,cat,git status*;batch=npm run build*``.
+
+    Patterns without spaces or wildcards match the command name; other
+    patterns are fnmatch patterns matched against the whole command string.
+
+    Raises:
+        ValueError: If the spec names an unknown priority class.
+    """
+    rules: PriorityRules = []
+    for section in spec.split(";"):
+        if not section.strip():
+            continue
+        name, _, patterns = section.partition("=")
+        name = name.strip().lower()
+        if name not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{name}'")
+        for pattern in patterns.split(","):
+            pattern = pattern.strip()
+            if pattern:
+                rules.append((pattern, name))
+    return rules
+
+
+def load_priority_rules() -> PriorityRules:
+    """
+    Loads command priority rules from the environment.
+
+    Environment Variables:
+        COMMAND_PRIORITIES: Priority spec (see parse_priority_rules), defaults
+            to a built-in set of interactive and batch patterns.
+    """
+    return parse_priority_rules(os.getenv("COMMAND_PRIORITIES", DEFAULT_COMMAND_PRIORITIES))
+
+
+def classify_command(
+    command_string: str, rules: PriorityRules, default: str = DEFAULT_PRIORITY
+) -> str:
+    """Returns the priority of the first rule matching the command."""
+    command_string = command_string.strip()
+    name = command_string.split(None, 1)[0] if command_string else ""
+    for pattern, priority in rules:
+        if " " in pattern or any(c in pattern for c in "*?["):
+            if fnmatch.fnmatchcase(command_string, pattern):
+                return priority
+        elif name == pattern:
+            return priority
+    return default
+
+
+_NICE = shutil.which("nice")
+_IONICE = shutil.which("ionice") if sys.platform.startswith("linux") else None
+
+
+def priority_prefix(priority: str) -> List[str]:
+    """
+    Returns the argv prefix applying the class's nice/ionice levels, using the
+    system `nice`/`ionice` binaries when available.
+    """
+    cls = PRIORITY_CLASSES[priority]
+    prefix: List[str] = []
+    if cls.nice and _NICE:
+        prefix += [_NICE, "-n", str(cls.nice)]
+    if cls.ionice_class is not None and _IONICE:
+        prefix += [_IONICE, "-c", str(cls.ionice_class), "-n", str(cls.ionice_level)]
+    return prefix
+
+
+@dataclass
+class _Job:
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: "asyncio.Future[Any]"
+    loop: asyncio.AbstractEventLoop
+    priority: str
+
+
+class CommandScheduler:
+    """
+    Runs blocking callables on worker threads in priority order.
+
+    Jobs of the same priority run in submission order. Worker threads are
+    started lazily on first submission.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = max(1, workers)
+        self._queue: List[Tuple[int, int, _Job]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, int] = {name: 0 for name in PRIORITY_CLASSES}
+        self._closed = False
+
+    def _ensure_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"cli_use-scheduler-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    async def run(self, priority: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Queues ``fn(*args)`` at ``priority`` and waits for its result.
+
+        Raises:
+            ValueError: If ``priority`` is not a known priority class.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(
+                f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITY_CLASSES)}"
+            )
+        loop = asyncio.get_running_loop()
+        job = _Job(fn, args, loop.create_future(), loop, priority)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._ensure_workers()
+            heapq.heappush(
+                self._queue, (PRIORITY_CLASSES[priority].rank, next(self._counter), job)
+            )
+            self._cond.notify()
+        return await job.future
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                if job.future.cancelled():
+                    continue
+                self._running[job.priority] += 1
+            try:
+                try:
+                    result = job.fn(*job.args)
+                except BaseException as e:
+                    job.loop.call_soon_threadsafe(_set_exception, job.future, e)
+                else:
+                    job.loop.call_soon_threadsafe(_set_result, job.future, result)
+            except RuntimeError:
+                # The loop closed while a cancelled job was winding down
+                pass
+            finally:
+                with self._cond:
+                    self._running[job.priority] -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_CLASSES}
+            for _, _, job in self._queue:
+                if not job.future.cancelled():
+                    queued[job.priority] += 1
+            return {
+                "workers": self.workers,
+                "running": dict(self._running),
+                "queued": queued,
+            }
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def _set_result(future: "asyncio.Future[Any]", result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: "asyncio.Future[Any]", exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,401 @@
+"""
+Parallel content search over the allowed directory.
+
+Files are discovered in the parent process (honouring .gitignore and the
+executor's path-safety rules), sharded across a process pool and scanned
+through memory maps with a literal prefilter so that files which cannot
+match are skipped without running the regex engine.
+"""
+
+import fnmatch
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# Bytes inspected to decide whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+# Longest line text returned for a single match
+MAX_LINE_LENGTH = 500
+# Directories never descended into
+ALWAYS_SKIPPED_DIRS = {".git", ".hg", ".svn"}
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+# A counted repetition such as {3}, {2,} or {,5}; any other brace is literal
+_QUANTIFIER = re.compile(r"\{\d*(?:,\d*)?\}")
+
+
+@dataclass(frozen=True)
+class SearchMatch:
+    """A single matching line."""
+
+    path: str
+    line_number: int
+    line: str
+
+    def format(self) -> str:
+        return f"{self.path}:{self.line_number}:{self.line}"
+
+
+class GitIgnore:
+    """
+    Minimal .gitignore matcher.
+
+    Supports comments, negation (``!``), directory-only patterns (trailing
+    ``/``), anchored patterns (containing ``/``) and ``**``. Rules from nested
+    .gitignore files apply relative to the directory that contains them.
+    """
+
+    def __init__(self):
+        # (base_dir_rel, regex, negated, dir_only)
+        self._rules: List[Tuple[str, "re.Pattern[str]", bool, bool]] = []
+
+    def add_file(self, gitignore_path: str, base_rel: str) -> None:
+        try:
+            with open(gitignore_path, "r", encoding="utf-8", errors="ignore") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for raw in lines:
+            line = raw.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # A slash at the start or in the middle anchors the pattern to
+            # the .gitignore's directory; a trailing one does not
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            regex = self._translate(line, anchored)
+            self._rules.append((base_rel, regex, negated, dir_only))
+
+    @staticmethod
+    def _translate(pattern: str, anchored: bool) -> "re.Pattern[str]":
+        parts = []
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**/", i):
+                parts.append("(?:.*/)?")
+                i += 3
+            elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+                parts.append("/.*")
+                i += 3
+            elif pattern[i] == "*":
+                parts.append("[^/]*")
+                i += 1
+            elif pattern[i] == "?":
+                parts.append("[^/]")
+                i += 1
+            else:
+                parts.append(re.escape(pattern[i]))
+                i += 1
+        body = "".join(parts)
+        prefix = "" if anchored else "(?:.*/)?"
+        return re.compile(f"^{prefix}{body}$")
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base_rel, regex, negated, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if base_rel:
+                if not rel_path.startswith(base_rel + "/"):
+                    continue
+                candidate = rel_path[len(base_rel) + 1 :]
+            else:
+                candidate = rel_path
+            if regex.match(candidate):
+                ignored = not negated
+        return ignored
+
+
+def iter_files(
+    root: str,
+    globs: Optional[Sequence[str]] = None,
+    respect_gitignore: bool = True,
+    is_path_safe: Optional[Callable[[str], bool]] = None,
+) -> Iterator[str]:
+    """
+    Walks ``root`` yielding regular file paths eligible for searching.
+
+    Args:
+        root (str): Directory to walk.
+        globs (Sequence[str], optional): fnmatch patterns matched against the
+            path relative to ``root`` or the basename. Patterns starting with
+            ``!`` exclude files.
+        respect_gitignore (bool): Skip files ignored by .gitignore rules.
+        is_path_safe (Callable, optional): Predicate applied to the resolved
+            target of symlinked files; unsafe targets are skipped.
+    """
+    include = [g for g in (globs or []) if not g.startswith("!")]
+    exclude = [g[1:] for g in (globs or []) if g.startswith("!")]
+    gitignore = GitIgnore() if respect_gitignore else None
+
+    def glob_match(rel: str, patterns: List[str]) -> bool:
+        name = os.path.basename(rel)
+        return any(
+            fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(name, p) for p in patterns
+        )
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        rel_dir = "" if rel_dir == "." else rel_dir.replace(os.sep, "/")
+
+        if gitignore is not None and ".gitignore" in filenames:
+            gitignore.add_file(os.path.join(dirpath, ".gitignore"), rel_dir)
+
+        kept = []
+        for d in dirnames:
+            if d in ALWAYS_SKIPPED_DIRS:
+                continue
+            rel = f"{rel_dir}/{d}" if rel_dir else d
+            if gitignore is not None and gitignore.is_ignored(rel, True):
+                continue
+            kept.append(d)
+        dirnames[:] = sorted(kept)
+
+        for name in sorted(filenames):
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if gitignore is not None and gitignore.is_ignored(rel, False):
+                continue
+            if include and not glob_match(rel, include):
+                continue
+            if exclude and glob_match(rel, exclude):
+                continue
+            full = os.path.join(dirpath, name)
+            if os.path.islink(full):
+                if is_path_safe is not None and not is_path_safe(full):
+                    continue
+                if not os.path.isfile(full):
+                    continue
+            yield full
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """
+    Returns the longest literal substring every match of ``pattern`` must
+    contain, or None when no safe prefilter can be derived.
+    """
+    if not any(c in _REGEX_META for c in pattern):
+        return pattern
+
+    if "(?" in pattern:
+        # Inline flags or lookarounds can change what a literal means
+        return None
+
+    runs: List[str] = []
+    current: List[str] = []
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        literal = None
+        if c == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            literal = None if nxt.isalnum() else nxt
+            i += 2
+        elif c == "[":
+            # Skip the whole character class
+            close = pattern.find("]", i + 2)
+            i = len(pattern) if close == -1 else close + 1
+        elif c == "{" and (counts := _QUANTIFIER.match(pattern, i)):
+            # Skip the repetition counts, which are not part of the text
+            i = counts.end()
+        elif c == "(":
+            depth += 1
+            i += 1
+        elif c == ")":
+            depth -= 1
+            i += 1
+        elif c == "|":
+            # Alternation makes any single literal optional
+            return None
+        elif c in _REGEX_META:
+            i += 1
+        else:
+            literal = c
+            i += 1
+
+        quantified = i < len(pattern) and pattern[i] in "?*{"
+        if literal is not None and depth == 0 and not quantified:
+            current.append(literal)
+        else:
+            if current:
+                runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+
+    best = max(runs, key=len, default="")
+    return best if len(best) >= 2 else None
+
+
+def _is_binary(mm: mmap.mmap) -> bool:
+    return mm.find(b"\0", 0, BINARY_SNIFF_BYTES) != -1
+
+
+def _scan_files(
+    paths: Sequence[str],
+    root: str,
+    pattern: bytes,
+    is_literal: bool,
+    ignore_case: bool,
+    prefilter: Optional[bytes],
+    max_results: int,
+) -> List[SearchMatch]:
+    """
+    Scans a shard of files. Runs inside pool workers, so it only touches
+    picklable arguments and module-level helpers.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = None
+    if not is_literal or ignore_case:
+        regex = re.compile(re.escape(pattern) if is_literal else pattern, flags)
+
+    results: List[SearchMatch] = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if _is_binary(mm):
+                        continue
+                    if prefilter is not None and mm.find(prefilter) == -1:
+                        continue
+                    rel = os.path.relpath(path, root)
+                    for lineno, line in _iter_matching_lines(mm, pattern, regex):
+                        text = line.decode("utf-8", errors="replace")
+                        results.append(
+                            SearchMatch(rel, lineno, text[:MAX_LINE_LENGTH])
+                        )
+                        if len(results) >= max_results:
+                            return results
+        except (OSError, ValueError):
+            # Unreadable, vanished or unmappable files are skipped
+            continue
+    return results
+
+
+def _iter_matching_lines(
+    mm: mmap.mmap, needle: bytes, regex: Optional["re.Pattern[bytes]"]
+) -> Iterator[Tuple[int, bytes]]:
+    """Yields (line_number, line) once per matching line."""
+    lineno = 1
+    counted_to = 0
+    pos = 0
+    size = len(mm)
+    while pos <= size:
+        if regex is None:
+            start = mm.find(needle, pos)
+            if start == -1:
+                return
+            end = start + len(needle)
+        else:
+            m = regex.search(mm, pos)
+            if m is None:
+                return
+            start, end = m.span()
+
+        line_start = mm.rfind(b"\n", 0, start) + 1
+        line_end = mm.find(b"\n", max(start, end - 1))
+        if line_end == -1:
+            line_end = size
+        lineno += mm[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+        yield lineno, mm[line_start:line_end].rstrip(b"\r")
+        pos = line_end + 1
+
+
+class ContentSearcher:
+    """
+    Searches file contents across a process pool.
+
+    The pool is created lazily on first use and reused for later queries, so
+    only the first parallel search pays the worker start-up cost.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_parallel_files: int = 64):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_parallel_files = min_parallel_files
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(method),
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def search(
+        self,
+        root: str,
+        pattern: str,
+        *,
+        literal: bool = False,
+        ignore_case: bool = False,
+        globs: Optional[Sequence[str]] = None,
+        max_results: int = 200,
+        respect_gitignore: bool = True,
+        is_path_safe: Optional[Callable[[str], bool]] = None,
+    ) -> Iterator[SearchMatch]:
+        """
+        Yields matches as shards complete, stopping after ``max_results``.
+
+        Raises:
+            re.error: If ``pattern`` is not a valid regular expression.
+        """
+        encoded = pattern.encode("utf-8")
+        if not literal:
+            re.compile(encoded)
+        if not encoded:
+            return
+
+        prefilter: Optional[bytes] = None
+        if not ignore_case:
+            literal_part = pattern if literal else required_literal(pattern)
+            if literal_part:
+                prefilter = literal_part.encode("utf-8")
+
+        files = list(iter_files(root, globs, respect_gitignore, is_path_safe))
+        args = (root, encoded, literal, ignore_case, prefilter, max_results)
+
+        if len(files) < self.min_parallel_files or self.workers <= 1:
+            yield from _scan_files(files, *args)[:max_results]
+            return
+
+        shard_size = max(16, -(-len(files) // (self.workers * 4)))
+        pool = self._get_pool()
+        pending = {
+            pool.submit(_scan_files, files[i : i + shard_size], *args)
+            for i in range(0, len(files), shard_size)
+        }
+        emitted = 0
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for match in future.result():
+                        yield match
+                        emitted += 1
+                        if emitted >= max_results:
+                            return
+        finally:
+            for future in pending:
+                future.cancel()
@@ -4,15 +4,52 @@ import re
 import shlex
 import subprocess
 import asyncio
+import contextvars
+import json
 import sys
+import time
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Sequence, Set
 
 import mcp.server.stdio
 import mcp.types as types
 from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
 
+from .audit import AuditLogger
+from .cancellation import CancelToken, CommandCancelled, InFlightCalls, terminate_process_group
+from .coalesce import SingleFlight
+from .interactive import (
+    DEFAULT_COLS,
+    DEFAULT_ROWS,
+    READ_CHUNK_SIZE,
+    PtySessionConfig,
+    PtySessionManager,
+    SessionError,
+)
+from .loopwatch import LoopWatchdog
+from .memory import GROUP_BY, MemoryDiagnostics
+from .policy import PolicyStore, install_sighup_handler
+from .profiler import Profiler, ProfilerBusyError, parse_seconds
+from .ratelimit import AdmissionConfig, AdmissionController, AdmissionDecision
+from .recording import TrafficRecorder
+from .rules import SHELL_OPERATORS, CompiledRules, compile_rules
+from .rusage import ResourceStats, ResourceUsage, command_name, run_with_rusage
+from .scheduler import (
+    DEFAULT_PRIORITY,
+    PRIORITY_CLASSES,
+    CommandScheduler,
+    classify_command,
+    load_priority_rules,
+    priority_prefix,
+)
+from .search import ContentSearcher
+from .sessions import SessionConfig, SessionRegistry
+from .tenants import DEFAULT_TENANT, Tenant, TenantRegistry
+from .terminal import OUTPUT_MODES, TerminalNormalizer, normalize_output
+from .transport import CompressionConfig, TransportMetrics
+from .workers import NoWorkerError, WorkerPool
+
 server = Server("cli_use")
 
 
@@ -40,27 +77,44 @@ class CommandTimeoutError(CommandError):
     pass
 
 
-@dataclass
+class CommandCancelledError(CommandError):
+    """Command cancelled by the client or a closed connection"""
+
+    pass
+
+
+@dataclass(frozen=True)
 class SecurityConfig:
     """
-    Security configuration for command execution
+    Security configuration for command execution.
+
+    Instances are immutable; a policy reload builds a new instance with a
+    higher version and swaps it into the executor.
     """
 
-    allowed_commands: set[str]
-    allowed_flags: set[str]
+    allowed_commands: frozenset[str]
+    allowed_flags: frozenset[str]
     max_command_length: int
     command_timeout: int
     allow_all_commands: bool = False
     allow_all_flags: bool = False
     allow_shell_operators: bool = False
+    version: int = 0
+    rules: Optional[CompiledRules] = None
 
 
 class CommandExecutor:
-    def __init__(self, allowed_dir: str, security_config: SecurityConfig):
+    def __init__(
+        self,
+        allowed_dir: str,
+        security_config: SecurityConfig,
+        worker_pool: Optional[WorkerPool] = None,
+    ):
         if not allowed_dir or not os.path.exists(allowed_dir):
             raise ValueError("Valid ALLOWED_DIR is required")
         self.allowed_dir = os.path.abspath(os.path.realpath(allowed_dir))
         self.security_config = security_config
+        self.worker_pool = worker_pool
         self.shell_path = self._detect_shell()
     
     def _detect_shell(self) -> str:
@@ -99,7 +153,9 @@ class CommandExecutor:
         except Exception as e:
             raise CommandSecurityError(f"Invalid path '{path}': {str(e)}")
 
-    def validate_command(self, command_string: str) -> tuple[str, List[str]]:
+    def validate_command(
+        self, command_string: str, config: Optional[SecurityConfig] = None
+    ) -> tuple[str, List[str]]:
         """
         Validates and parses a command string for security and formatting.
 
@@ -112,6 +168,8 @@ class CommandExecutor:
 
         Args:
             command_string (str): The command string to validate and parse.
+            config (SecurityConfig, optional): Policy to validate against. Defaults to the
+                executor's current policy.
 
         Returns:
             tuple[str, List[str]]: A tuple containing:
@@ -121,9 +179,9 @@ class CommandExecutor:
         Raises:
             CommandSecurityError: If any part of the command fails security validation.
         """
+        config = config or self.security_config
 
-        # Define shell operators
-        shell_operators = ["&&", "||", "|", ">", ">>", "<", "<<", ";"]
+        shell_operators = SHELL_OPERATORS
 
         # Check if command contains shell operators
         contains_shell_operator = any(
@@ -132,7 +190,7 @@ class CommandExecutor:
 
         if contains_shell_operator:
             # Check if shell operators are allowed
-            if not self.security_config.allow_shell_operators:
+            if not config.allow_shell_operators:
                 # If shell operators are not allowed, raise an error
                 for operator in shell_operators:
                     if operator in command_string:
@@ -142,11 +200,15 @@ class CommandExecutor:
 
             # Split the command by shell operators and validate each part
             return self._validate_command_with_operators(
-                command_string, shell_operators
+                command_string, shell_operators, config
             )
 
         # Process single command without shell operators
-        return self._validate_single_command(command_string)
+        return self._validate_single_command(command_string, config)
+
+    def _relative_path(self, path: str) -> str:
+        """A normalized path relative to the allowed directory, with / separators."""
+        return os.path.relpath(path, self.allowed_dir).replace(os.sep, "/")
 
     def _is_url_path(self, path: str) -> bool:
         """
@@ -182,17 +244,20 @@ class CommandExecutor:
             real_path = os.path.abspath(os.path.realpath(path))
             allowed_dir_real = os.path.abspath(os.path.realpath(self.allowed_dir))
 
-            # Check if the path starts with allowed_dir
-            return real_path.startswith(allowed_dir_real)
+            # Compare whole path components, so /srv/actor1 does not admit /srv/actor10
+            return os.path.commonpath([real_path, allowed_dir_real]) == allowed_dir_real
         except Exception:
             return False
 
-    def _validate_single_command(self, command_string: str) -> tuple[str, List[str]]:
+    def _validate_single_command(
+        self, command_string: str, config: Optional[SecurityConfig] = None
+    ) -> tuple[str, List[str]]:
         """
         Validates a single command without shell operators.
 
         Args:
             command_string (str): The command string to validate.
+            config (SecurityConfig, optional): Policy to validate against.
 
         Returns:
             tuple[str, List[str]]: A tuple containing the command and validated arguments.
@@ -200,6 +265,7 @@ class CommandExecutor:
         Raises:
             CommandSecurityError: If the command fails validation.
         """
+        config = config or self.security_config
         try:
             parts = shlex.split(command_string)
             if not parts:
@@ -207,10 +273,16 @@ class CommandExecutor:
 
             command, args = parts[0], parts[1:]
 
+            # Rules from the policy file take precedence over the flat allow-lists
+            rule = config.rules.match(command) if config.rules is not None else None
+            if rule is not None and not rule.allow:
+                raise CommandSecurityError(f"Command '{command}' is denied by policy")
+
             # Validate command if not in allow-all mode
             if (
-                not self.security_config.allow_all_commands
-                and command not in self.security_config.allowed_commands
+                rule is None
+                and not config.allow_all_commands
+                and command not in config.allowed_commands
             ):
                 raise CommandSecurityError(f"Command '{command}' is not allowed")
 
@@ -218,23 +290,36 @@ class CommandExecutor:
             validated_args = []
             for arg in args:
                 if arg.startswith("-"):
-                    if (
-                        not self.security_config.allow_all_flags
-                        and arg not in self.security_config.allowed_flags
-                    ):
-                        raise CommandSecurityError(f"Flag '{arg}' is not allowed")
+                    flag_allowed = rule.flag_allowed(arg) if rule is not None else None
+                    if flag_allowed is None:
+                        flag_allowed = config.allow_all_flags or arg in config.allowed_flags
+                    if not flag_allowed:
+                        raise CommandSecurityError(
+                            f"Flag '{arg}' is not allowed"
+                            + (f" for '{command}'" if rule is not None else "")
+                        )
                     validated_args.append(arg)
                     continue
 
-                # For any path-like argument, validate it
-                if "/" in arg or "\\" in arg or os.path.isabs(arg) or arg == ".":
-                    if self._is_url_path(arg):
-                        # If it's a URL, we don't need to normalize it
-                        validated_args.append(arg)
-                        continue
+                if self._is_url_path(arg):
+                    # If it's a URL, we don't need to normalize it
+                    validated_args.append(arg)
+                    continue
 
+                # A rule restricting paths applies to every operand: a bare
+                # file name is as much a path as ./name
+                path_like = "/" in arg or "\\" in arg or os.path.isabs(arg) or arg == "."
+                path_restricted = rule is not None and rule.paths is not None
+                if path_like or path_restricted:
                     normalized_path = self._normalize_path(arg)
-                    validated_args.append(normalized_path)
+                    if rule is not None and not rule.path_allowed(
+                        self._relative_path(normalized_path)
+                    ):
+                        raise CommandSecurityError(
+                            f"Path '{arg}' is not allowed for '{command}'"
+                        )
+                    # Bare names are passed as given; they resolve in the working directory
+                    validated_args.append(normalized_path if path_like else arg)
                 else:
                     # For non-path arguments, add them as-is
                     validated_args.append(arg)
@@ -245,7 +330,10 @@ class CommandExecutor:
             raise CommandSecurityError(f"Invalid command format: {str(e)}")
 
     def _validate_command_with_operators(
-        self, command_string: str, shell_operators: List[str]
+        self,
+        command_string: str,
+        shell_operators: Sequence[str],
+        config: Optional[SecurityConfig] = None,
     ) -> tuple[str, List[str]]:
         """
         Validates a command string that contains shell operators.
@@ -255,7 +343,8 @@ class CommandExecutor:
 
         Args:
             command_string (str): The command string containing shell operators.
-            shell_operators (List[str]): List of shell operators to split by.
+            shell_operators (Sequence[str]): Shell operators to split by.
+            config (SecurityConfig, optional): Policy to validate against.
 
         Returns:
             tuple[str, List[str]]: A tuple containing the command and empty args list
@@ -296,7 +385,7 @@ class CommandExecutor:
         for cmd in commands:
             try:
                 # Use the extracted validation method for each command
-                self._validate_single_command(cmd)
+                self._validate_single_command(cmd, config)
             except CommandSecurityError as e:
                 raise CommandSecurityError(f"Invalid command part '{cmd}': {str(e)}")
             except ValueError as e:
@@ -308,11 +397,61 @@ class CommandExecutor:
         # Return the original command string to be executed with shell=True
         return command_string, []
 
-    def _execute_with_pty(self, command_string: str) -> subprocess.CompletedProcess:
+    def shell_command(self, command_string: str, config: SecurityConfig) -> str:
+        """
+        Validates a command string against ``config``.
+
+        Returns:
+            str: The command text to run with ``shell -c``: the original string
+                when it uses shell operators, the re-quoted command otherwise.
+
+        Raises:
+            CommandSecurityError: If the command is too long, not allowed, or uses
+                shell operators while they are disabled.
+        """
+        if len(command_string) > config.max_command_length:
+            raise CommandSecurityError(
+                f"Command exceeds maximum length of {config.max_command_length}"
+            )
+
+        command, args = self.validate_command(command_string, config)
+
+        # Check if this is a command with shell operators
+        shell_operators = SHELL_OPERATORS
+        use_shell = any(operator in command_string for operator in shell_operators)
+
+        # Double-check that shell operators are allowed if they are present
+        if use_shell and not config.allow_shell_operators:
+            for operator in shell_operators:
+                if operator in command_string:
+                    raise CommandSecurityError(
+                        f"Shell operator '{operator}' is not supported. Set ALLOW_SHELL_OPERATORS=true to enable."
+                    )
+        return command if use_shell else shlex.join([command] + args)
+
+    def shell_args(self, shell_command: str) -> List[str]:
+        """The argv running ``shell_command`` through the detected shell."""
+        if "zsh" in self.shell_path:
+            return [self.shell_path, "-l", "-c", shell_command]
+        return [self.shell_path, "-c", shell_command]
+
+    def _execute_with_pty(
+        self,
+        command_string: str,
+        priority: str = DEFAULT_PRIORITY,
+        config: Optional[SecurityConfig] = None,
+        output_mode: str = "rendered",
+        cancel: Optional[CancelToken] = None,
+    ) -> subprocess.CompletedProcess:
         """
         Execute command using PTY for better terminal compatibility.
+
+        Output is normalized as it is read (see terminal.TerminalNormalizer),
+        so progress redraws never accumulate in memory. The command runs in
+        its own session; on timeout or cancellation its process group is
+        stopped.
         """
-        import signal
+        config = config or self.security_config
         import time
         import select
         
@@ -322,6 +461,9 @@ class CommandExecutor:
                 self.stdout = ""
                 self.stderr = ""
                 self.returncode = 0
+                self.rusage = None
+                self.stdout_bytes = 0
+                self.stderr_bytes = 0
         
         result = PTYResult()
         shell_path = self.shell_path  # Store shell path for child process
@@ -334,6 +476,7 @@ class CommandExecutor:
             pid = os.fork()
             if pid == 0:  # Child process
                 os.close(master)
+                os.setsid()
                 os.dup2(slave, 0)  # stdin
                 os.dup2(slave, 1)  # stdout
                 os.dup2(slave, 2)  # stderr
@@ -346,7 +489,8 @@ class CommandExecutor:
                 shell_args = [shell_path, "-c", command_string]
                 if "zsh" in shell_path:
                     shell_args = [shell_path, "-l", "-c", command_string]
-                os.execve(shell_path, shell_args, os.environ)
+                shell_args = priority_prefix(priority) + shell_args
+                os.execve(shell_args[0], shell_args, os.environ)
             else:  # Parent process
                 os.close(slave)
                 
@@ -355,57 +499,71 @@ class CommandExecutor:
                 flags = fcntl.fcntl(master, fcntl.F_GETFL)
                 fcntl.fcntl(master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
                 
-                output = ""
+                normalizer = TerminalNormalizer(output_mode)
+                output = []
                 start_time = time.time()
                 
                 while True:
                     # Check if process is still running
                     try:
-                        pid_result = os.waitpid(pid, os.WNOHANG)
-                        if pid_result[0] != 0:  # Process has exited
-                            result.returncode = pid_result[1]
+                        exited, status, usage = os.wait4(pid, os.WNOHANG)
+                        if exited != 0:  # Process has exited
+                            result.returncode = os.waitstatus_to_exitcode(status)
+                            result.rusage = ResourceUsage.from_rusage(usage)
                             break
                     except OSError:
                         break
                     
-                    # Check for timeout
-                    if time.time() - start_time > self.security_config.command_timeout:
-                        os.kill(pid, signal.SIGTERM)
-                        time.sleep(0.1)
-                        try:
-                            os.kill(pid, signal.SIGKILL)
-                        except:
-                            pass
-                        raise CommandTimeoutError(f"Command timed out after {self.security_config.command_timeout} seconds")
+                    # Check for timeout or cancellation
+                    timed_out = time.time() - start_time > config.command_timeout
+                    if timed_out or (cancel is not None and cancel.cancelled):
+                        terminate_process_group(pid, KILL_GRACE_PERIOD, reap=lambda: _reap_nowait(pid))
+                        _reap_nowait(pid, block=True)
+                        os.close(master)
+                        if timed_out:
+                            raise CommandTimeoutError(f"Command timed out after {config.command_timeout} seconds")
+                        raise CommandCancelledError(f"Command {cancel.reason}")
                     
                     # Read available data
                     try:
                         ready, _, _ = select.select([master], [], [], 0.1)
                         if ready:
-                            data = os.read(master, 1024).decode('utf-8', errors='ignore')
-                            output += data
+                            data = os.read(master, 65536)
+                            result.stdout_bytes += len(data)
+                            output.append(normalizer.feed(data))
                     except OSError:
                         break
                 
                 # Read any remaining data
                 try:
                     while True:
-                        data = os.read(master, 1024).decode('utf-8', errors='ignore')
+                        data = os.read(master, 65536)
                         if not data:
                             break
-                        output += data
+                        result.stdout_bytes += len(data)
+                        output.append(normalizer.feed(data))
                 except OSError:
                     pass
                 
                 os.close(master)
-                result.stdout = output
+                output.append(normalizer.close())
+                result.stdout = "".join(output)
                 
+        except CommandError:
+            raise
         except Exception as e:
             raise CommandExecutionError(f"PTY execution failed: {str(e)}")
         
         return result
 
-    def execute(self, command_string: str) -> subprocess.CompletedProcess:
+    def execute(
+        self,
+        command_string: str,
+        priority: str = DEFAULT_PRIORITY,
+        labels: Optional[List[str]] = None,
+        output_mode: Optional[str] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> subprocess.CompletedProcess:
         """
         Executes a command string in a secure, controlled environment.
 
@@ -414,93 +572,162 @@ class CommandExecutor:
 
         Args:
             command_string (str): The command string to execute.
+            priority (str): Priority class whose nice/ionice levels are applied to the child.
+            labels (List[str], optional): Run on a remote worker carrying all of these labels.
+            output_mode (str, optional): Output normalization, one of terminal.OUTPUT_MODES.
+                Defaults to PTY_OUTPUT_MODE for commands run in a PTY and raw otherwise.
+            cancel (CancelToken, optional): When set, the command's process group is
+                stopped (SIGTERM, then SIGKILL after KILL_GRACE_PERIOD).
 
         Returns:
             subprocess.CompletedProcess: The result of the command execution containing
-                stdout, stderr, and return code.
+                stdout, stderr, and return code, plus the child tree's ResourceUsage as
+                ``rusage`` (None if unavailable).
 
         Raises:
             CommandSecurityError: If the command:
                 - Exceeds maximum length
                 - Fails security validation
                 - Fails during execution
+            CommandTimeoutError: If the command exceeds the command timeout.
+            CommandCancelledError: If ``cancel`` is set before the command exits.
 
         Notes:
             - Uses shell=True for commands with shell operators, shell=False otherwise
             - Uses timeout and working directory constraints
             - Captures both stdout and stderr
+            - The policy is read once, so a concurrent reload does not affect this command
+            - Validated commands may be dispatched to a remote worker (see WorkerPool),
+              which runs them in ``allowed_dir``
         """
-        if len(command_string) > self.security_config.max_command_length:
-            raise CommandSecurityError(
-                f"Command exceeds maximum length of {self.security_config.max_command_length}"
-            )
-
+        config = self.security_config
         try:
-            command, args = self.validate_command(command_string)
-
-            # Check if this is a command with shell operators
-            shell_operators = ["&&", "||", "|", ">", ">>", "<", "<<", ";"]
-            use_shell = any(operator in command_string for operator in shell_operators)
+            shell_command = self.shell_command(command_string, config)
 
-            # Double-check that shell operators are allowed if they are present
-            if use_shell and not self.security_config.allow_shell_operators:
-                for operator in shell_operators:
-                    if operator in command_string:
-                        raise CommandSecurityError(
-                            f"Shell operator '{operator}' is not supported. Set ALLOW_SHELL_OPERATORS=true to enable."
-                        )
+            if self.worker_pool is not None and self.worker_pool.should_dispatch(
+                priority, labels
+            ):
+                try:
+                    result = self.worker_pool.run(
+                        shell_command,
+                        priority=priority,
+                        timeout=config.command_timeout,
+                        labels=labels,
+                        cancel=cancel,
+                        cwd=self.allowed_dir,
+                    )
+                    return _normalize_result(result, output_mode)
+                except NoWorkerError:
+                    # The last worker left after should_dispatch(); nothing was
+                    # sent, so unlabelled commands can still run here
+                    if labels:
+                        raise
 
             # Try PTY for claude commands to get better terminal environment
             if "claude" in command_string:
-                return self._execute_with_pty(command_string)
-            
-            if use_shell:
-                # For commands with shell operators, execute through detected shell
-                shell_args = [self.shell_path, "-c", command]
-                if "zsh" in self.shell_path:
-                    shell_args = [self.shell_path, "-l", "-c", command]
-                return subprocess.run(
-                    shell_args,
-                    shell=False,
-                    text=True,
-                    capture_output=True,
-                    timeout=self.security_config.command_timeout,
-                    cwd=self.allowed_dir,
-                    env=os.environ,
-                )
-            else:
-                # For regular commands, execute through detected shell
-                full_command = shlex.join([command] + args)
-                shell_args = [self.shell_path, "-c", full_command]
-                if "zsh" in self.shell_path:
-                    shell_args = [self.shell_path, "-l", "-c", full_command]
-                return subprocess.run(
-                    shell_args,
-                    shell=False,
-                    text=True,
-                    capture_output=True,
-                    timeout=self.security_config.command_timeout,
-                    cwd=self.allowed_dir,
-                    env=os.environ,
+                return self._execute_with_pty(
+                    command_string, priority, config, output_mode or PTY_OUTPUT_MODE, cancel
                 )
+
+            # Execute through detected shell
+            result = run_with_rusage(
+                priority_prefix(priority) + self.shell_args(shell_command),
+                timeout=config.command_timeout,
+                cancel=cancel,
+                grace=KILL_GRACE_PERIOD,
+                cwd=self.allowed_dir,
+                env=os.environ,
+            )
+            return _normalize_result(result, output_mode)
         except subprocess.TimeoutExpired:
             raise CommandTimeoutError(
-                f"Command timed out after {self.security_config.command_timeout} seconds"
+                f"Command timed out after {config.command_timeout} seconds"
             )
+        except CommandCancelled as e:
+            raise CommandCancelledError(str(e))
         except CommandError:
             raise
         except Exception as e:
             raise CommandExecutionError(f"Command execution failed: {str(e)}")
 
 
+def _reap_nowait(pid: int, block: bool = False) -> None:
+    """Reaps a forked child if it has exited (or waits for it with ``block``)."""
+    try:
+        os.waitpid(pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        pass
+
+
+def _normalize_result(
+    result: subprocess.CompletedProcess, output_mode: Optional[str]
+) -> subprocess.CompletedProcess:
+    """Applies an explicitly requested output mode to captured pipe output."""
+    if output_mode and output_mode != "raw":
+        result.stdout = normalize_output(result.stdout or "", output_mode)
+        result.stderr = normalize_output(result.stderr or "", output_mode)
+    return result
+
+
+def _parse_allow_list(value: Any) -> tuple[bool, frozenset[str]]:
+    """
+    Parses an allow-list given as 'all', a comma-separated string or a list.
+
+    Returns:
+        tuple[bool, frozenset[str]]: Whether everything is allowed, and the allowed entries.
+    """
+    if isinstance(value, str):
+        if value.strip().lower() == "all":
+            return True, frozenset()
+        value = value.split(",")
+    return False, frozenset(str(item) for item in value)
+
+
+def _load_policy_file(path: str) -> Dict[str, Any]:
+    """
+    Reads a JSON policy file.
+
+    Raises:
+        ValueError: If the file is not a JSON object or contains unknown keys.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"Policy file {path} must contain a JSON object")
+    unknown = set(data) - POLICY_FILE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown policy keys in {path}: {', '.join(sorted(unknown))}")
+    return data
+
+
+# Keys accepted in a POLICY_FILE
+POLICY_FILE_KEYS = {
+    "rules",
+    "allowed_commands",
+    "allowed_flags",
+    "max_command_length",
+    "command_timeout",
+    "allow_shell_operators",
+}
+
+
 # Load security configuration from environment
-def load_security_config() -> SecurityConfig:
+def load_security_config(
+    policy_file: Optional[str] = None, version: int = 0
+) -> SecurityConfig:
     """
     Loads security configuration from environment variables with default fallbacks.
 
     Creates a SecurityConfig instance using environment variables to configure allowed
     commands, flags, patterns, and execution constraints. Uses predefined defaults if
-    environment variables are not set.
+    environment variables are not set. Values from a JSON policy file, when given,
+    take precedence over the environment.
+
+    Args:
+        policy_file (str, optional): Path of a JSON policy file with any of the keys
+            allowed_commands, allowed_flags, max_command_length, command_timeout,
+            allow_shell_operators and rules (see cli_use.rules.compile_rules).
+        version (int): Version number stamped on the resulting policy.
 
     Returns:
         SecurityConfig: Configuration object containing:
@@ -519,54 +746,363 @@ def load_security_config() -> SecurityConfig:
         COMMAND_TIMEOUT: Command timeout in seconds (default: 30)
         ALLOW_SHELL_OPERATORS: Whether to allow shell operators like &&, ||, |, >, etc. (default: false)
                               Set to "true" or "1" to enable, any other value to disable.
-    """
-    allowed_commands = os.getenv("ALLOWED_COMMANDS", "ls,cat,pwd")
-    allowed_flags = os.getenv("ALLOWED_FLAGS", "-l,-a,--help")
-    allow_shell_operators_env = os.getenv("ALLOW_SHELL_OPERATORS", "false")
 
-    allow_all_commands = allowed_commands.lower() == "all"
-    allow_all_flags = allowed_flags.lower() == "all"
-    allow_shell_operators = allow_shell_operators_env.lower() in ("true", "1")
+    Raises:
+        OSError, ValueError: If the policy file cannot be read or is invalid.
+    """
+    settings: Dict[str, Any] = {
+        "allowed_commands": os.getenv("ALLOWED_COMMANDS", "ls,cat,pwd"),
+        "allowed_flags": os.getenv("ALLOWED_FLAGS", "-l,-a,--help"),
+        "max_command_length": os.getenv("MAX_COMMAND_LENGTH", "1024"),
+        "command_timeout": os.getenv("COMMAND_TIMEOUT", "30"),
+        "allow_shell_operators": os.getenv("ALLOW_SHELL_OPERATORS", "false"),
+    }
+    if policy_file:
+        settings.update(_load_policy_file(policy_file))
+
+    allow_all_commands, allowed_commands = _parse_allow_list(settings["allowed_commands"])
+    allow_all_flags, allowed_flags = _parse_allow_list(settings["allowed_flags"])
+    allow_shell_operators = settings["allow_shell_operators"]
+    if isinstance(allow_shell_operators, str):
+        allow_shell_operators = allow_shell_operators.lower() in ("true", "1")
 
     return SecurityConfig(
-        allowed_commands=(
-            set() if allow_all_commands else set(allowed_commands.split(","))
-        ),
-        allowed_flags=set() if allow_all_flags else set(allowed_flags.split(",")),
-        max_command_length=int(os.getenv("MAX_COMMAND_LENGTH", "1024")),
-        command_timeout=int(os.getenv("COMMAND_TIMEOUT", "30")),
+        allowed_commands=allowed_commands,
+        allowed_flags=allowed_flags,
+        max_command_length=int(settings["max_command_length"]),
+        command_timeout=int(settings["command_timeout"]),
         allow_all_commands=allow_all_commands,
         allow_all_flags=allow_all_flags,
-        allow_shell_operators=allow_shell_operators,
+        allow_shell_operators=bool(allow_shell_operators),
+        version=version,
+        rules=compile_rules(settings["rules"]) if settings.get("rules") else None,
+    )
+
+
+def create_tenant(
+    name: str, allowed_dir: str, policy_file: Optional[str] = None
+) -> Tenant:
+    """
+    Builds a tenant: an executor bound to ``allowed_dir`` with its own
+    hot-reloadable policy store.
+
+    Raises:
+        ValueError: If ``allowed_dir`` is not a valid directory.
+        OSError, ValueError: If the policy file cannot be loaded.
+    """
+    store = PolicyStore(
+        lambda version: load_security_config(policy_file, version), path=policy_file
+    )
+    tenant_executor = CommandExecutor(
+        allowed_dir=allowed_dir, security_config=store.current, worker_pool=workers
+    )
+    store.subscribe(lambda config: setattr(tenant_executor, "security_config", config))
+    return Tenant(name, tenant_executor, store)
+
+
+workers = WorkerPool.from_env()
+
+default_tenant = create_tenant(
+    DEFAULT_TENANT, os.getenv("ALLOWED_DIR", ""), os.getenv("POLICY_FILE") or None
+)
+executor = default_tenant.executor
+policy_store = default_tenant.policy_store
+
+tenants = TenantRegistry(default_tenant, create_tenant)
+if os.getenv("TENANTS_FILE"):
+    tenants.load_file(os.environ["TENANTS_FILE"])
+
+
+def current_tenant() -> Tenant:
+    """The tenant serving the current request (the default tenant outside a session)."""
+    return tenants.current()
+
+
+def start_worker_pool() -> None:
+    """
+    Starts accepting remote worker agents when WORKER_LISTEN is set.
+
+    Environment Variables:
+        WORKER_LISTEN: Worker socket address, unix:/path or tcp:host:port (default: none)
+    """
+    address = os.getenv("WORKER_LISTEN")
+    if address and workers.address is None:
+        workers.listen(address)
+
+
+def start_policy_reloading() -> None:
+    """
+    Enables hot reload of every tenant's security policy: watches policy files
+    for changes and reloads on SIGHUP. Must be called from within the running
+    event loop.
+
+    Environment Variables:
+        POLICY_FILE: JSON policy file overriding the environment settings (default: none)
+        POLICY_WATCH_INTERVAL: Seconds between policy file checks (default: 2)
+        TENANTS_FILE: JSON file declaring additional tenants (default: none)
+    """
+    interval = float(os.getenv("POLICY_WATCH_INTERVAL", "2"))
+    for tenant in tenants:
+        tenant.policy_store.start_watching(interval)
+    install_sighup_handler(lambda: [tenant.policy_store for tenant in tenants])
+
+admission = AdmissionController(AdmissionConfig.from_env())
+
+audit = AuditLogger.from_env()
+
+scheduler = CommandScheduler(workers=int(os.getenv("MAX_WORKERS", "4")))
+priority_rules = load_priority_rules()
+
+searcher = ContentSearcher(workers=int(os.getenv("SEARCH_WORKERS", "0")) or None)
+
+coalescer = SingleFlight.from_env()
+
+memory_diagnostics = MemoryDiagnostics.from_env()
+memory_diagnostics.register_gauge(
+    "jobs",
+    lambda: sum(scheduler.snapshot()["running"].values())
+    + sum(scheduler.snapshot()["queued"].values()),
+)
+memory_diagnostics.register_gauge(
+    "remote_jobs", lambda: sum(w["running"] for w in workers.snapshot()["workers"].values())
+)
+memory_diagnostics.register_gauge("buffered_output_bytes", workers.buffered_bytes)
+
+profiler = Profiler.from_env()
+
+loop_watchdog = LoopWatchdog.from_env()
+
+recorder = TrafficRecorder.from_env()
+
+compression = CompressionConfig.from_env()
+transport_metrics = TransportMetrics()
+
+
+def start_services() -> None:
+    """
+    Starts the background services of a serving process: policy reloading,
+    the remote worker listener, memory tracing and the event-loop lag
+    watchdog. Must be called from within the running event loop.
+    """
+    memory_diagnostics.start()
+    loop_watchdog.start()
+    start_policy_reloading()
+    start_worker_pool()
+
+
+def stop_services() -> None:
+    """
+    Releases what must not be left to process exit: the traffic recording
+    is flushed and closed, which also writes the gzip trailer of a ``.gz``
+    recording.
+    """
+    recorder.close()
+
+# Upper bound for the search tool's max_results argument
+MAX_SEARCH_RESULTS = 5000
+
+# Normalization of output captured from a PTY (claude commands)
+PTY_OUTPUT_MODE = os.getenv("PTY_OUTPUT_MODE", "rendered")
+if PTY_OUTPUT_MODE not in OUTPUT_MODES:
+    raise ValueError(
+        f"Invalid PTY_OUTPUT_MODE '{PTY_OUTPUT_MODE}'. Use one of: {', '.join(OUTPUT_MODES)}"
     )
 
+# Append each command's resource usage to run_command results by default
+RESOURCE_USAGE_TRAILER = os.getenv("RESOURCE_USAGE_TRAILER", "false").lower() == "true"
+
+resource_stats = ResourceStats()
+
+# Seconds a cancelled or timed-out command gets between SIGTERM and SIGKILL
+KILL_GRACE_PERIOD = float(os.getenv("KILL_GRACE_PERIOD", "2"))
+
+in_flight = InFlightCalls()
+
+pty_sessions = PtySessionManager(PtySessionConfig.from_env())
+# Longest read_session wait, so a call never holds its connection for long
+MAX_SESSION_WAIT = 30.0
+memory_diagnostics.register_gauge("pty_sessions", lambda: pty_sessions.snapshot()["open"])
+memory_diagnostics.register_gauge("pty_session_buffered_bytes", pty_sessions.buffered_bytes)
 
-executor = CommandExecutor(
-    allowed_dir=os.getenv("ALLOWED_DIR", ""), security_config=load_security_config()
+sse_sessions = SessionRegistry(SessionConfig.from_env())
+
+
+# Admission keys used on the current SSE connection, forgotten when it closes
+_connection_sessions: contextvars.ContextVar[Set[str]] = contextvars.ContextVar(
+    "cli_use_admission_sessions"
 )
 
 
+def _session_key() -> str:
+    """
+    Identifies the MCP session issuing the current request, for per-session
+    budgets: the SSE transport's session id, the key the admission middleware
+    charges the session's calls to. Falls back to a shared key for stdio and
+    outside of a request context.
+    """
+    try:
+        request = server.request_context.request
+    except LookupError:
+        return "local"
+    query_params = getattr(request, "query_params", None)
+    session_id = query_params.get("session_id") if query_params is not None else None
+    if not session_id:
+        return "local"
+    keys = _connection_sessions.get(None)
+    if keys is not None:
+        keys.add(session_id)
+    return session_id
+
+
+def bind_admission_sessions() -> contextvars.Token:
+    """Collects the admission keys used by the current connection."""
+    return _connection_sessions.set(set())
+
+
+def forget_admission_sessions(token: contextvars.Token) -> None:
+    """Drops the admission state of the connection bound with ``token``."""
+    keys = _connection_sessions.get()
+    _connection_sessions.reset(token)
+    for key in keys:
+        admission.forget_session(key)
+
+
+def tenant_summary(tenant: Tenant) -> Dict[str, Any]:
+    """A tenant's directory and policy version, for /health and the admin view."""
+    return {
+        "allowed_dir": tenant.executor.allowed_dir,
+        "policy_version": tenant.policy_store.version,
+    }
+
+
+def collect_stats(tenant: Optional[Tenant] = None) -> Dict[str, Any]:
+    """
+    Gathers runtime statistics for the show_stats tool and the /stats endpoints.
+
+    With ``tenant``, per-command figures are that tenant's own and no other
+    tenant is named. Without it (the admin view), they cover every tenant
+    and a ``tenants`` section lists each tenant's directory, policy version
+    and commands.
+    """
+    if tenant is not None:
+        scoped = {
+            "tenant": tenant.name,
+            "commands": tenant.resource_stats.snapshot(),
+        }
+    else:
+        scoped = {
+            "commands": resource_stats.snapshot(),
+            "tenants": {
+                each.name: {
+                    **tenant_summary(each),
+                    "commands": each.resource_stats.snapshot(),
+                }
+                for each in tenants
+            },
+        }
+    return {
+        "scheduler": scheduler.snapshot(),
+        **scoped,
+        "cancellation": in_flight.snapshot(),
+        "pty_sessions": pty_sessions.snapshot(),
+        "admission": admission.snapshot(),
+        "coalescing": coalescer.snapshot(),
+        "workers": workers.snapshot(),
+        "memory": memory_diagnostics.snapshot(),
+        "profiler": profiler.snapshot(),
+        "event_loop": loop_watchdog.snapshot(),
+        "sessions": sse_sessions.snapshot(),
+        "recording": recorder.snapshot(),
+        "transport": {
+            **transport_metrics.snapshot(),
+            "compression": {
+                "encodings": list(compression.encodings),
+                "min_size": compression.min_size,
+            },
+        },
+    }
+
+
+# The search tool is allowed and denied like this command, so a policy
+# that does not let callers grep cannot be bypassed through it
+SEARCH_COMMAND = "grep"
+
+
+def _search_command(arguments: Dict[str, Any]) -> str:
+    """The command a search is checked and audited as."""
+    return shlex.join([SEARCH_COMMAND, str(arguments.get("path", "."))])
+
+
+def _run_search(executor: CommandExecutor, arguments: Dict[str, Any]) -> tuple[str, int]:
+    """
+    Runs a content search for the search tool and formats the matches.
+
+    Returns:
+        tuple[str, int]: The formatted output and the number of matches.
+
+    Raises:
+        CommandSecurityError: If the policy does not allow the equivalent
+            ``grep`` command or the path is outside the allowed directory.
+        ValueError: If ``max_results`` is not a positive integer.
+    """
+    pattern = arguments.get("pattern", "")
+    executor._validate_single_command(_search_command(arguments), executor.security_config)
+    root = executor._normalize_path(arguments.get("path", "."))
+    if not os.path.isdir(root):
+        raise CommandSecurityError(f"Search path '{arguments.get('path')}' is not a directory")
+
+    globs = arguments.get("globs") or []
+    if isinstance(globs, str):
+        globs = [globs]
+    max_results = int(arguments.get("max_results", 200))
+    if max_results < 1:
+        raise ValueError("max_results must be at least 1")
+    max_results = min(max_results, MAX_SEARCH_RESULTS)
+
+    matches = [
+        match.format()
+        for match in searcher.search(
+            root,
+            pattern,
+            literal=bool(arguments.get("literal", False)),
+            ignore_case=bool(arguments.get("ignore_case", False)),
+            globs=globs,
+            max_results=max_results,
+            respect_gitignore=bool(arguments.get("respect_gitignore", True)),
+            is_path_safe=executor._is_path_safe,
+        )
+    ]
+    if not matches:
+        return "No matches found", 0
+    summary = f"\n{len(matches)} match(es)"
+    if len(matches) >= max_results:
+        summary += f" (limited to {max_results})"
+    return "\n".join(matches) + summary, len(matches)
+
+
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
+    executor = current_tenant().executor
+    config = executor.security_config
     commands_desc = (
         "all commands"
-        if executor.security_config.allow_all_commands
-        else ", ".join(executor.security_config.allowed_commands)
+        if config.allow_all_commands
+        else ", ".join(config.allowed_commands)
     )
     flags_desc = (
         "all flags"
-        if executor.security_config.allow_all_flags
-        else ", ".join(executor.security_config.allowed_flags)
+        if config.allow_all_flags
+        else ", ".join(config.allowed_flags)
     )
 
-    return [
+    tools = [
         types.Tool(
             name="run_command",
             description=(
                 f"Allows command (CLI) execution in the directory: {executor.allowed_dir}\n\n"
                 f"Available commands: {commands_desc}\n"
                 f"Available flags: {flags_desc}\n\n"
-                f"Shell operators (&&, ||, |, >, >>, <, <<, ;) are {'supported' if executor.security_config.allow_shell_operators else 'not supported'}. Set ALLOW_SHELL_OPERATORS=true to enable."
+                f"Shell operators (&&, ||, |, >, >>, <, <<, ;) are {'supported' if config.allow_shell_operators else 'not supported'}. Set ALLOW_SHELL_OPERATORS=true to enable."
             ),
             inputSchema={
                 "type": "object",
@@ -574,11 +1110,90 @@ async def handle_list_tools() -> list[types.Tool]:
                     "command": {
                         "type": "string",
                         "description": "Single command to execute (example: 'ls -l' or 'cat file.txt')",
-                    }
+                    },
+                    "priority": {
+                        "type": "string",
+                        "enum": list(PRIORITY_CLASSES),
+                        "description": (
+                            "Scheduling priority. Interactive commands are run ahead of queued batch "
+                            "work; batch commands run with lower CPU/IO priority. Defaults to a "
+                            "class derived from the command name."
+                        ),
+                    },
+                    "labels": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": (
+                            "Run on a connected remote worker carrying all of these labels "
+                            "(example: ['linux', 'gpu'])"
+                        ),
+                    },
+                    "output": {
+                        "type": "string",
+                        "enum": list(OUTPUT_MODES),
+                        "description": (
+                            "Terminal output handling: raw, stripped (no escape sequences, only "
+                            "the last frame of progress redraws) or rendered (the text a "
+                            f"terminal would show). Defaults to {PTY_OUTPUT_MODE} for commands "
+                            "run in a PTY and raw otherwise."
+                        ),
+                    },
+                    "resource_usage": {
+                        "type": "boolean",
+                        "description": (
+                            "Append a JSON line with the CPU time, peak memory, block I/O and "
+                            "context switches of the command and its children "
+                            f"(default: {str(RESOURCE_USAGE_TRAILER).lower()})"
+                        ),
+                    },
                 },
                 "required": ["command"],
             },
         ),
+        types.Tool(
+            name="search",
+            description=(
+                f"Search file contents in the directory: {executor.allowed_dir}\n\n"
+                "Scans files in parallel, skips binary files and respects .gitignore. "
+                "Returns matches as 'path:line:text'. "
+                f"Available when the security policy allows '{SEARCH_COMMAND}'."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "Regular expression (or literal text when 'literal' is true) to search for",
+                    },
+                    "literal": {
+                        "type": "boolean",
+                        "description": "Treat the pattern as literal text (default: false)",
+                    },
+                    "ignore_case": {
+                        "type": "boolean",
+                        "description": "Case-insensitive matching (default: false)",
+                    },
+                    "globs": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "File globs to include (example: '*.py'); prefix with '!' to exclude",
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": "Directory to search, relative to the allowed directory (default: '.')",
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": f"Maximum number of matches to return (default: 200, max: {MAX_SEARCH_RESULTS})",
+                    },
+                    "respect_gitignore": {
+                        "type": "boolean",
+                        "description": "Skip files ignored by .gitignore (default: true)",
+                    },
+                },
+                "required": ["pattern"],
+            },
+        ),
         types.Tool(
             name="show_security_rules",
             description=(
@@ -589,6 +1204,174 @@ async def handle_list_tools() -> list[types.Tool]:
                 "properties": {},
             },
         ),
+        types.Tool(
+            name="show_stats",
+            description=(
+                "Show runtime statistics: scheduler queues, CPU, memory and I/O used per "
+                "command name by this tenant (heaviest first), admission budgets and "
+                "coalesced command executions.\n"
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {},
+            },
+        ),
+        types.Tool(
+            name="reload_policy",
+            description=(
+                "Reload the security policy from POLICY_FILE and the environment without "
+                "restarting the server. Commands already running keep their policy.\n"
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {},
+            },
+        ),
+    ]
+    if pty_sessions.enabled:
+        tools += _session_tools()
+    if memory_diagnostics.enabled:
+        tools.append(
+            types.Tool(
+                name="debug_memory",
+                description=(
+                    "Admin: report top memory allocation sites (tracemalloc), growth since "
+                    "the previous report, RSS and live session/job/buffer counts.\n"
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "limit": {
+                            "type": "integer",
+                            "description": "Number of allocation sites to list (default: 20)",
+                        },
+                        "group_by": {
+                            "type": "string",
+                            "enum": list(GROUP_BY),
+                            "description": "Group allocations by line, file or full traceback (default: lineno)",
+                        },
+                        "diff": {
+                            "type": "boolean",
+                            "description": "Include growth since the previous report (default: true)",
+                        },
+                    },
+                },
+            )
+        )
+    if profiler.enabled:
+        tools.append(
+            types.Tool(
+                name="debug_profile",
+                description=(
+                    "Admin: sample the server's Python stacks for a number of seconds and "
+                    "return collapsed stacks for flamegraph tools.\n"
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "seconds": {
+                            "type": "number",
+                            "description": f"Profile duration (default: 5, max: {profiler.max_seconds:g})",
+                        },
+                        "include_idle": {
+                            "type": "boolean",
+                            "description": "Keep samples of threads blocked in waits (default: false)",
+                        },
+                    },
+                },
+            )
+        )
+    return tools
+
+
+def _session_tools() -> List[types.Tool]:
+    """Tools driving persistent interactive PTY sessions."""
+    session_id = {"type": "string", "description": "Session id returned by open_session"}
+    return [
+        types.Tool(
+            name="open_session",
+            description=(
+                "Start a long-lived interactive program (REPL, debugger, claude) in its own "
+                "terminal. The command is checked against the same policy as run_command "
+                "and must be a single program listed in PTY_SESSION_COMMANDS. "
+                "Drive it with send_input and read_session, and stop it with close_session. "
+                f"Sessions idle for {pty_sessions.config.idle_timeout:g} seconds are closed.\n"
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "command": {
+                        "type": "string",
+                        "description": "Program to start (example: 'python3' or 'claude')",
+                    },
+                    "rows": {
+                        "type": "integer",
+                        "description": f"Terminal height (default: {DEFAULT_ROWS})",
+                    },
+                    "cols": {
+                        "type": "integer",
+                        "description": f"Terminal width (default: {DEFAULT_COLS})",
+                    },
+                },
+                "required": ["command"],
+            },
+        ),
+        types.Tool(
+            name="send_input",
+            description=(
+                "Type text into a session's terminal. Use \\r for Enter and control characters "
+                "such as \\u0003 for Ctrl-C. Returns the output offset from which the response "
+                "can be read.\n"
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "session": session_id,
+                    "input": {"type": "string", "description": "Text to send"},
+                },
+                "required": ["session", "input"],
+            },
+        ),
+        types.Tool(
+            name="read_session",
+            description=(
+                "Read a session's output from an offset without waiting. The result ends with the "
+                "offset to read from next; output older than the session's buffer is dropped.\n"
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "session": session_id,
+                    "offset": {
+                        "type": "integer",
+                        "description": "Output offset to read from (default: 0, the oldest output kept)",
+                    },
+                    "max_bytes": {
+                        "type": "integer",
+                        "description": "Most output bytes to return (default: 65536)",
+                    },
+                    "wait": {
+                        "type": "number",
+                        "description": "Seconds to wait for output when there is none yet (default: 0)",
+                    },
+                    "output": {
+                        "type": "string",
+                        "enum": list(OUTPUT_MODES),
+                        "description": "Terminal output handling (default: stripped)",
+                    },
+                },
+                "required": ["session"],
+            },
+        ),
+        types.Tool(
+            name="close_session",
+            description="Stop a session's program and discard its output.\n",
+            inputSchema={
+                "type": "object",
+                "properties": {"session": session_id},
+                "required": ["session"],
+            },
+        ),
     ]
 
 
@@ -596,14 +1379,121 @@ async def handle_list_tools() -> list[types.Tool]:
 async def handle_call_tool(
     name: str, arguments: Optional[Dict[str, Any]]
 ) -> List[types.TextContent]:
+    with memory_diagnostics.track_request(name), in_flight.track():
+        return await _call_tool(name, arguments)
+
+
+async def _run_cancellable(priority: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Runs ``fn(*args, cancel)`` on the scheduler. If the awaiting task is
+    cancelled (the client cancelled the request or disconnected) while ``fn``
+    runs, ``cancel`` is set so the command is stopped instead of running to
+    its timeout.
+    """
+    cancel = CancelToken()
+    try:
+        return await scheduler.run(priority, fn, *args, cancel)
+    except asyncio.CancelledError:
+        cancel.cancel()
+        raise
+
+
+async def _call_tool(
+    name: str, arguments: Optional[Dict[str, Any]]
+) -> List[types.TextContent]:
+    tenant = current_tenant()
+    executor = tenant.executor
+
     if name == "run_command":
         if not arguments or "command" not in arguments:
             return [
                 types.TextContent(type="text", text="No command provided", error=True)
             ]
 
+        priority = arguments.get("priority") or classify_command(
+            arguments["command"], priority_rules
+        )
+        if priority not in PRIORITY_CLASSES:
+            return [
+                types.TextContent(
+                    type="text",
+                    text=f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITY_CLASSES)}",
+                    error=True,
+                )
+            ]
+
+        output_mode = arguments.get("output") or None
+        if output_mode is not None and output_mode not in OUTPUT_MODES:
+            return [
+                types.TextContent(
+                    type="text",
+                    text=f"Unknown output mode '{output_mode}'. Use one of: {', '.join(OUTPUT_MODES)}",
+                    error=True,
+                )
+            ]
+
+        command_string = arguments["command"]
+        started = time.monotonic()
+        session_key = _session_key()
+        labels = arguments.get("labels") or None
+        if isinstance(labels, str):
+            labels = [labels]
+        config = executor.security_config
+        coalesce_key = coalescer.key_for(
+            command_string,
+            tenant.name,
+            executor.allowed_dir,
+            config.version,
+            tuple(sorted(labels or ())),
+            output_mode,
+        )
+        # Requests joining an in-flight execution spawn nothing, so they
+        # need no process slot
+        joined = coalescer.in_flight(coalesce_key)
+        decision = admission.try_acquire_process(session_key) if not joined else None
+        if decision is not None and not decision.admitted:
+            audit.record(
+                command_string,
+                "rejected",
+                time.monotonic() - started,
+                reason=decision.reason,
+                priority=priority,
+                tenant=tenant.name,
+            )
+            return [_rejection(decision)]
+
         try:
-            result = executor.execute(arguments["command"])
+            # The slot belongs to the execution, which outlives this call when
+            # other callers have joined it
+            result = await coalescer.do(
+                coalesce_key,
+                lambda: _run_cancellable(
+                    priority,
+                    executor.execute,
+                    command_string,
+                    priority,
+                    labels,
+                    output_mode,
+                ),
+                on_done=None if joined else lambda: admission.release_process(session_key),
+            )
+
+            usage = getattr(result, "rusage", None)
+            if usage is not None and not joined:
+                resource_stats.record(command_string, usage)
+                tenant.resource_stats.record(command_string, usage)
+            audit.record(
+                command_string,
+                "allowed",
+                time.monotonic() - started,
+                exit_code=result.returncode,
+                stdout_bytes=getattr(result, "stdout_bytes", 0),
+                stderr_bytes=getattr(result, "stderr_bytes", 0),
+                priority=priority,
+                tenant=tenant.name,
+                coalesced=joined,
+                rusage=usage.to_dict() if usage is not None else None,
+            )
 
             response = []
             if result.stdout:
@@ -613,22 +1503,35 @@ async def handle_call_tool(
                     types.TextContent(type="text", text=result.stderr, error=True)
                 )
 
-            response.append(
-                types.TextContent(
-                    type="text",
-                    text=f"\nCommand completed with return code: {result.returncode}",
-                )
-            )
+            completion = f"\nCommand completed with return code: {result.returncode}"
+            if usage is not None and arguments.get("resource_usage", RESOURCE_USAGE_TRAILER):
+                completion += f"\nResource usage: {json.dumps(usage.to_dict())}"
+            response.append(types.TextContent(type="text", text=completion))
 
             return response
 
         except CommandSecurityError as e:
+            audit.record(
+                command_string,
+                "denied",
+                time.monotonic() - started,
+                reason=str(e),
+                priority=priority,
+                tenant=tenant.name,
+            )
             return [
                 types.TextContent(
                     type="text", text=f"Security violation: {str(e)}", error=True
                 )
             ]
-        except subprocess.TimeoutExpired:
+        except (subprocess.TimeoutExpired, CommandTimeoutError):
+            audit.record(
+                command_string,
+                "timeout",
+                time.monotonic() - started,
+                priority=priority,
+                tenant=tenant.name,
+            )
             return [
                 types.TextContent(
                     type="text",
@@ -637,52 +1540,375 @@ async def handle_call_tool(
                 )
             ]
         except Exception as e:
+            audit.record(
+                command_string,
+                "error",
+                time.monotonic() - started,
+                reason=str(e),
+                priority=priority,
+                tenant=tenant.name,
+            )
+            return [types.TextContent(type="text", text=f"Error: {str(e)}", error=True)]
+        except asyncio.CancelledError:
+            audit.record(
+                command_string,
+                "cancelled",
+                time.monotonic() - started,
+                priority=priority,
+                tenant=tenant.name,
+            )
+            raise
+
+    elif name == "search":
+        if not arguments or not arguments.get("pattern"):
+            return [
+                types.TextContent(type="text", text="No pattern provided", error=True)
+            ]
+
+        search_command = _search_command(arguments)
+        started = time.monotonic()
+        try:
+            output, count = await asyncio.to_thread(_run_search, executor, arguments)
+            audit.record(
+                search_command,
+                "allowed",
+                time.monotonic() - started,
+                tenant=tenant.name,
+                tool="search",
+                pattern=arguments["pattern"],
+                matches=count,
+            )
+            return [types.TextContent(type="text", text=output)]
+        except CommandSecurityError as e:
+            audit.record(
+                search_command,
+                "denied",
+                time.monotonic() - started,
+                reason=str(e),
+                tenant=tenant.name,
+                tool="search",
+                pattern=arguments["pattern"],
+            )
+            return [
+                types.TextContent(
+                    type="text", text=f"Security violation: {str(e)}", error=True
+                )
+            ]
+        except re.error as e:
+            audit.record(
+                search_command,
+                "error",
+                time.monotonic() - started,
+                reason=str(e),
+                tenant=tenant.name,
+                tool="search",
+                pattern=arguments["pattern"],
+            )
+            return [
+                types.TextContent(
+                    type="text", text=f"Invalid pattern: {str(e)}", error=True
+                )
+            ]
+        except Exception as e:
+            audit.record(
+                search_command,
+                "error",
+                time.monotonic() - started,
+                reason=str(e),
+                tenant=tenant.name,
+                tool="search",
+                pattern=arguments["pattern"],
+            )
             return [types.TextContent(type="text", text=f"Error: {str(e)}", error=True)]
 
     elif name == "show_security_rules":
+        config = executor.security_config
         commands_desc = (
             "All commands allowed"
-            if executor.security_config.allow_all_commands
-            else ", ".join(sorted(executor.security_config.allowed_commands))
+            if config.allow_all_commands
+            else ", ".join(sorted(config.allowed_commands))
         )
         flags_desc = (
             "All flags allowed"
-            if executor.security_config.allow_all_flags
-            else ", ".join(sorted(executor.security_config.allowed_flags))
+            if config.allow_all_flags
+            else ", ".join(sorted(config.allowed_flags))
+        )
+        rules_desc = (
+            "\nCommand Rules:\n-------------\n" + "\n".join(config.rules.describe()) + "\n"
+            if config.rules is not None
+            else ""
         )
 
         security_info = (
             "Security Configuration:\n"
             f"==================\n"
             f"Working Directory: {executor.allowed_dir}\n"
+            f"Policy Version: {config.version}\n"
             f"\nAllowed Commands:\n"
             f"----------------\n"
             f"{commands_desc}\n"
             f"\nAllowed Flags:\n"
             f"-------------\n"
             f"{flags_desc}\n"
+            f"{rules_desc}"
             f"\nSecurity Limits:\n"
             f"---------------\n"
-            f"Max Command Length: {executor.security_config.max_command_length} characters\n"
-            f"Command Timeout: {executor.security_config.command_timeout} seconds\n"
+            f"Max Command Length: {config.max_command_length} characters\n"
+            f"Command Timeout: {config.command_timeout} seconds\n"
         )
         return [types.TextContent(type="text", text=security_info)]
 
+    elif name == "show_stats":
+        return [
+            types.TextContent(type="text", text=json.dumps(collect_stats(tenant), indent=2))
+        ]
+
+    elif name == "debug_memory":
+        arguments = arguments or {}
+        try:
+            report = await asyncio.to_thread(
+                memory_diagnostics.report,
+                limit=int(arguments.get("limit", 20)),
+                group_by=arguments.get("group_by", "lineno"),
+                diff=bool(arguments.get("diff", True)),
+            )
+        except (RuntimeError, ValueError) as e:
+            return [types.TextContent(type="text", text=f"Error: {str(e)}", error=True)]
+        return [types.TextContent(type="text", text=json.dumps(report, indent=2))]
+
+    elif name == "debug_profile":
+        arguments = arguments or {}
+        try:
+            profile = await profiler.profile(
+                parse_seconds(arguments.get("seconds", 5)),
+                include_idle=bool(arguments.get("include_idle", False)),
+            )
+        except (RuntimeError, ValueError, ProfilerBusyError) as e:
+            return [types.TextContent(type="text", text=f"Error: {str(e)}", error=True)]
+        return [
+            types.TextContent(type="text", text=json.dumps(profile.summary(), indent=2)),
+            types.TextContent(type="text", text=profile.collapsed() or "No samples\n"),
+        ]
+
+    elif name == "reload_policy":
+        try:
+            config = await asyncio.to_thread(tenant.policy_store.reload)
+        except Exception as e:
+            return [
+                types.TextContent(
+                    type="text",
+                    text=f"Policy reload failed, keeping version {tenant.policy_store.version}: {str(e)}",
+                    error=True,
+                )
+            ]
+        return [
+            types.TextContent(
+                type="text", text=f"Security policy version {config.version} installed"
+            )
+        ]
+
+    elif name in ("open_session", "send_input", "read_session", "close_session"):
+        if not pty_sessions.enabled:
+            return [
+                types.TextContent(
+                    type="text", text="Interactive sessions are disabled", error=True
+                )
+            ]
+        try:
+            return await _call_session_tool(name, arguments or {}, tenant)
+        except CommandSecurityError as e:
+            return [
+                types.TextContent(
+                    type="text", text=f"Security violation: {str(e)}", error=True
+                )
+            ]
+        except (SessionError, ValueError) as e:
+            return [types.TextContent(type="text", text=f"Error: {str(e)}", error=True)]
+
     raise ValueError(f"Unknown tool: {name}")
 
 
+def _rejection(decision: AdmissionDecision) -> types.TextContent:
+    return types.TextContent(
+        type="text",
+        text=f"Rejected: {decision.reason}. Retry after {decision.retry_after:.1f} seconds.",
+        error=True,
+    )
+
+
+def _session_status(status: Dict[str, Any]) -> types.TextContent:
+    return types.TextContent(type="text", text=f"\nSession status: {json.dumps(status)}")
+
+
+async def _call_session_tool(
+    name: str, arguments: Dict[str, Any], tenant: Tenant
+) -> List[types.TextContent]:
+    """
+    Handles the interactive session tools. An open session holds an admission
+    process slot until its program exits, and every input sent to it is
+    audited.
+
+    Raises:
+        CommandSecurityError: If open_session's command is not allowed, or not
+            a single program listed in PTY_SESSION_COMMANDS.
+        SessionError: If the session is unknown, exited or cannot be opened.
+        ValueError: If an argument is invalid.
+    """
+    executor = tenant.executor
+    if name == "open_session":
+        command_string = arguments.get("command")
+        if not command_string:
+            raise ValueError("No command provided")
+        rows = int(arguments.get("rows") or DEFAULT_ROWS)
+        cols = int(arguments.get("cols") or DEFAULT_COLS)
+        started = time.monotonic()
+        try:
+            shell_command = executor.shell_command(command_string, executor.security_config)
+            # Input typed into the session bypasses the policy, so only
+            # programs meant to be driven interactively may be opened
+            program = command_name(command_string)
+            if program not in pty_sessions.config.commands:
+                raise CommandSecurityError(
+                    f"'{program}' cannot be opened as a session. "
+                    "Add it to PTY_SESSION_COMMANDS to allow it."
+                )
+            if any(operator in command_string for operator in SHELL_OPERATORS):
+                raise CommandSecurityError("A session must run a single program")
+        except CommandSecurityError as e:
+            audit.record(
+                command_string,
+                "denied",
+                time.monotonic() - started,
+                reason=str(e),
+                tenant=tenant.name,
+            )
+            raise
+        session_key = _session_key()
+        decision = admission.try_acquire_process(session_key)
+        if not decision.admitted:
+            audit.record(
+                command_string,
+                "rejected",
+                time.monotonic() - started,
+                reason=decision.reason,
+                tenant=tenant.name,
+            )
+            return [_rejection(decision)]
+        env = dict(os.environ)
+        env.setdefault("TERM", "xterm-256color")
+        try:
+            session = await asyncio.to_thread(
+                pty_sessions.open,
+                executor.shell_args(shell_command),
+                executor.allowed_dir,
+                env,
+                command_string,
+                tenant.name,
+                rows,
+                cols,
+                lambda: admission.release_process(session_key),
+            )
+        except BaseException:
+            admission.release_process(session_key)
+            raise
+        audit.record(
+            command_string,
+            "allowed",
+            time.monotonic() - started,
+            tenant=tenant.name,
+            session=session.id,
+        )
+        return [_session_status(session.status())]
+
+    session_id = str(arguments.get("session") or "")
+    if name == "send_input":
+        data = arguments.get("input")
+        if not isinstance(data, str):
+            raise ValueError("No input provided")
+        session = pty_sessions.get(session_id, tenant.name)
+        started = time.monotonic()
+        payload = data.encode()
+        try:
+            offset = await asyncio.to_thread(
+                pty_sessions.write, session_id, tenant.name, payload
+            )
+        except SessionError as e:
+            audit.record(
+                session.command,
+                "error",
+                time.monotonic() - started,
+                reason=str(e),
+                tenant=tenant.name,
+                session=session_id,
+                input_bytes=len(payload),
+            )
+            raise
+        audit.record(
+            session.command,
+            "allowed",
+            time.monotonic() - started,
+            tenant=tenant.name,
+            session=session_id,
+            input_bytes=len(payload),
+        )
+        status = session.status()
+        # Output produced in response to the input starts here
+        status["offset"] = offset
+        return [_session_status(status)]
+
+    if name == "read_session":
+        output_mode = arguments.get("output") or "stripped"
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(
+                f"Unknown output mode '{output_mode}'. Use one of: {', '.join(OUTPUT_MODES)}"
+            )
+        offset = max(0, int(arguments.get("offset") or 0))
+        max_bytes = min(
+            int(arguments.get("max_bytes") or READ_CHUNK_SIZE), pty_sessions.config.buffer_bytes
+        )
+        session = pty_sessions.get(session_id, tenant.name)
+        deadline = time.monotonic() + min(float(arguments.get("wait") or 0), MAX_SESSION_WAIT)
+        while (
+            session.output.end <= offset
+            and not session.closed
+            and time.monotonic() < deadline
+        ):
+            await asyncio.sleep(0.05)
+        text, start, next_offset = pty_sessions.read(session_id, tenant.name, offset, max_bytes)
+        status = session.status()
+        status["offset"] = next_offset
+        status["skipped"] = max(0, start - offset)
+        response = []
+        text = normalize_output(text, output_mode)
+        if text:
+            response.append(types.TextContent(type="text", text=text))
+        response.append(_session_status(status))
+        return response
+
+    session = await asyncio.to_thread(pty_sessions.close, session_id, tenant.name)
+    status = session.status()
+    status["closed"] = True
+    return [_session_status(status)]
+
+
 async def main():
+    start_services()
+    memory_diagnostics.register_gauge("sessions", lambda: 1)
     # Default stdio mode
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="cli_use",
-                server_version="0.2.1",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    try:
+        async with mcp.server.stdio.stdio_server() as streams:
+            read_stream, write_stream = recorder.wrap(*transport_metrics.wrap(*streams))
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="cli_use",
+                    server_version="0.2.1",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        stop_services()
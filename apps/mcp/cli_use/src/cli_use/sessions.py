@@ -0,0 +1,341 @@
+"""
+Lifetime of SSE sessions.
+
+An SSE connection holds its MCP session, the session's running calls and
+their buffered output for as long as the HTTP response stays open. A client
+that crashed or lost its network can leave a half-open connection that looks
+open to the server indefinitely. Keep-alive comments written to every event
+stream make such a peer show up as a failed or stalled write, and a reaper
+thread closes sessions whose writes stalled, that stayed idle, or that
+outlived their maximum age.
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+import anyio
+from sse_starlette import EventSourceResponse
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the reaper's checks
+REAP_INTERVAL = 1.0
+
+# Reasons a session is closed for; "client" means the client went away
+CLOSE_REASONS = ("client", "idle", "max_age", "stalled")
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def set_heartbeat_interval(seconds: float) -> None:
+    """
+    Sets the interval of the keep-alive comments written to every event
+    stream. The MCP SSE transport creates its EventSourceResponse internally,
+    so the interval is set through the class default of sse_starlette.
+
+    Raises:
+        ValueError: If ``seconds`` is not a positive, finite number. Older
+            sse_starlette releases busy-loop on a 0 interval instead of
+            disabling the pings, and stalled sessions are only detected
+            through these writes.
+    """
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"SSE heartbeat interval must be positive, got {seconds}")
+    EventSourceResponse.DEFAULT_PING_INTERVAL = seconds
+
+
+@dataclass
+class SessionConfig:
+    """
+    Keep-alive and lifetime limits of SSE sessions. A limit of 0 disables it;
+    the heartbeat cannot be disabled.
+
+    Attributes:
+        heartbeat_interval: Seconds between keep-alive comments on the event stream.
+        idle_timeout: Seconds without messages in either direction and without
+            running calls after which a session is closed.
+        max_age: Seconds after which a session is closed regardless of activity.
+        send_timeout: Seconds a write to the client may stay blocked before the
+            session is considered dead.
+    """
+
+    heartbeat_interval: float = 15.0
+    idle_timeout: float = 3600.0
+    max_age: float = 0.0
+    send_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SessionConfig":
+        """
+        Environment Variables:
+            SSE_HEARTBEAT_INTERVAL: Seconds between keep-alive comments, must be positive (default: 15)
+            SSE_IDLE_TIMEOUT: Seconds before an idle session is closed, 0 disables (default: 3600)
+            SSE_MAX_SESSION_AGE: Seconds before any session is closed, 0 disables (default: 0)
+            SSE_SEND_TIMEOUT: Seconds a blocked write may take before the session is
+                closed, 0 disables (default: 30)
+        """
+        config = cls(
+            heartbeat_interval=float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15")),
+            idle_timeout=float(os.getenv("SSE_IDLE_TIMEOUT", "3600")),
+            max_age=float(os.getenv("SSE_MAX_SESSION_AGE", "0")),
+            send_timeout=float(os.getenv("SSE_SEND_TIMEOUT", "30")),
+        )
+        limits = (config.heartbeat_interval, config.idle_timeout, config.max_age, config.send_timeout)
+        if min(limits) < 0:
+            raise ValueError("SSE session limits must not be negative")
+        if not math.isfinite(config.heartbeat_interval) or config.heartbeat_interval <= 0:
+            raise ValueError("SSE_HEARTBEAT_INTERVAL must be a positive number of seconds")
+        return config
+
+
+class _ActivityReadStream:
+    """Wraps a session read stream and marks the session active on every message."""
+
+    def __init__(self, inner: Any, session: "SseSession"):
+        self._inner = inner
+        self._session = session
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._inner.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._inner.__anext__()
+        self._session.touch()
+        return message
+
+    async def receive(self):
+        message = await self._inner.receive()
+        self._session.touch()
+        return message
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class _ActivityWriteStream:
+    """Wraps a session write stream and marks the session active on every message."""
+
+    def __init__(self, inner: Any, session: "SseSession"):
+        self._inner = inner
+        self._session = session
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._inner.__aexit__(*exc_info)
+
+    async def send(self, message: Any) -> None:
+        self._session.touch()
+        await self._inner.send(message)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class SseSession:
+    """
+    One SSE connection and its MCP session.
+
+    Args:
+        id: Session number, unique within the process.
+        tenant: Name of the tenant the session is bound to.
+        client: Client address, for logging.
+        calls: The live collection of the session's running calls; a session
+            with running calls is never idle.
+        loop: Event loop serving the session.
+    """
+
+    def __init__(
+        self,
+        id: int,
+        tenant: str,
+        client: str,
+        calls: Collection[Any],
+        loop: asyncio.AbstractEventLoop,
+    ):
+        self.id = id
+        self.tenant = tenant
+        self.client = client
+        self.created = self.last_active = time.monotonic()
+        self.closed_reason: Optional[str] = None
+        self._calls = calls
+        self._loop = loop
+        # Set by SessionRegistry.open(), on the loop
+        self._scope: Optional[anyio.CancelScope] = None
+        self._sending_since: Optional[float] = None
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def wrap(self, read_stream: Any, write_stream: Any) -> Tuple[Any, Any]:
+        """Wraps the session streams so every message counts as activity."""
+        return _ActivityReadStream(read_stream, self), _ActivityWriteStream(write_stream, self)
+
+    def wrap_send(self, send: Send) -> Send:
+        """Wraps the ASGI send of the event stream to notice writes that block."""
+
+        async def timed_send(message: Dict[str, Any]) -> None:
+            self._sending_since = time.monotonic()
+            try:
+                await send(message)
+            finally:
+                self._sending_since = None
+
+        return timed_send
+
+    def expired(self, now: float, config: SessionConfig) -> Optional[str]:
+        """Returns why the session should be closed at ``now``, or None."""
+        if config.max_age and now - self.created > config.max_age:
+            return "max_age"
+        sending_since = self._sending_since
+        if config.send_timeout and sending_since is not None:
+            if now - sending_since > config.send_timeout:
+                return "stalled"
+        if config.idle_timeout and not self._calls and now - self.last_active > config.idle_timeout:
+            return "idle"
+        return None
+
+    def close(self, reason: str) -> None:
+        """Closes the session from any thread; its calls are cancelled."""
+        if self.closed_reason is not None:
+            return
+        self.closed_reason = reason
+        if self._scope is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._scope.cancel)
+        except RuntimeError:
+            # The loop is closed, and the session with it
+            pass
+
+
+class SessionRegistry:
+    """
+    Tracks the open SSE sessions and reaps stale ones.
+
+    The reaper thread is started with the first session, and only when a
+    timeout is configured.
+
+    Args:
+        config: Keep-alive and lifetime limits.
+    """
+
+    def __init__(self, config: Optional[SessionConfig] = None):
+        self.config = config or SessionConfig()
+        self._sessions: Dict[int, SseSession] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.opened = 0
+        self.closed = {reason: 0 for reason in CLOSE_REASONS}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    @asynccontextmanager
+    async def open(
+        self, send: Send, tenant: str, client: str, calls: Collection[Any]
+    ) -> AsyncIterator[SseSession]:
+        """
+        Registers a session for the duration of the block. The block is
+        cancelled when the session is reaped; the event stream is then ended
+        with ``send``, the unwrapped ASGI send of the response.
+        """
+        session = SseSession(next(self._ids), tenant, client, calls, asyncio.get_running_loop())
+        session._scope = anyio.CancelScope()
+        with self._lock:
+            self._sessions[session.id] = session
+            self.opened += 1
+        self._ensure_reaper()
+        try:
+            with session._scope:
+                yield session
+            if session.closed_reason is not None:
+                await self._end_response(send)
+        finally:
+            with self._lock:
+                self._sessions.pop(session.id, None)
+                self.closed[session.closed_reason or "client"] += 1
+
+    async def _end_response(self, send: Send) -> None:
+        # A dead peer may never accept the final chunk; the server closes the
+        # connection when the handler returns either way
+        with anyio.move_on_after(1):
+            try:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            except Exception as e:
+                logger.debug(f"Could not end the event stream of a closed session: {e}")
+
+    def reap(self, now: Optional[float] = None) -> List[SseSession]:
+        """Closes the sessions that expired at ``now`` and returns them."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            sessions = list(self._sessions.values())
+        reaped = []
+        for session in sessions:
+            reason = session.expired(now, self.config)
+            if reason is not None and session.closed_reason is None:
+                logger.info(
+                    f"Closing SSE session {session.id} from {session.client} "
+                    f"(tenant {session.tenant}): {reason}"
+                )
+                session.close(reason)
+                reaped.append(session)
+        return reaped
+
+    def _ensure_reaper(self) -> None:
+        config = self.config
+        if self._reaper is not None:
+            return
+        if not (config.idle_timeout or config.max_age or config.send_timeout):
+            return
+
+        # A fresh event per reaper, so the registry can be reused after stop()
+        stop = self._stop = threading.Event()
+
+        def reap_forever():
+            while not stop.wait(REAP_INTERVAL):
+                self.reap()
+
+        self._reaper = threading.Thread(
+            target=reap_forever, name="cli_use-session-reaper", daemon=True
+        )
+        self._reaper.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._reaper = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            counters = {"opened": self.opened, "closed": dict(self.closed)}
+        return {
+            "open": len(sessions),
+            **counters,
+            "oldest_seconds": round(max((now - s.created for s in sessions), default=0.0), 3),
+            "heartbeat_interval": self.config.heartbeat_interval,
+            "idle_timeout": self.config.idle_timeout,
+            "max_age": self.config.max_age,
+            "send_timeout": self.config.send_timeout,
+        }
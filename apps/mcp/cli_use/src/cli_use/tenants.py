@@ -0,0 +1,134 @@
+"""
+Multi-tenant executor registry.
+
+One server process can host several tenants, each with its own allowed
+directory and security policy. The tenant serving a session is bound to a
+context variable before the MCP session starts; tool handlers run in tasks
+spawned by that session and therefore resolve the same tenant. Apart from
+per-command resource figures, which each tenant keeps for itself,
+everything (scheduler threads, search pool, admission budgets, caches) is
+shared.
+"""
+
+import contextvars
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .policy import PolicyStore
+from .rusage import ResourceStats
+
+DEFAULT_TENANT = "default"
+
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+@dataclass
+class Tenant:
+    """An isolated command execution environment."""
+
+    name: str
+    executor: Any
+    policy_store: PolicyStore
+    # Resource usage of the tenant's own commands, for its show_stats view
+    resource_stats: ResourceStats = field(default_factory=ResourceStats)
+
+
+TenantFactory = Callable[[str, str, Optional[str]], Tenant]
+
+_current_tenant: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar(
+    "cli_use_tenant", default=None
+)
+
+
+class TenantRegistry:
+    """
+    Maps tenant names to tenants.
+
+    Args:
+        default: Tenant used when no tenant is bound to the current context.
+        factory: Builds a tenant from (name, allowed_dir, policy_file).
+    """
+
+    def __init__(self, default: Tenant, factory: TenantFactory):
+        self.default = default
+        self._factory = factory
+        self._tenants: Dict[str, Tenant] = {default.name: default}
+        self._lock = threading.Lock()
+
+    def register(
+        self, name: str, allowed_dir: str, policy_file: Optional[str] = None
+    ) -> Tenant:
+        """
+        Creates and registers a tenant.
+
+        Raises:
+            ValueError: If the name is invalid or taken, or the directory is invalid.
+        """
+        if not _TENANT_NAME.match(name):
+            raise ValueError(f"Invalid tenant name '{name}'")
+        tenant = self._factory(name, allowed_dir, policy_file)
+        with self._lock:
+            if name in self._tenants:
+                raise ValueError(f"Tenant '{name}' is already registered")
+            self._tenants[name] = tenant
+        return tenant
+
+    def load_file(self, path: str) -> List[Tenant]:
+        """
+        Registers tenants from a JSON file of the form
+        ``{"tenants": {"name": {"allowed_dir": "...", "policy_file": "..."}}}``.
+        Relative paths are resolved against the file's directory.
+
+        Raises:
+            OSError, ValueError: If the file cannot be read or is invalid.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("tenants") if isinstance(data, dict) else None
+        if not isinstance(entries, dict):
+            raise ValueError(f"Tenants file {path} must contain a 'tenants' object")
+
+        base = os.path.dirname(os.path.abspath(path))
+        created = []
+        for name, spec in entries.items():
+            if not isinstance(spec, dict) or "allowed_dir" not in spec:
+                raise ValueError(f"Tenant '{name}' needs an 'allowed_dir'")
+            allowed_dir = os.path.join(base, os.path.expanduser(spec["allowed_dir"]))
+            policy_file = spec.get("policy_file")
+            if policy_file:
+                policy_file = os.path.join(base, os.path.expanduser(policy_file))
+            created.append(self.register(name, allowed_dir, policy_file))
+        return created
+
+    def get(self, name: str) -> Tenant:
+        """
+        Raises:
+            KeyError: If no tenant with that name exists.
+        """
+        return self._tenants[name]
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(list(self._tenants.values()))
+
+    def names(self) -> List[str]:
+        return list(self._tenants)
+
+    def current(self) -> Tenant:
+        """The tenant bound to the running context, or the default tenant."""
+        return _current_tenant.get() or self.default
+
+    @staticmethod
+    def bind(tenant: Tenant) -> contextvars.Token:
+        """
+        Binds ``tenant`` to the current context. Tasks created afterwards
+        inherit the binding; pass the returned token to unbind().
+        """
+        return _current_tenant.set(tenant)
+
+    @staticmethod
+    def unbind(token: contextvars.Token) -> None:
+        _current_tenant.reset(token)
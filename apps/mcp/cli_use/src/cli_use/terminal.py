@@ -0,0 +1,257 @@
+"""
+Streaming normalization of terminal output.
+
+Programs attached to a PTY decorate their output with colors, cursor
+movement and progress redraws (``\\r`` followed by the next frame of a
+spinner or progress bar). Returned verbatim, this can be many times larger
+than the text a user would see. A TerminalNormalizer is fed output chunks as
+they are read and returns the normalized text in one linear pass:
+
+- ``raw``: decoded output, unchanged.
+- ``stripped``: escape sequences and control characters removed; of the
+  frames redrawn over a line with ``\\r``, only the last one is kept.
+- ``rendered``: the text a terminal would display, from a small virtual
+  terminal that applies carriage returns, backspaces, cursor movement and
+  line/screen erasure within a window of recent rows.
+"""
+
+import codecs
+import re
+from typing import List, Union
+
+OUTPUT_MODES = ("raw", "stripped", "rendered")
+
+# Longest escape sequence held back when a chunk ends in the middle of one
+MAX_SEQUENCE = 4096
+
+# Rows kept editable in rendered mode; older rows are emitted
+DEFAULT_ROWS = 100
+
+_SEQUENCE = (
+    r"(?P<csi>(?:\x1b\[|\x9b)(?P<params>[0-?]*)[ -/]*(?P<final>[@-~]))"
+    r"|(?P<osc>\x1b\][^\x07\x1b]*(?:\x07|\x1b\\))"
+    r"|(?P<esc>\x1b[ -/]*[0-Z\\^-~])"
+)
+_COMPLETE_SEQUENCE = re.compile(_SEQUENCE)
+# Tabs count as text; other C0/C1 controls are handled one by one
+_TOKENS = re.compile(
+    r"(?P<text>[^\x00-\x08\x0a-\x1f\x7f-\x9f]+)|" + _SEQUENCE + r"|(?P<ctl>[\x00-\x1f\x7f-\x9f])"
+)
+# Every alternative starts with a character class so the regex engine can
+# skip ahead to candidate positions (2-3x faster than alternating _SEQUENCE)
+_STRIP = re.compile(
+    r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-Z\\^-~])?"
+    r"|\x9b(?:[0-?]*[ -/]*[@-~])?"
+    r"|[\x00-\x08\x0b\x0c\x0e-\x1a\x1c-\x1f\x7f-\x9a\x9c-\x9f]"
+)
+# Sequences and controls that do not move the cursor (colors, titles,
+# charset selection, bells), removed in bulk before rendering
+_INERT = re.compile(
+    r"\x1b(?:\[[0-?]*[ -/]*m|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-Z\\^-~])"
+    r"|\x9b[0-?]*[ -/]*m"
+    r"|[\x00-\x07\x0b\x0c\x0e-\x1a\x1c-\x1f\x7f-\x9a\x9c-\x9f]"
+)
+
+
+def _last_frame(line: str) -> str:
+    """The last non-empty frame of a line redrawn with carriage returns."""
+    if "\r" not in line:
+        return line
+    for frame in reversed(line.split("\r")):
+        if frame:
+            return frame
+    return ""
+
+
+def _params(params: str, default: int = 1) -> List[int]:
+    if params.isdigit():
+        return [int(params)]
+    values = []
+    for value in params.lstrip("?>=<").split(";"):
+        values.append(int(value) if value.isdigit() else default)
+    return values
+
+
+class TerminalNormalizer:
+    """
+    Incrementally normalizes terminal output.
+
+    Args:
+        mode: One of OUTPUT_MODES.
+        rows: Rows kept editable by cursor movement in rendered mode.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+
+    def __init__(self, mode: str = "rendered", rows: int = DEFAULT_ROWS):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode '{mode}'. Use one of: {', '.join(OUTPUT_MODES)}")
+        self.mode = mode
+        self.rows = max(1, rows)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._held = ""
+        # Stripped mode: the current, unfinished line
+        self._pending: List[str] = []
+        # Rendered mode: editable rows, cursor, and text appended to the cursor row
+        self._screen: List[str] = [""]
+        self._row = 0
+        self._col = 0
+        self._row_len = 0
+        self._open: List[str] = []
+        self._out: List[str] = []
+
+    def feed(self, data: Union[bytes, str]) -> str:
+        """Processes a chunk of output and returns the text that is final."""
+        text = self._decoder.decode(data) if isinstance(data, bytes) else data
+        if self.mode == "raw":
+            return text
+        text = self._held + text
+        self._held = ""
+        start = text.rfind("\x1b", max(0, len(text) - MAX_SEQUENCE))
+        if start != -1 and _COMPLETE_SEQUENCE.match(text, start) is None:
+            text, self._held = text[:start], text[start:]
+        return self._process(text)
+
+    def close(self) -> str:
+        """Processes any buffered input and returns the remaining text."""
+        text = self._decoder.decode(b"", final=True)
+        if self.mode == "raw":
+            return text
+        text, self._held = self._held + text, ""
+        out = self._process(text)
+        if self.mode == "stripped":
+            out += _last_frame("".join(self._pending))
+            self._pending = []
+        else:
+            self._materialize()
+            rows = [row.rstrip() for row in self._screen]
+            # Blank rows below the cursor were never written (e.g. after a clear)
+            while len(rows) > self._row + 1 and not rows[-1]:
+                rows.pop()
+            out += "\n".join(rows)
+            self._screen, self._row, self._col, self._row_len = [""], 0, 0, 0
+        return out
+
+    def _process(self, text: str) -> str:
+        if not text:
+            return ""
+        if self.mode == "stripped":
+            return self._strip(text)
+        return self._render(text)
+
+    def _strip(self, text: str) -> str:
+        text = _STRIP.sub("", text)
+        lines = text.split("\n")
+        if len(lines) == 1 and "\r" not in text:
+            self._pending.append(text)
+            return ""
+        lines[0] = "".join(self._pending) + lines[0]
+        last = lines.pop()
+        out = "".join(_last_frame(line) + "\n" for line in lines)
+        # Keep only the latest frame of the unfinished line so redraws
+        # without a newline do not accumulate
+        frame = _last_frame(last)
+        self._pending = [frame, "\r"] if frame and last.endswith("\r") else [frame]
+        return out
+
+    def _render(self, text: str) -> str:
+        for match in _TOKENS.finditer(_INERT.sub("", text)):
+            kind = match.lastgroup
+            if kind == "text":
+                self._write(match.group())
+            elif kind == "ctl":
+                char = match.group()
+                if char == "\n":
+                    self._move_to(self._row + 1, 0)
+                elif char == "\r":
+                    self._col = 0
+                elif char == "\b":
+                    self._col = max(0, self._col - 1)
+            elif kind == "csi":
+                self._csi(match.group("params"), match.group("final"))
+        out = "".join(self._out)
+        self._out = []
+        return out
+
+    def _materialize(self) -> None:
+        if self._open:
+            self._screen[self._row] += "".join(self._open)
+            self._open = []
+
+    def _write(self, text: str) -> None:
+        if self._col == self._row_len:
+            self._open.append(text)
+            self._col += len(text)
+            self._row_len = self._col
+            return
+        self._materialize()
+        line = self._screen[self._row]
+        if self._col > len(line):
+            line += " " * (self._col - len(line))
+        line = line[: self._col] + text + line[self._col + len(text) :]
+        self._screen[self._row] = line
+        self._col += len(text)
+        self._row_len = len(line)
+
+    def _move_to(self, row: int, col: int) -> None:
+        self._materialize()
+        row = max(0, row)
+        while row >= len(self._screen):
+            self._screen.append("")
+        while len(self._screen) > self.rows:
+            # The oldest row scrolls out of reach and is final
+            self._out.append(self._screen.pop(0).rstrip() + "\n")
+            row -= 1
+        self._row = row
+        self._col = max(0, col)
+        self._row_len = len(self._screen[row])
+
+    def _csi(self, params: str, final: str) -> None:
+        if final in "ABCDEFG":
+            n = max(1, _params(params)[0])
+            if final == "A":
+                self._move_to(self._row - n, self._col)
+            elif final == "B":
+                self._move_to(self._row + n, self._col)
+            elif final == "C":
+                self._col += n
+            elif final == "D":
+                self._col = max(0, self._col - n)
+            elif final == "E":
+                self._move_to(self._row + n, 0)
+            elif final == "F":
+                self._move_to(self._row - n, 0)
+            else:
+                self._col = n - 1
+        elif final in "Hf":
+            # Absolute positions are taken relative to the editable window
+            values = _params(params) + [1]
+            self._move_to(min(values[0], len(self._screen)) - 1, values[1] - 1)
+        elif final in "KJ":
+            self._materialize()
+            how = _params(params, default=0)[0]
+            line = self._screen[self._row]
+            if how == 0:
+                line = line[: self._col]
+            elif how == 1:
+                line = " " * min(self._col + 1, len(line)) + line[self._col + 1 :]
+            else:
+                line = ""
+            self._screen[self._row] = line
+            self._row_len = len(line)
+            if final == "J":
+                if how == 0:
+                    del self._screen[self._row + 1 :]
+                elif how == 1:
+                    self._screen[: self._row] = [""] * self._row
+                else:
+                    self._screen = [""] * len(self._screen)
+
+
+def normalize_output(text: str, mode: str) -> str:
+    """Normalizes complete output (see TerminalNormalizer)."""
+    if mode == "raw" or not text:
+        return text
+    normalizer = TerminalNormalizer(mode)
+    return normalizer.feed(text) + normalizer.close()
@@ -0,0 +1,329 @@
+"""
+Response compression and transport metrics for the HTTP/SSE transport.
+
+CompressionMiddleware negotiates ``Content-Encoding`` (zstd or gzip) from
+the request's ``Accept-Encoding`` header. Complete responses smaller than a
+threshold are sent as is. Streams (the ``/sse`` event stream) are compressed
+as a whole once negotiated, flushing after every event so events are not
+delayed; since the compressor keeps its window across events, repeated
+JSON-RPC framing compresses well even in small events.
+
+TransportMetrics counts bytes before and after compression, compression CPU
+time, and the CPU time spent serializing outgoing JSON-RPC messages.
+"""
+
+import logging
+import os
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+try:  # Python 3.14+
+    from compression import zstd as _zstd
+except ImportError:
+    _zstd = None
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+SUPPORTED_ENCODINGS = ("zstd", "gzip")
+
+# Bodies larger than this are compressed in a worker thread so the event
+# loop keeps serving other sessions
+THREAD_COMPRESS_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+
+def zstd_available() -> bool:
+    return _zstd is not None or _zstandard is not None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        if _zstd is not None:
+            self._compressor = _zstd.ZstdCompressor(level=level)
+        else:
+            self._compressor = _zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if _zstd is not None:
+            compressor = self._compressor
+            mode = compressor.FLUSH_FRAME if final else compressor.FLUSH_BLOCK
+            return compressor.compress(data, mode)
+        out = self._compressor.compress(data)
+        if final:
+            return out + self._compressor.flush()
+        return out + self._compressor.flush(_zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+_ENCODERS = {"gzip": (_GzipEncoder, 6), "zstd": (_ZstdEncoder, 3)}
+
+
+def negotiate(accept_encoding: str, offered: Sequence[str]) -> Optional[str]:
+    """
+    Picks the first of ``offered`` (in server preference order) that the
+    client accepts, honoring ``q=0`` and the ``*`` wildcard.
+    """
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+@dataclass(frozen=True)
+class CompressionConfig:
+    """
+    Compression settings of the HTTP/SSE transport.
+
+    Args:
+        encodings: Offered encodings in order of preference (empty disables).
+        min_size: Complete responses smaller than this many bytes are not compressed.
+    """
+
+    encodings: Tuple[str, ...] = ("zstd", "gzip")
+    min_size: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "CompressionConfig":
+        """
+        Environment Variables:
+            COMPRESSION: Offered encodings in order of preference, or 'none' (default: zstd,gzip)
+            COMPRESS_MIN_SIZE: Smallest response body worth compressing, in bytes (default: 1024)
+
+        Raises:
+            ValueError: If an encoding is not supported.
+        """
+        value = os.getenv("COMPRESSION", "zstd,gzip").strip().lower()
+        names = [] if value in ("", "none") else [n.strip() for n in value.split(",") if n.strip()]
+        encodings = []
+        for name in names:
+            if name not in SUPPORTED_ENCODINGS:
+                raise ValueError(
+                    f"Unknown COMPRESSION encoding '{name}'. Use: {', '.join(SUPPORTED_ENCODINGS)}"
+                )
+            if name == "zstd" and not zstd_available():
+                logger.info("zstd compression is not offered: install `zstandard` to enable it")
+                continue
+            encodings.append(name)
+        return cls(tuple(encodings), int(os.getenv("COMPRESS_MIN_SIZE", "1024")))
+
+
+class _SerializedMessage:
+    """A JSON-RPC message whose JSON form was computed once, ahead of the transport."""
+
+    def __init__(self, message: Any, json: str):
+        self._message = message
+        self._json = json
+
+    def model_dump_json(self, **kwargs: Any) -> str:
+        return self._json
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._message, name)
+
+
+class _SerializingWriteStream:
+    """Serializes outgoing messages once, timing it, for the transport to reuse."""
+
+    def __init__(self, inner: Any, metrics: "TransportMetrics"):
+        self._inner = inner
+        self._metrics = metrics
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._inner.__aexit__(*exc_info)
+
+    async def send(self, session_message: Any) -> None:
+        message = getattr(session_message, "message", None)
+        if message is not None:
+            started = time.thread_time()
+            # pydantic-core's encoder is what the transports use, and is
+            # faster than the json module even for megabyte-sized TextContent
+            json = message.model_dump_json(by_alias=True, exclude_none=True)
+            self._metrics.record_serialization(len(json), time.thread_time() - started)
+            session_message.message = _SerializedMessage(message, json)
+        await self._inner.send(session_message)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+class TransportMetrics:
+    """Counts serialization and wire traffic of the transports."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.serialized_bytes = 0
+        self.serialization_cpu = 0.0
+        self.responses: Dict[str, int] = {}
+        self.body_bytes = 0
+        self.wire_bytes = 0
+        self.compression_cpu = 0.0
+
+    def wrap(self, read_stream: Any, write_stream: Any) -> Tuple[Any, Any]:
+        """Returns session streams whose outgoing messages are serialized and timed here."""
+        return read_stream, _SerializingWriteStream(write_stream, self)
+
+    def record_serialization(self, size: int, cpu: float) -> None:
+        with self._lock:
+            self.messages += 1
+            self.serialized_bytes += size
+            self.serialization_cpu += cpu
+
+    def record_response(self, encoding: Optional[str]) -> None:
+        with self._lock:
+            key = encoding or "identity"
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def record_body(self, body_bytes: int, wire_bytes: int, cpu: float = 0.0) -> None:
+        with self._lock:
+            self.body_bytes += body_bytes
+            self.wire_bytes += wire_bytes
+            self.compression_cpu += cpu
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "serialization": {
+                    "messages": self.messages,
+                    "bytes": self.serialized_bytes,
+                    "cpu_seconds": round(self.serialization_cpu, 6),
+                },
+                "http": {
+                    "responses": dict(self.responses),
+                    "body_bytes": self.body_bytes,
+                    "wire_bytes": self.wire_bytes,
+                    "compression_ratio": (
+                        round(self.body_bytes / self.wire_bytes, 3) if self.wire_bytes else None
+                    ),
+                    "compression_cpu_seconds": round(self.compression_cpu, 6),
+                },
+            }
+
+
+def _compressible(headers: MutableHeaders, status: int) -> bool:
+    if status < 200 or status in (204, 304) or "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing HTTP responses with a negotiated encoding
+    and counting their bytes on the wire.
+    """
+
+    def __init__(self, app, config: CompressionConfig, metrics: TransportMetrics):
+        self.app = app
+        self.config = config
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = None
+        if self.config.encodings:
+            encoding = negotiate(
+                Headers(scope=scope).get("accept-encoding", ""), self.config.encodings
+            )
+        metrics = self.metrics
+        start: Optional[Dict[str, Any]] = None
+        encoder = None
+
+        async def compressing_send(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether the
+                # response is complete and large enough to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                response_start, start = start, None
+                headers = MutableHeaders(raw=response_start["headers"])
+                if (
+                    encoding is not None
+                    and _compressible(headers, response_start["status"])
+                    and (more_body or len(body) >= self.config.min_size)
+                ):
+                    encoder_class, level = _ENCODERS[encoding]
+                    encoder = encoder_class(level)
+                    headers["content-encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                metrics.record_response(encoding if encoder is not None else None)
+                if encoder is None:
+                    await send(response_start)
+                else:
+                    wire = await self._compress(encoder, body, more_body)
+                    if more_body:
+                        del headers["content-length"]
+                    else:
+                        headers["content-length"] = str(len(wire))
+                    await send(response_start)
+                    await send({"type": "http.response.body", "body": wire, "more_body": more_body})
+                    return
+
+            if encoder is None:
+                metrics.record_body(len(body), len(body))
+                await send(message)
+                return
+            wire = await self._compress(encoder, body, more_body)
+            await send({"type": "http.response.body", "body": wire, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+    async def _compress(self, encoder: Any, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_COMPRESS_SIZE:
+            wire, cpu = await anyio.to_thread.run_sync(_timed, encoder, body, not more_body)
+        else:
+            wire, cpu = _timed(encoder, body, not more_body)
+        self.metrics.record_body(len(body), len(wire), cpu)
+        return wire
+
+
+def _timed(encoder: Any, body: bytes, final: bool) -> Tuple[bytes, float]:
+    started = time.thread_time()
+    wire = encoder.compress(body, final)
+    return wire, time.thread_time() - started
@@ -0,0 +1,902 @@
+"""
+Remote worker agents.
+
+The server listens on a Unix or TCP socket; worker agents (``cli_use_server
+worker``) connect to it, announce their labels and slot count, and run the
+commands the server dispatches to them. Commands are validated against the
+security policy on the server before they are sent, so a worker only ever
+executes commands the server would have run itself, and only inside the
+directories it was started with.
+
+When a token is configured, both sides prove they know it in the handshake
+(HMAC challenge-response over fresh nonces, so the token itself is never
+sent) and every later frame carries an HMAC keyed per direction and
+connection, so frames cannot be forged, replayed or reflected.
+
+Wire format: every frame is a 9-byte header followed by a payload::
+
+    >I  payload length
+    >B  frame type
+    >I  job id (0 for connection-level frames)
+
+Output frames carry raw bytes; all other payloads are UTF-8 JSON. On an
+authenticated connection every frame after WELCOME is followed by a 32-byte
+HMAC-SHA256 of its sequence number, header and payload.
+"""
+
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import secrets
+import socket
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .cancellation import DEFAULT_KILL_GRACE, CancelToken, CommandCancelled, terminate_process_group
+from .rusage import ResourceUsage, wait_with_rusage
+from .scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, priority_prefix
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+
+HELLO = 1  # worker -> server: name, labels, slots, nonce
+WELCOME = 2  # server -> worker: handshake accepted
+REJECT = 3  # server -> worker: handshake refused, with reason
+RUN = 4  # server -> worker: command, priority, timeout, cwd
+STDOUT = 5  # worker -> server: raw output chunk
+STDERR = 6  # worker -> server: raw output chunk
+EXIT = 7  # worker -> server: returncode, timed_out, error, rusage
+CANCEL = 8  # server -> worker: kill the job
+HEARTBEAT = 9  # worker -> server: running job count
+CHALLENGE = 10  # server -> worker: nonce, proof of the token
+AUTH = 11  # worker -> server: proof of the token
+
+_HEADER = struct.Struct(">IBI")
+_SEQUENCE = struct.Struct(">Q")
+MAC_SIZE = hashlib.sha256().digest_size
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+DISPATCH_MODES = ("all", "batch", "none")
+
+
+class WorkerError(Exception):
+    """No worker could run the command, or the worker was lost mid-command."""
+
+    pass
+
+
+class NoWorkerError(WorkerError):
+    """No connected worker matches the command; nothing was dispatched."""
+
+    pass
+
+
+def _proof(token: str, role: str, *nonces: str) -> str:
+    """Proves knowledge of ``token`` for ``role`` over the handshake nonces."""
+    message = "|".join((role,) + nonces).encode()
+    return hmac.new(token.encode(), message, hashlib.sha256).hexdigest()
+
+
+class FrameAuth:
+    """
+    Signs outgoing and checks incoming frames of an authenticated connection.
+
+    Each direction has its own key and sequence number. Callers serialize
+    sign() (under the connection's send lock) and check() (on the single
+    reading thread).
+    """
+
+    def __init__(self, send_key: bytes, receive_key: bytes):
+        self._send_key = send_key
+        self._receive_key = receive_key
+        self._sent = 0
+        self._received = 0
+
+    @classmethod
+    def derive(cls, token: str, role: str, server_nonce: str, worker_nonce: str) -> "FrameAuth":
+        """Frame keys of ``role`` ("server" or "worker") for one connection."""
+        keys = {
+            side: hmac.new(
+                token.encode(), f"{side}-frames|{server_nonce}|{worker_nonce}".encode(), hashlib.sha256
+            ).digest()
+            for side in ("server", "worker")
+        }
+        peer = "worker" if role == "server" else "server"
+        return cls(keys[role], keys[peer])
+
+    def sign(self, frame: bytes) -> bytes:
+        mac = hmac.new(self._send_key, _SEQUENCE.pack(self._sent) + frame, hashlib.sha256)
+        self._sent += 1
+        return frame + mac.digest()
+
+    def check(self, frame: bytes, mac: bytes) -> None:
+        """
+        Raises:
+            ConnectionError: If the frame was not signed by the peer in sequence.
+        """
+        expected = hmac.new(self._receive_key, _SEQUENCE.pack(self._received) + frame, hashlib.sha256)
+        if not hmac.compare_digest(expected.digest(), mac):
+            raise ConnectionError("Frame failed authentication")
+        self._received += 1
+
+
+def encode_frame(frame_type: int, job_id: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(len(payload), frame_type, job_id) + payload
+
+
+def encode_json_frame(frame_type: int, job_id: int, data: Dict[str, Any]) -> bytes:
+    return encode_frame(frame_type, job_id, json.dumps(data).encode())
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock: socket.socket, auth: Optional[FrameAuth] = None) -> Tuple[int, int, bytes]:
+    """
+    Reads one frame from a blocking socket, checking its MAC when ``auth`` is given.
+
+    Raises:
+        ConnectionError: If the peer closed the connection, sent an oversized
+            frame or a frame that failed authentication.
+    """
+    header = _recv_exactly(sock, _HEADER.size)
+    length, frame_type, job_id = _HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ConnectionError(f"Frame of {length} bytes exceeds the limit")
+    payload = _recv_exactly(sock, length) if length else b""
+    if auth is not None:
+        auth.check(header + payload, _recv_exactly(sock, MAC_SIZE))
+    return frame_type, job_id, payload
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """
+    Parses ``unix:/path/to.sock``, ``tcp:host:port`` or ``host:port`` into a
+    socket family and address.
+
+    Raises:
+        ValueError: If the address is malformed.
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("tcp:"):
+        address = address[len("tcp:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid worker address '{address}'")
+    return socket.AF_INET, (host.strip("[]") or "0.0.0.0", int(port))
+
+
+@dataclass
+class _RemoteJob:
+    id: int
+    worker: "WorkerConnection"
+    on_output: Optional[Callable[[str, bytes], None]] = None
+    stdout: bytearray = field(default_factory=bytearray)
+    stderr: bytearray = field(default_factory=bytearray)
+    done: threading.Event = field(default_factory=threading.Event)
+    returncode: Optional[int] = None
+    timed_out: bool = False
+    error: Optional[str] = None
+    rusage: Optional[Dict[str, Any]] = None
+
+
+class WorkerConnection:
+    """Server-side state of one connected worker."""
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        name: str,
+        labels: FrozenSet[str],
+        slots: int,
+        auth: Optional[FrameAuth] = None,
+    ):
+        self.sock = sock
+        self.auth = auth
+        self.name = name
+        self.labels = labels
+        self.slots = max(1, slots)
+        self.running = 0
+        self.completed = 0
+        self.last_seen = time.monotonic()
+        self.jobs: Dict[int, _RemoteJob] = {}
+        self._send_lock = threading.Lock()
+
+    def send(self, frame: bytes) -> None:
+        with self._send_lock:
+            self.sock.sendall(self.auth.sign(frame) if self.auth is not None else frame)
+
+    @property
+    def load(self) -> float:
+        return self.running / self.slots
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "labels": sorted(self.labels),
+            "slots": self.slots,
+            "running": self.running,
+            "completed": self.completed,
+        }
+
+
+def _hello_error(hello: Dict[str, Any]) -> Optional[str]:
+    """Why a HELLO's fields are unusable, or None if they are well-formed."""
+    name = hello.get("name")
+    if name is not None and not isinstance(name, str):
+        return "Worker name must be a string"
+    slots = hello.get("slots", 1)
+    if isinstance(slots, bool) or not isinstance(slots, int) or slots < 1:
+        return "Worker slots must be a positive integer"
+    labels = hello.get("labels") or []
+    if not isinstance(labels, list) or not all(isinstance(label, str) for label in labels):
+        return "Worker labels must be a list of strings"
+    return None
+
+
+class WorkerPool:
+    """
+    Accepts worker connections and dispatches commands to them.
+
+    Commands go to the least loaded worker that carries every requested
+    label and has a free slot; when all matching workers are busy, callers
+    wait for a slot. A worker that disconnects or stops sending heartbeats is
+    dropped and its running commands fail with WorkerError.
+
+    Args:
+        token: Shared secret both sides prove they know. Required for TCP listeners.
+        dispatch: Which unlabelled commands go to workers when any are
+            connected: "all", "batch" (batch priority only) or "none".
+        heartbeat_timeout: Seconds of silence after which a worker is dropped.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        dispatch: str = "batch",
+        heartbeat_timeout: float = 15.0,
+    ):
+        if dispatch not in DISPATCH_MODES:
+            raise ValueError(
+                f"Unknown worker dispatch mode '{dispatch}'. Use one of: {', '.join(DISPATCH_MODES)}"
+            )
+        self.token = token
+        self.dispatch = dispatch
+        self.heartbeat_timeout = heartbeat_timeout
+        self._workers: Dict[str, WorkerConnection] = {}
+        self._cond = threading.Condition()
+        self._job_ids = itertools.count(1)
+        self._listener: Optional[socket.socket] = None
+        self._closed = threading.Event()
+        self.address: Optional[str] = None
+        self.dispatched = 0
+        self.lost_jobs = 0
+
+    @classmethod
+    def from_env(cls) -> "WorkerPool":
+        """
+        Environment Variables:
+            WORKER_TOKEN: Shared secret the server and workers authenticate with (default: none)
+            WORKER_DISPATCH: all, batch or none (default: batch)
+            WORKER_HEARTBEAT_TIMEOUT: Seconds before a silent worker is dropped (default: 15)
+        """
+        return cls(
+            token=os.getenv("WORKER_TOKEN") or None,
+            dispatch=os.getenv("WORKER_DISPATCH", "batch").lower(),
+            heartbeat_timeout=float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "15")),
+        )
+
+    def listen(self, address: str) -> str:
+        """
+        Starts accepting workers on ``address`` in background threads.
+
+        Returns:
+            str: The bound address (with the real port when port 0 was requested).
+
+        Raises:
+            ValueError: If a TCP address is given without a token.
+            OSError: If the socket cannot be bound.
+        """
+        family, sockaddr = parse_address(address)
+        if family != socket.AF_UNIX and not self.token:
+            raise ValueError("WORKER_TOKEN must be set to accept workers over TCP")
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if family == socket.AF_UNIX:
+            # Created owner-only: a chmod after bind() would leave a window in
+            # which other users could connect
+            previous = os.umask(0o177)
+            try:
+                listener.bind(sockaddr)
+            finally:
+                os.umask(previous)
+        else:
+            listener.bind(sockaddr)
+        listener.listen()
+        self._listener = listener
+
+        if family == socket.AF_UNIX:
+            self.address = f"unix:{sockaddr}"
+        else:
+            host, port = listener.getsockname()[:2]
+            self.address = f"tcp:{host}:{port}"
+
+        for target, name in ((self._accept_loop, "accept"), (self._reap_loop, "reaper")):
+            threading.Thread(target=target, name=f"cli_use-workers-{name}", daemon=True).start()
+        logger.info(f"Accepting workers on {self.address}")
+        return self.address
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._serve, args=(sock,), name="cli_use-worker-conn", daemon=True
+            ).start()
+
+    def _handshake(self, sock: socket.socket) -> Optional[WorkerConnection]:
+        sock.settimeout(10)
+        frame_type, _, payload = read_frame(sock)
+        hello = json.loads(payload) if frame_type == HELLO else {}
+        reason = None
+        auth = None
+        if frame_type != HELLO:
+            reason = "Expected HELLO"
+        elif not isinstance(hello, dict) or _hello_error(hello) is not None:
+            reason = _hello_error(hello) if isinstance(hello, dict) else "Malformed HELLO"
+            hello = {}
+        elif hello.get("version") != PROTOCOL_VERSION:
+            reason = f"Unsupported protocol version {hello.get('version')}"
+        elif self.token:
+            auth = self._authenticate(sock, str(hello.get("nonce", "")))
+            if auth is None:
+                reason = "Invalid worker token"
+
+        name = str(hello.get("name") or f"worker-{id(sock):x}")
+        with self._cond:
+            if reason is None and name in self._workers:
+                reason = f"Worker name '{name}' is already connected"
+            if reason is not None:
+                sock.sendall(encode_json_frame(REJECT, 0, {"reason": reason}))
+                logger.warning(f"Rejected worker {name}: {reason}")
+                return None
+            # WELCOME goes out before the worker can be picked for a command;
+            # every later frame is signed
+            sock.sendall(encode_json_frame(WELCOME, 0, {"name": name}))
+            conn = WorkerConnection(
+                sock, name, frozenset(hello.get("labels") or ()), hello.get("slots", 1), auth
+            )
+            self._workers[name] = conn
+            self._cond.notify_all()
+        sock.settimeout(None)
+        logger.info(
+            f"Worker {name} connected with {conn.slots} slot(s), labels: {sorted(conn.labels)}"
+        )
+        return conn
+
+    def _authenticate(self, sock: socket.socket, worker_nonce: str) -> Optional[FrameAuth]:
+        """
+        Proves the token to the worker and checks the worker's proof.
+
+        Returns:
+            FrameAuth: Frame keys of the connection, or None if the worker's proof is wrong.
+        """
+        nonce = secrets.token_hex(16)
+        proof = _proof(self.token, "server", worker_nonce, nonce)
+        sock.sendall(encode_json_frame(CHALLENGE, 0, {"nonce": nonce, "proof": proof}))
+        frame_type, _, payload = read_frame(sock)
+        answer = json.loads(payload) if frame_type == AUTH else {}
+        if not isinstance(answer, dict):
+            return None
+        expected = _proof(self.token, "worker", nonce, worker_nonce)
+        if not hmac.compare_digest(str(answer.get("proof", "")).encode(), expected.encode()):
+            return None
+        return FrameAuth.derive(self.token, "server", nonce, worker_nonce)
+
+    def _serve(self, sock: socket.socket) -> None:
+        conn = None
+        try:
+            conn = self._handshake(sock)
+            if conn is None:
+                return
+            while True:
+                frame_type, job_id, payload = read_frame(sock, conn.auth)
+                conn.last_seen = time.monotonic()
+                if frame_type == HEARTBEAT:
+                    continue
+                job = conn.jobs.get(job_id)
+                if job is None:
+                    continue
+                if frame_type in (STDOUT, STDERR):
+                    stream = "stdout" if frame_type == STDOUT else "stderr"
+                    getattr(job, stream).extend(payload)
+                    if job.on_output is not None:
+                        job.on_output(stream, payload)
+                elif frame_type == EXIT:
+                    status = json.loads(payload)
+                    job.returncode = status.get("returncode")
+                    job.timed_out = bool(status.get("timed_out"))
+                    job.error = status.get("error")
+                    job.rusage = status.get("rusage")
+                    self._finish(conn, job)
+        except (OSError, ConnectionError, ValueError) as e:
+            if conn is not None:
+                logger.warning(f"Lost worker {conn.name}: {e}")
+        finally:
+            if conn is not None:
+                self._drop(conn, "disconnected")
+            else:
+                sock.close()
+
+    def _finish(self, conn: WorkerConnection, job: _RemoteJob) -> None:
+        with self._cond:
+            if conn.jobs.pop(job.id, None) is not None:
+                conn.running -= 1
+                conn.completed += 1
+            self._cond.notify_all()
+        job.done.set()
+
+    def _drop(self, conn: WorkerConnection, reason: str) -> None:
+        with self._cond:
+            if self._workers.get(conn.name) is conn:
+                del self._workers[conn.name]
+            jobs = list(conn.jobs.values())
+            conn.jobs.clear()
+            conn.running = 0
+            self.lost_jobs += len(jobs)
+            self._cond.notify_all()
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.sock.close()
+        for job in jobs:
+            job.error = f"Worker {conn.name} {reason}"
+            job.done.set()
+
+    def _reap_loop(self) -> None:
+        interval = max(0.05, self.heartbeat_timeout / 3)
+        while not self._closed.wait(interval):
+            now = time.monotonic()
+            with self._cond:
+                silent = [
+                    conn
+                    for conn in self._workers.values()
+                    if now - conn.last_seen > self.heartbeat_timeout
+                ]
+            for conn in silent:
+                logger.warning(f"Worker {conn.name} missed heartbeats, dropping it")
+                self._drop(conn, "stopped sending heartbeats")
+
+    def should_dispatch(self, priority: str, labels: Optional[Iterable[str]] = None) -> bool:
+        """True if a command should run on a worker rather than locally."""
+        if labels:
+            return True
+        with self._cond:
+            if not self._workers:
+                return False
+        return self.dispatch == "all" or (self.dispatch == "batch" and priority == "batch")
+
+    def _select(self, labels: FrozenSet[str]) -> Optional[WorkerConnection]:
+        candidates = [conn for conn in self._workers.values() if labels <= conn.labels]
+        if not candidates:
+            raise NoWorkerError(
+                f"No connected worker has labels: {', '.join(sorted(labels))}"
+                if labels
+                else "No workers are connected"
+            )
+        free = [conn for conn in candidates if conn.running < conn.slots]
+        return min(free, key=lambda conn: conn.load) if free else None
+
+    def run(
+        self,
+        command: str,
+        priority: str = DEFAULT_PRIORITY,
+        timeout: float = 30,
+        labels: Optional[Iterable[str]] = None,
+        on_output: Optional[Callable[[str, bytes], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        cwd: Optional[str] = None,
+    ) -> subprocess.CompletedProcess:
+        """
+        Runs an already validated shell command on a worker and waits for it.
+
+        ``on_output(stream, chunk)`` is called from the connection thread for
+        every output chunk as it arrives. ``cwd`` is the directory the command
+        runs in on the worker (the worker's own directory when None); workers
+        refuse directories outside their roots.
+
+        Raises:
+            NoWorkerError: If no matching worker is connected; nothing was sent.
+            WorkerError: If the worker is lost or refuses the command.
+            subprocess.TimeoutExpired: If the command exceeds ``timeout``.
+            CommandCancelled: If ``cancel`` is set first; the worker is told to
+                stop the command and its slot is freed right away.
+        """
+        wanted = frozenset(labels or ())
+        deadline = time.monotonic() + timeout
+        if cancel is not None:
+            cancel.add_callback(self._wake)
+        with self._cond:
+            while True:
+                if cancel is not None and cancel.cancelled:
+                    raise CommandCancelled(f"Command {cancel.reason}")
+                conn = self._select(wanted)
+                if conn is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(command, timeout)
+                self._cond.wait(remaining)
+            job = _RemoteJob(next(self._job_ids), conn, on_output)
+            conn.jobs[job.id] = job
+            conn.running += 1
+            self.dispatched += 1
+
+        spec = {"command": command, "priority": priority, "timeout": timeout, "cwd": cwd}
+        try:
+            conn.send(encode_json_frame(RUN, job.id, spec))
+        except OSError as e:
+            self._drop(conn, f"unreachable ({e})")
+
+        if cancel is not None:
+            cancel.add_callback(job.done.set)
+        remaining = max(0.0, deadline - time.monotonic())
+        # The worker enforces the timeout itself; allow it time to report back
+        if not job.done.wait(remaining + 5):
+            self.cancel(job)
+            raise subprocess.TimeoutExpired(command, timeout)
+        if cancel is not None and cancel.cancelled:
+            self.cancel(job)
+            raise CommandCancelled(f"Command {cancel.reason}")
+        if job.error is not None and job.returncode is None:
+            raise WorkerError(job.error)
+        if job.timed_out:
+            raise subprocess.TimeoutExpired(command, timeout)
+        result = subprocess.CompletedProcess(
+            command,
+            job.returncode,
+            job.stdout.decode("utf-8", errors="replace"),
+            job.stderr.decode("utf-8", errors="replace"),
+        )
+        result.rusage = ResourceUsage.from_dict(job.rusage) if job.rusage else None
+        result.stdout_bytes = len(job.stdout)
+        result.stderr_bytes = len(job.stderr)
+        return result
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def cancel(self, job: _RemoteJob) -> None:
+        """Asks the worker to kill a job and stops waiting for it."""
+        try:
+            job.worker.send(encode_frame(CANCEL, job.id))
+        except OSError:
+            pass
+        self._finish(job.worker, job)
+
+    def buffered_bytes(self) -> int:
+        """Output bytes held for commands still running on workers."""
+        with self._cond:
+            return sum(
+                len(job.stdout) + len(job.stderr)
+                for conn in self._workers.values()
+                for job in conn.jobs.values()
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "address": self.address,
+                "dispatch": self.dispatch,
+                "dispatched": self.dispatched,
+                "lost_jobs": self.lost_jobs,
+                "workers": {name: conn.snapshot() for name, conn in self._workers.items()},
+            }
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.close()
+        with self._cond:
+            workers = list(self._workers.values())
+        for conn in workers:
+            self._drop(conn, "pool closed")
+
+
+class WorkerAgent:
+    """
+    Connects to a server's worker socket and runs dispatched commands.
+
+    Args:
+        address: Server worker address (``unix:/path`` or ``tcp:host:port``).
+        name: Unique worker name reported to the server.
+        labels: Labels the server can target, e.g. ``linux``, ``gpu``.
+        slots: Commands this worker runs at once.
+        directory: Working directory for commands the server sends without one.
+        roots: Directories commands may run in, including subdirectories
+            (default: ``directory``). The server sends each command with its
+            tenant's root; commands outside every root are refused.
+        token: Shared secret matching the server's WORKER_TOKEN. Required over TCP.
+        heartbeat_interval: Seconds between heartbeats.
+        kill_grace: Seconds between SIGTERM and SIGKILL when a command is
+            cancelled or times out.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        name: Optional[str] = None,
+        labels: Iterable[str] = (),
+        slots: int = os.cpu_count() or 1,
+        directory: Optional[str] = None,
+        roots: Iterable[str] = (),
+        token: Optional[str] = None,
+        heartbeat_interval: float = 5.0,
+        kill_grace: float = DEFAULT_KILL_GRACE,
+    ):
+        self.address = address
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.labels = sorted(set(labels))
+        self.slots = max(1, slots)
+        self.directory = os.path.abspath(directory or os.getcwd())
+        self.roots = [os.path.realpath(root) for root in roots or (self.directory,)]
+        self.token = token
+        self.heartbeat_interval = heartbeat_interval
+        self.kill_grace = kill_grace
+        self.shell = os.environ.get("SHELL") or "/bin/sh"
+        self._sock: Optional[socket.socket] = None
+        self._auth: Optional[FrameAuth] = None
+        self._send_lock = threading.Lock()
+        self._processes: Dict[int, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _send(self, frame: bytes) -> None:
+        with self._send_lock:
+            if self._sock is not None:
+                self._sock.sendall(self._auth.sign(frame) if self._auth is not None else frame)
+
+    def connect(self) -> None:
+        """
+        Connects and performs the handshake.
+
+        Raises:
+            WorkerError: If the server rejects the worker or cannot prove it
+                knows the token, or a TCP address is given without a token.
+            OSError: If the server cannot be reached.
+        """
+        family, sockaddr = parse_address(self.address)
+        if family != socket.AF_UNIX and not self.token:
+            raise WorkerError("WORKER_TOKEN must be set to connect over TCP")
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(10)
+            sock.connect(sockaddr)
+            if family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            auth = self._handshake(sock)
+        except BaseException:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        with self._send_lock:
+            self._sock, self._auth = sock, auth
+
+    def _handshake(self, sock: socket.socket) -> Optional[FrameAuth]:
+        nonce = secrets.token_hex(16)
+        hello = {
+            "version": PROTOCOL_VERSION,
+            "name": self.name,
+            "labels": self.labels,
+            "slots": self.slots,
+            "nonce": nonce,
+        }
+        sock.sendall(encode_json_frame(HELLO, 0, hello))
+        frame_type, _, payload = read_frame(sock)
+        auth = None
+        if frame_type == CHALLENGE:
+            if not self.token:
+                raise WorkerError("Server requires a worker token")
+            challenge = json.loads(payload)
+            server_nonce = str(challenge.get("nonce", ""))
+            expected = _proof(self.token, "server", nonce, server_nonce)
+            if not hmac.compare_digest(str(challenge.get("proof", "")).encode(), expected.encode()):
+                raise WorkerError("Server does not know the worker token")
+            proof = _proof(self.token, "worker", server_nonce, nonce)
+            sock.sendall(encode_json_frame(AUTH, 0, {"proof": proof}))
+            auth = FrameAuth.derive(self.token, "worker", server_nonce, nonce)
+            frame_type, _, payload = read_frame(sock)
+        elif frame_type == WELCOME and self.token:
+            raise WorkerError("Server did not authenticate itself with the worker token")
+        if frame_type != WELCOME:
+            reason = json.loads(payload).get("reason") if frame_type == REJECT else "bad reply"
+            raise WorkerError(f"Server rejected worker: {reason}")
+        return auth
+
+    def serve(self) -> None:
+        """Handles frames until the connection closes or stop() is called."""
+        sock = self._sock
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        try:
+            while not self._stop.is_set():
+                frame_type, job_id, payload = read_frame(sock, self._auth)
+                if frame_type == RUN:
+                    threading.Thread(
+                        target=self._run_job,
+                        args=(job_id, json.loads(payload)),
+                        name=f"cli_use-worker-job-{job_id}",
+                        daemon=True,
+                    ).start()
+                elif frame_type == CANCEL:
+                    self._kill(job_id)
+        except (OSError, ConnectionError):
+            if not self._stop.is_set():
+                logger.warning("Connection to server lost")
+        finally:
+            self._disconnect()
+
+    def run_forever(self, reconnect_delay: float = 2.0) -> None:
+        """Connects, serves, and reconnects with backoff until stop() is called."""
+        delay = reconnect_delay
+        while not self._stop.is_set():
+            try:
+                self.connect()
+            except WorkerError:
+                raise
+            except OSError as e:
+                logger.warning(f"Cannot reach {self.address}: {e}; retrying in {delay:.0f}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 60)
+                continue
+            logger.info(f"Worker {self.name} connected to {self.address}")
+            delay = reconnect_delay
+            self.serve()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._disconnect()
+
+    def _disconnect(self) -> None:
+        with self._send_lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        with self._lock:
+            job_ids = list(self._processes)
+        # Commands are not resumable on another connection
+        for job_id in job_ids:
+            self._kill(job_id)
+
+    def _heartbeat_loop(self) -> None:
+        sock = self._sock
+        while not self._stop.wait(self.heartbeat_interval) and self._sock is sock:
+            try:
+                with self._lock:
+                    running = len(self._processes)
+                self._send(encode_json_frame(HEARTBEAT, 0, {"running": running}))
+            except OSError:
+                return
+
+    def _kill(self, job_id: int) -> None:
+        with self._lock:
+            process = self._processes.get(job_id)
+        # Not poll(): it could reap the child before wait4 collects its usage
+        if process is not None and process.returncode is None:
+            # The job thread reaps the child; the grace period must not
+            # block the connection thread
+            threading.Thread(
+                target=terminate_process_group,
+                args=(process.pid, self.kill_grace),
+                daemon=True,
+            ).start()
+
+    def _pump(self, job_id: int, pipe, frame_type: int) -> None:
+        try:
+            for chunk in iter(lambda: pipe.read1(OUTPUT_CHUNK_SIZE), b""):
+                self._send(encode_frame(frame_type, job_id, chunk))
+        except (OSError, ValueError):
+            pass
+
+    def _job_directory(self, spec: Dict[str, Any]) -> str:
+        """
+        Resolves the directory a job runs in.
+
+        Raises:
+            ValueError: If it is outside every root or does not exist here.
+        """
+        directory = os.path.realpath(spec.get("cwd") or self.directory)
+        if not any(os.path.commonpath([directory, root]) == root for root in self.roots):
+            raise ValueError(f"Directory {directory} is outside the roots of worker {self.name}")
+        if not os.path.isdir(directory):
+            raise ValueError(f"Directory {directory} does not exist on worker {self.name}")
+        return directory
+
+    def _run_job(self, job_id: int, spec: Dict[str, Any]) -> None:
+        status: Dict[str, Any] = {"returncode": None, "timed_out": False}
+        priority = spec.get("priority") if spec.get("priority") in PRIORITY_CLASSES else DEFAULT_PRIORITY
+        argv = priority_prefix(priority) + [self.shell, "-c", spec["command"]]
+        try:
+            directory = self._job_directory(spec)
+        except ValueError as e:
+            status["error"] = str(e)
+            self._send_exit(job_id, status)
+            return
+        try:
+            process = subprocess.Popen(
+                argv,
+                cwd=directory,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,
+            )
+        except OSError as e:
+            status["error"] = f"Cannot start command: {e}"
+            self._send_exit(job_id, status)
+            return
+
+        with self._lock:
+            self._processes[job_id] = process
+        pumps = [
+            threading.Thread(target=self._pump, args=(job_id, process.stdout, STDOUT), daemon=True),
+            threading.Thread(target=self._pump, args=(job_id, process.stderr, STDERR), daemon=True),
+        ]
+        for pump in pumps:
+            pump.start()
+        timeout = float(spec.get("timeout") or 30)
+        deadline = time.monotonic() + timeout
+        try:
+            usage = wait_with_rusage(process, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            status["timed_out"] = True
+            self._kill(job_id)
+            usage = wait_with_rusage(process)
+        status["returncode"] = process.returncode
+        status["rusage"] = usage.to_dict() if usage is not None else None
+        # Background processes can hold the pipes open after the command
+        # exited; the timeout covers them too
+        for pump in pumps:
+            pump.join(max(0.0, deadline - time.monotonic()))
+        if any(pump.is_alive() for pump in pumps):
+            status["timed_out"] = True
+            terminate_process_group(process.pid, self.kill_grace)
+            for pump in pumps:
+                pump.join(max(1.0, deadline + self.kill_grace - time.monotonic()))
+        with self._lock:
+            self._processes.pop(job_id, None)
+        self._send_exit(job_id, status)
+
+    def _send_exit(self, job_id: int, status: Dict[str, Any]) -> None:
+        try:
+            self._send(encode_json_frame(EXIT, job_id, status))
+        except OSError:
+            pass
@@ -0,0 +1,112 @@
+import os
+import importlib
+import asyncio
+import json
+import logging
+import tempfile
+import unittest
+
+from cli_use import audit as audit_module
+from cli_use.audit import AuditLogger
+
+
+class TestAuditLogger(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "audit.jsonl")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _read(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_writes_json_lines(self):
+        logger = AuditLogger(self.path)
+        logger.record("ls -l", "allowed", 0.0125, exit_code=0, stdout_bytes=42)
+        logger.record("rm -rf /", "denied", 0.001, reason="Command 'rm' is not allowed")
+        logger.close()
+        records = self._read()
+        self.assertEqual([r["decision"] for r in records], ["allowed", "denied"])
+        self.assertEqual(records[0]["stdout_bytes"], 42)
+        self.assertEqual(records[0]["duration_ms"], 12.5)
+        self.assertEqual(records[1]["reason"], "Command 'rm' is not allowed")
+
+    def test_sampling_keeps_failures(self):
+        logger = AuditLogger(self.path, sample_rate=0.0)
+        for _ in range(10):
+            logger.record("ls", "allowed", 0.01, exit_code=0)
+        logger.record("false", "allowed", 0.01, exit_code=1)
+        logger.record("rm", "denied", 0.01)
+        logger.close()
+        self.assertEqual([r["command"] for r in self._read()], ["false", "rm"])
+        self.assertEqual(logger.sampled_out, 10)
+
+    def test_disabled_without_path(self):
+        logger = AuditLogger(None)
+        self.assertFalse(logger.enabled)
+        logger.record("ls", "allowed", 0.01, exit_code=0)
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def setUp(self):
+        self.level = logging.getLogger().level
+
+    def tearDown(self):
+        logging.getLogger().setLevel(self.level)
+        os.environ.pop("LOG_LEVEL", None)
+        os.environ.pop("VERBOSE", None)
+
+    def test_log_level_and_verbose_are_honoured(self):
+        os.environ["LOG_LEVEL"] = "warn"
+        audit_module.configure_logging()
+        self.assertEqual(logging.getLogger().level, logging.WARNING)
+        os.environ["VERBOSE"] = "true"
+        audit_module.configure_logging()
+        self.assertEqual(logging.getLogger().level, logging.DEBUG)
+
+
+class TestRunCommandAudit(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "audit.jsonl")
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["AUDIT_LOG_FILE"] = self.path
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("AUDIT_LOG_FILE", None)
+        self.server.audit.close()
+        self.tempdir.cleanup()
+
+    def test_run_command_is_audited(self):
+        asyncio.run(self.server.handle_call_tool("run_command", {"command": "pwd"}))
+        asyncio.run(self.server.handle_call_tool("run_command", {"command": "rm x"}))
+        self.server.audit.close()
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0]["command"], "pwd")
+        self.assertEqual(records[0]["decision"], "allowed")
+        self.assertEqual(records[0]["exit_code"], 0)
+        self.assertGreater(records[0]["stdout_bytes"], 0)
+        self.assertEqual(records[1]["decision"], "denied")
+
+    def test_output_size_is_counted_in_bytes(self):
+        text = "grüße ✓\n"
+        with open(os.path.join(self.tempdir.name, "note.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        asyncio.run(self.server.handle_call_tool("run_command", {"command": "cat note.txt"}))
+        self.server.audit.close()
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0]["stdout_bytes"], len(text.encode()))
+
+
+if __name__ == "__main__":
+    unittest.main()
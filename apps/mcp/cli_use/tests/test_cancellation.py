@@ -0,0 +1,236 @@
+import os
+import importlib
+import asyncio
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+import uvicorn
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from cli_use.cancellation import (
+    CancelToken,
+    CommandCancelled,
+    InFlightCalls,
+    terminate_process_group,
+)
+from cli_use.rusage import run_with_rusage
+
+
+def group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def processes_with(marker):
+    """Pids of processes whose command line contains ``marker``."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+            with open(f"/proc/{entry}/stat") as f:
+                state = f.read().rsplit(")", 1)[1].split()[0]
+        except OSError:
+            continue
+        if marker.encode() in cmdline and state != "Z":
+            pids.append(int(entry))
+    return pids
+
+
+class TestTerminateProcessGroup(unittest.TestCase):
+    def start(self, script):
+        process = subprocess.Popen(
+            ["sh", "-c", script], stdout=subprocess.PIPE, start_new_session=True
+        )
+        self.assertEqual(process.stdout.readline(), b"ready\n")
+        return process
+
+    def test_sigterm_stops_the_whole_group(self):
+        process = self.start("sleep 30 & echo ready; wait")
+        killed = terminate_process_group(process.pid, grace=5, reap=process.poll)
+        self.assertFalse(killed)
+        self.assertFalse(group_alive(process.pid))
+        process.stdout.close()
+
+    def test_sigkill_after_grace_period(self):
+        process = self.start("trap '' TERM; sleep 30 & echo ready; wait")
+        started = time.monotonic()
+        killed = terminate_process_group(process.pid, grace=0.3, reap=process.poll)
+        self.assertTrue(killed)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        process.wait()
+        self.assertTrue(wait_for(lambda: not group_alive(process.pid)))
+        process.stdout.close()
+
+
+class TestRunWithCancel(unittest.TestCase):
+    def test_cancel_stops_command_and_descendants(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pidfile = os.path.join(tempdir, "pid")
+            cancel = CancelToken()
+            threading.Timer(0.3, cancel.cancel).start()
+            started = time.monotonic()
+            with self.assertRaises(CommandCancelled):
+                run_with_rusage(["sh", "-c", f"echo $$ > {pidfile}; sleep 30 & wait"], cancel=cancel)
+            self.assertLess(time.monotonic() - started, 2)
+            with open(pidfile) as f:
+                pgid = int(f.read())
+        self.assertTrue(wait_for(lambda: not group_alive(pgid), timeout=1))
+
+    def test_cancelled_token_runs_callbacks_once(self):
+        cancel = CancelToken()
+        calls = []
+        cancel.add_callback(lambda: calls.append("early"))
+        cancel.cancel("disconnected")
+        cancel.cancel()
+        cancel.add_callback(lambda: calls.append("late"))
+        self.assertEqual(calls, ["early", "late"])
+        self.assertEqual(cancel.reason, "disconnected")
+
+
+class TestInFlightCalls(unittest.TestCase):
+    def test_release_cancels_calls_of_the_connection(self):
+        calls = InFlightCalls()
+
+        async def call():
+            with calls.track():
+                await asyncio.sleep(30)
+
+        async def connection():
+            token = calls.bind()
+            task = asyncio.create_task(call())
+            await asyncio.sleep(0.01)
+            self.assertEqual(calls.snapshot()["running"], 1)
+            self.assertEqual(calls.release(token), 1)
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(connection())
+        snapshot = calls.snapshot()
+        self.assertEqual(snapshot["running"], 0)
+        self.assertEqual(snapshot["connections"], 0)
+        self.assertEqual(snapshot["cancelled"], 1)
+        self.assertEqual(snapshot["cancelled_on_disconnect"], 1)
+
+
+class ServerTestCase(unittest.TestCase):
+    marker = "41.5"
+
+    def setUp(self):
+        if not os.path.isdir("/proc"):
+            self.skipTest("needs /proc to find the command's processes")
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["ALLOWED_COMMANDS"] = "sleep"
+        os.environ["KILL_GRACE_PERIOD"] = "1"
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        for key in ("ALLOWED_COMMANDS", "KILL_GRACE_PERIOD"):
+            os.environ.pop(key, None)
+        self.tempdir.cleanup()
+
+    def assert_reclaimed(self):
+        self.assertTrue(wait_for(lambda: not processes_with(self.marker), timeout=3))
+        self.assertTrue(
+            wait_for(lambda: not any(self.server.scheduler.snapshot()["running"].values()))
+        )
+        self.assertEqual(self.server.admission.snapshot()["global"]["processes"], 0)
+        self.assertEqual(self.server.in_flight.snapshot()["running"], 0)
+
+
+class TestCancelRunCommand(ServerTestCase):
+    def test_cancelled_call_stops_the_process_and_frees_its_slot(self):
+        async def scenario():
+            task = asyncio.create_task(
+                self.server.handle_call_tool("run_command", {"command": f"sleep {self.marker}"})
+            )
+            deadline = time.monotonic() + 5
+            while not processes_with(self.marker) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            self.assertTrue(processes_with(self.marker))
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The process slot is returned before the process is gone
+            self.assertEqual(self.server.admission.snapshot()["global"]["processes"], 0)
+
+        started = time.monotonic()
+        asyncio.run(scenario())
+        self.assert_reclaimed()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.server.in_flight.snapshot()["cancelled"], 1)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestDisconnect(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        import cli_use.cli as cli
+
+        self.port = free_port()
+        config = uvicorn.Config(
+            cli.create_sse_app(self.port), host="127.0.0.1", port=self.port, log_level="warning"
+        )
+        self.uvicorn = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.uvicorn.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.uvicorn.started and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def tearDown(self):
+        self.uvicorn.should_exit = True
+        self.thread.join(timeout=10)
+        super().tearDown()
+
+    def test_disconnect_stops_running_commands(self):
+        async def scenario():
+            async with sse_client(f"http://127.0.0.1:{self.port}/sse") as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    call = asyncio.create_task(
+                        session.call_tool("run_command", {"command": f"sleep {self.marker}"})
+                    )
+                    deadline = time.monotonic() + 5
+                    while not processes_with(self.marker) and time.monotonic() < deadline:
+                        await asyncio.sleep(0.01)
+                    self.assertTrue(processes_with(self.marker))
+                    # Leaving the contexts drops the connection mid-call
+                    call.cancel()
+
+        asyncio.run(scenario())
+        self.assert_reclaimed()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import importlib
+import asyncio
+import json
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from cli_use.coalesce import SingleFlight, matches_command, normalize_command
+
+
+class TestKeys(unittest.TestCase):
+    def test_normalize_command(self):
+        self.assertEqual(normalize_command("git   status"), "git status")
+        self.assertEqual(normalize_command("git 'status'"), "git status")
+        self.assertEqual(normalize_command("cat 'a b.txt'"), "cat 'a b.txt'")
+
+    def test_only_read_only_commands_get_keys(self):
+        flight = SingleFlight(enabled=True, patterns=["ls", "git status*"])
+        self.assertEqual(flight.key_for("git  status", "/repo"), ("/repo", "git status"))
+        self.assertIsNone(flight.key_for("git push", "/repo"))
+        self.assertIsNone(flight.key_for("ls > out.txt", "/repo"))
+        self.assertTrue(matches_command("ls -l", ["ls"]))
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(SingleFlight(patterns=["ls"]).key_for("ls", "/repo"))
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight(enabled=True)
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(scenario()), ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.snapshot()["hits"], 4)
+        self.assertEqual(flight.snapshot()["in_flight"], 0)
+
+    def test_exception_reaches_every_waiter_and_key_is_released(self):
+        flight = SingleFlight(enabled=True)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def scenario():
+            return await asyncio.gather(
+                flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+            )
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertFalse(flight.in_flight("key"))
+
+    def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        flight = SingleFlight(enabled=True)
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            first = asyncio.create_task(flight.do("key", work))
+            second = asyncio.create_task(flight.do("key", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+
+    def test_last_cancelled_waiter_cancels_shared_call(self):
+        flight = SingleFlight(enabled=True)
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def scenario():
+            waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            waiters[0].cancel()
+            await asyncio.sleep(0.01)
+            self.assertEqual(cancelled, [])
+            waiters[1].cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        asyncio.run(scenario())
+        self.assertEqual(cancelled, [True])
+        self.assertFalse(flight.in_flight("key"))
+
+    def test_on_done_follows_the_execution_not_the_caller(self):
+        flight = SingleFlight(enabled=True)
+        released = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            first = asyncio.create_task(flight.do("key", work, on_done=lambda: released.append(1)))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(flight.do("key", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            await asyncio.sleep(0.01)
+            # The originator left, but the execution it started still runs
+            self.assertEqual(released, [])
+            result = await second
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+        self.assertEqual(released, [1])
+
+
+class TestCoalescingInTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["COALESCE_COMMANDS"] = "true"
+        os.environ["MAX_SESSION_PROCESSES"] = "2"
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("COALESCE_COMMANDS", None)
+        os.environ.pop("MAX_SESSION_PROCESSES", None)
+        self.tempdir.cleanup()
+
+    def test_identical_commands_spawn_once(self):
+        executions = []
+        lock = threading.Lock()
+
+        def fake_execute(command_string, priority, labels=None, output_mode=None, cancel=None):
+            with lock:
+                executions.append(command_string)
+            time.sleep(0.1)
+            return subprocess.CompletedProcess(command_string, 0, "listing\n", "")
+
+        self.server.executor.execute = fake_execute
+
+        async def scenario():
+            return await asyncio.gather(
+                *(
+                    self.server.handle_call_tool("run_command", {"command": command})
+                    for command in ("ls -l", "ls  -l", "ls -l", "pwd")
+                )
+            )
+
+        results = asyncio.run(scenario())
+        # Two session slots are enough: joined requests take no slot
+        self.assertTrue(all(result[0].text == "listing\n" for result in results))
+        self.assertEqual(sorted(executions), ["ls -l", "pwd"])
+
+        stats = json.loads(
+            asyncio.run(self.server.handle_call_tool("show_stats", {}))[0].text
+        )
+        self.assertEqual(stats["coalescing"]["hits"], 2)
+        self.assertEqual(stats["coalescing"]["executions"], 2)
+
+    def test_slot_is_held_while_a_joined_execution_runs(self):
+        def fake_execute(command_string, priority, labels=None, output_mode=None, cancel=None):
+            time.sleep(0.3)
+            return subprocess.CompletedProcess(command_string, 0, "listing\n", "")
+
+        self.server.executor.execute = fake_execute
+        admission = self.server.admission
+
+        async def scenario():
+            call = lambda: self.server.handle_call_tool("run_command", {"command": "ls -l"})
+            first = asyncio.create_task(call())
+            await asyncio.sleep(0.05)
+            second = asyncio.create_task(call())
+            await asyncio.sleep(0.05)
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            self.assertEqual(admission.snapshot()["global"]["processes"], 1)
+            result = await second
+            await asyncio.sleep(0)
+            return result
+
+        result = asyncio.run(scenario())
+        self.assertEqual(result[0].text, "listing\n")
+        self.assertEqual(admission.snapshot()["global"]["processes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+import os
+import importlib
+import asyncio
+import json
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from cli_use.interactive import (
+    OutputRing,
+    PtySessionConfig,
+    PtySessionManager,
+    SessionError,
+    _complete_utf8,
+)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class TestOutputRing(unittest.TestCase):
+    def test_keeps_the_last_bytes_by_absolute_offset(self):
+        ring = OutputRing(8)
+        ring.append(b"0123456789")
+        ring.append(b"ab")
+        self.assertEqual((ring.start, ring.end, len(ring)), (4, 12, 8))
+        self.assertEqual(ring.read(0, 100), (b"456789ab", 4))
+        self.assertEqual(ring.read(10, 1), (b"a", 10))
+        self.assertEqual(ring.read(50, 10), (b"", 12))
+
+    def test_incomplete_utf8_is_held_back(self):
+        data = "héllo ✓".encode()
+        self.assertEqual(_complete_utf8(data), len(data))
+        self.assertEqual(_complete_utf8(data[:-1]), len(data) - 3)
+        self.assertEqual(_complete_utf8(data[:2]), 1)
+
+
+class TestPtySessionManager(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.manager = PtySessionManager(
+            PtySessionConfig(max_sessions=2, buffer_bytes=4096, idle_timeout=0, kill_grace=0.5)
+        )
+
+    def tearDown(self):
+        self.manager.close_all()
+        self.tempdir.cleanup()
+
+    def open(self, command="/bin/sh", **kwargs):
+        return self.manager.open(
+            ["/bin/sh", "-c", command] if command != "/bin/sh" else ["/bin/sh"],
+            self.tempdir.name,
+            dict(os.environ, PS1="$ "),
+            command,
+            "tenant",
+            **kwargs,
+        )
+
+    def read_until(self, session, text, offset=0, timeout=5.0):
+        output = []
+
+        def ready():
+            nonlocal offset
+            chunk, _, offset = self.manager.read(session.id, "tenant", offset)
+            output.append(chunk)
+            return text in "".join(output)
+
+        self.assertTrue(wait_for(ready, timeout), "".join(output))
+        return "".join(output), offset
+
+    def test_program_is_started_once_and_driven_repeatedly(self):
+        session = self.open(rows=40, cols=120)
+        offset = self.manager.write(session.id, "tenant", b"stty size\r")
+        _, offset = self.read_until(session, "40 120", offset)
+        offset = self.manager.write(session.id, "tenant", b"echo $((6 * 7))\r")
+        _, offset = self.read_until(session, "42", offset)
+        self.assertEqual(session.status()["running"], True)
+
+    def test_large_input_is_written_while_the_output_is_drained(self):
+        session = self.open("cat")
+        # Far more than the terminal buffers; cat's output (and the echo of
+        # the input) has to be drained while the input is being written
+        data = (b"x" * 99 + b"\r") * 3000
+        started = time.monotonic()
+        self.manager.write(session.id, "tenant", data, timeout=5)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(wait_for(lambda: session.output.end >= 2 * len(data)))
+
+    def test_output_is_bounded_and_reads_skip_dropped_output(self):
+        session = self.open("yes | head -c 100000; echo; echo done")
+        self.assertTrue(wait_for(lambda: session.closed))
+        self.assertLessEqual(self.manager.buffered_bytes(), 4096)
+        text, start, end = self.manager.read(session.id, "tenant", 0)
+        self.assertGreater(start, 0)
+        self.assertTrue(text.rstrip().endswith("done"))
+        self.assertEqual(end, session.output.end)
+
+    def test_close_stops_the_process_group(self):
+        session = self.open("sleep 30 & sleep 30")
+        self.assertTrue(process_alive(session.pid))
+        self.manager.close(session.id, "tenant")
+        self.assertFalse(process_alive(session.pid))
+        with self.assertRaises(SessionError):
+            self.manager.get(session.id, "tenant")
+        self.assertTrue(wait_for(lambda: session.closed))
+
+    def test_sessions_are_scoped_by_owner_and_limited(self):
+        session = self.open()
+        with self.assertRaises(SessionError):
+            self.manager.read(session.id, "other", 0)
+        self.open()
+        with self.assertRaises(SessionError):
+            self.open()
+
+    def test_exited_session_is_freed_once_its_output_is_read(self):
+        exits = []
+        session = self.manager.open(
+            ["/bin/sh", "-c", "echo bye"],
+            self.tempdir.name,
+            dict(os.environ),
+            "echo bye",
+            "tenant",
+            on_exit=lambda: exits.append(session.pid),
+        )
+        self.open()
+        self.assertTrue(wait_for(lambda: session.closed and session.reap()))
+        self.assertEqual(exits, [session.pid])
+        # Unread output keeps the session, and its slot
+        time.sleep(1.2)
+        self.assertEqual(self.manager.snapshot()["open"], 2)
+        self.read_until(session, "bye")
+        self.assertTrue(wait_for(lambda: self.manager.snapshot()["finished"] == 1))
+        with self.assertRaises(SessionError):
+            self.manager.get(session.id, "tenant")
+        self.open()
+        self.assertEqual(exits, [session.pid])
+
+    def test_idle_sessions_are_evicted(self):
+        self.manager.config.idle_timeout = 0.3
+        session = self.open()
+        self.assertTrue(wait_for(lambda: not process_alive(session.pid), timeout=5))
+        snapshot = self.manager.snapshot()
+        self.assertEqual((snapshot["open"], snapshot["evicted"]), (0, 1))
+
+
+class TestSessionTools(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["PTY_SESSION_COMMANDS"] = "cat,python3"
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        self.server.pty_sessions.close_all()
+        os.environ.pop("PTY_SESSION_COMMANDS", None)
+        os.environ.pop("ALLOW_SHELL_OPERATORS", None)
+        self.tempdir.cleanup()
+
+    def call(self, name, **arguments):
+        return asyncio.run(self.server.handle_call_tool(name, arguments))
+
+    @staticmethod
+    def status(result):
+        return json.loads(result[-1].text.split("Session status: ", 1)[1])
+
+    def test_open_send_read_close(self):
+        opened = self.status(self.call("open_session", command="cat", rows=30, cols=100))
+        self.assertEqual((opened["rows"], opened["cols"], opened["running"]), (30, 100, True))
+        session = opened["session"]
+
+        sent = self.status(self.call("send_input", session=session, input="hello\r"))
+        # A waiting read returns as soon as some output is there
+        text, offset = "", sent["offset"]
+        deadline = time.monotonic() + 5
+        while text.count("hello") < 2 and time.monotonic() < deadline:
+            result = self.call("read_session", session=session, offset=offset, wait=1)
+            read = self.status(result)
+            self.assertEqual(read["skipped"], 0)
+            text += result[0].text if len(result) == 2 else ""
+            offset = read["offset"]
+        # The terminal echoes the input, then cat prints it back
+        self.assertEqual(text, "hello\nhello\n")
+
+        result = self.call("read_session", session=session, offset=read["offset"])
+        self.assertEqual(len(result), 1)
+        self.assertEqual(self.status(result)["offset"], read["offset"])
+
+        self.assertEqual(self.server.admission.snapshot()["global"]["processes"], 1)
+        closed = self.status(self.call("close_session", session=session))
+        self.assertTrue(closed["closed"])
+        result = self.call("read_session", session=session)
+        self.assertIn("Unknown session", result[0].text)
+        self.assertEqual(self.server.collect_stats()["pty_sessions"]["closed"], 1)
+        # The program's process slot is released with it
+        self.assertEqual(self.server.admission.snapshot()["global"]["processes"], 0)
+
+    def test_only_listed_single_programs_can_be_opened(self):
+        os.environ["ALLOW_SHELL_OPERATORS"] = "true"
+        self.server = importlib.reload(self.server)
+        for command in ("ls", "cat | ls"):
+            result = self.call("open_session", command=command)
+            self.assertTrue(result[0].error, command)
+            self.assertIn("Security violation", result[0].text)
+        self.assertEqual(self.server.pty_sessions.snapshot()["opened"], 0)
+
+    def test_sessions_take_process_slots(self):
+        self.server.admission.config.max_processes = 1
+        opened = self.status(self.call("open_session", command="cat"))
+        result = self.call("open_session", command="cat")
+        self.assertIn("Rejected: global process limit reached", result[0].text)
+        result = self.call("run_command", command="ls")
+        self.assertIn("Rejected", result[0].text)
+        self.call("close_session", session=opened["session"])
+        self.assertIn("return code: 0", self.call("run_command", command="ls")[-1].text)
+
+    def test_input_is_audited(self):
+        session = self.status(self.call("open_session", command="cat"))["session"]
+        with mock.patch.object(self.server.audit, "record") as record:
+            self.call("send_input", session=session, input="secret()\r")
+        record.assert_called_once()
+        args, fields = record.call_args
+        self.assertEqual(args[:2], ("cat", "allowed"))
+        self.assertEqual((fields["session"], fields["input_bytes"]), (session, 9))
+        self.assertNotIn("input", fields)
+
+    def test_policy_applies_to_sessions(self):
+        result = self.call("open_session", command="python3")
+        self.assertTrue(result[0].error)
+        self.assertIn("Security violation", result[0].text)
+        self.assertEqual(self.server.pty_sessions.snapshot()["open"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import importlib.util
+import time
+import unittest
+
+from cli_use.loopwatch import LagHistogram, LoopWatchdog, run_with_loop
+
+HAS_UVLOOP = importlib.util.find_spec("uvloop") is not None
+
+
+def block_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+class TestLagHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = LagHistogram(buckets=(0.01, 0.1))
+        for value in (0.001, 0.01, 0.05, 3.0):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["buckets"], {"0.01": 2, "0.1": 3, "+Inf": 4})
+        self.assertEqual(snapshot["max"], 3.0)
+
+
+class TestLoopWatchdog(unittest.TestCase):
+    def test_blocking_call_is_reported_with_its_stack(self):
+        stalls = []
+        watchdog = LoopWatchdog(
+            interval=0.02, threshold=0.05, on_stall=lambda lag, stack: stalls.append(stack)
+        )
+
+        async def scenario():
+            watchdog.start()
+            await asyncio.sleep(0.1)
+            block_loop(0.3)
+            await asyncio.sleep(0.1)
+            watchdog.stop()
+
+        asyncio.run(scenario())
+        self.assertGreaterEqual(watchdog.stalls, 1)
+        self.assertIn("block_loop", stalls[0])
+        snapshot = watchdog.snapshot()
+        self.assertEqual(snapshot["loop"], "asyncio")
+        self.assertGreaterEqual(snapshot["lag_seconds"]["max"], 0.2)
+        self.assertGreater(snapshot["lag_seconds"]["count"], 2)
+
+    def test_idle_loop_has_no_stalls(self):
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.2)
+
+        async def scenario():
+            watchdog.start()
+            await asyncio.sleep(0.15)
+            watchdog.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(watchdog.stalls, 0)
+        self.assertGreater(watchdog.histogram.count, 3)
+
+    def test_restarts_on_a_new_loop(self):
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.2)
+
+        async def scenario():
+            watchdog.start()
+            await asyncio.sleep(0.05)
+            return watchdog.histogram.count
+
+        first = asyncio.run(scenario())
+        second = asyncio.run(scenario())
+        watchdog.stop()
+        self.assertGreater(second, first)
+
+
+class TestRunWithLoop(unittest.TestCase):
+    async def _answer(self):
+        return type(asyncio.get_running_loop()).__module__
+
+    def test_asyncio(self):
+        self.assertTrue(run_with_loop(self._answer(), "asyncio").startswith("asyncio"))
+
+    def test_unknown_loop(self):
+        coro = self._answer()
+        with self.assertRaises(ValueError):
+            run_with_loop(coro, "trio")
+        coro.close()
+
+    @unittest.skipIf(HAS_UVLOOP, "uvloop is installed")
+    def test_missing_uvloop(self):
+        with self.assertRaises(RuntimeError):
+            run_with_loop(self._answer(), "uvloop")
+
+    @unittest.skipUnless(HAS_UVLOOP, "uvloop is not installed")
+    def test_uvloop(self):
+        self.assertTrue(run_with_loop(self._answer(), "uvloop").startswith("uvloop"))
+
+
+if __name__ == "__main__":
+    unittest.main()
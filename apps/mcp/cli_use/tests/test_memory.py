@@ -0,0 +1,124 @@
+import os
+import importlib
+import asyncio
+import json
+import tempfile
+import tracemalloc
+import unittest
+
+from starlette.testclient import TestClient
+
+from cli_use.memory import MemoryDiagnostics
+
+
+def allocate_blocks(count: int) -> list:
+    return [bytearray(1024) for _ in range(count)]
+
+
+class TestMemoryDiagnostics(unittest.TestCase):
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_disabled_reports_are_refused(self):
+        diagnostics = MemoryDiagnostics()
+        diagnostics.start()
+        self.assertFalse(tracemalloc.is_tracing())
+        with self.assertRaises(RuntimeError):
+            diagnostics.report()
+        self.assertIn("rss_bytes", diagnostics.snapshot())
+
+    def test_top_sites_and_diff(self):
+        diagnostics = MemoryDiagnostics(enabled=True)
+        diagnostics.start()
+        first = diagnostics.report()
+        self.assertNotIn("diff", first)
+
+        kept = allocate_blocks(2000)
+        second = diagnostics.report(limit=5)
+        self.assertTrue(any(__file__ in entry["site"] for entry in second["top"]))
+        growth = [entry for entry in second["diff"] if __file__ in entry["site"]]
+        self.assertTrue(growth)
+        self.assertGreaterEqual(growth[0]["size_diff_bytes"], 2000 * 1024)
+        del kept
+
+    def test_invalid_grouping(self):
+        with self.assertRaises(ValueError):
+            MemoryDiagnostics(enabled=True).report(group_by="module")
+
+    def test_request_peaks_and_gauges(self):
+        diagnostics = MemoryDiagnostics(enabled=True, track_requests=True)
+        diagnostics.start()
+        diagnostics.register_gauge("sessions", lambda: 3)
+        diagnostics.register_gauge("broken", lambda: 1 / 0)
+        with diagnostics.track_request("run_command"):
+            allocate_blocks(1000)
+        snapshot = diagnostics.snapshot()
+        self.assertEqual(snapshot["gauges"], {"sessions": 3, "broken": -1})
+        peaks = snapshot["request_peaks"]["run_command"]
+        self.assertEqual((peaks["count"], peaks["overlapped"]), (1, 0))
+        self.assertGreaterEqual(peaks["max_bytes"], 1000 * 1024)
+
+    def test_overlapping_requests_are_marked_approximate(self):
+        diagnostics = MemoryDiagnostics(enabled=True, track_requests=True)
+        diagnostics.start()
+        with diagnostics.track_request("outer"):
+            with diagnostics.track_request("inner"):
+                pass
+        with diagnostics.track_request("alone"):
+            pass
+        peaks = diagnostics.snapshot()["request_peaks"]
+        self.assertEqual(
+            {name: stats["overlapped"] for name, stats in peaks.items()},
+            {"outer": 1, "inner": 1, "alone": 0},
+        )
+
+
+class TestMemoryEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+
+    def tearDown(self):
+        os.environ.pop("DEBUG_MEMORY", None)
+        os.environ.pop("DEBUG_MEMORY_REQUESTS", None)
+        tracemalloc.stop()
+        self.tempdir.cleanup()
+
+    def _load(self):
+        import cli_use.server as server_module
+        from cli_use import cli
+
+        server = importlib.reload(server_module)
+        return server, TestClient(cli.create_sse_app(0))
+
+    def test_endpoint_is_opt_in(self):
+        server, client = self._load()
+        self.assertEqual(client.get("/debug/memory").status_code, 404)
+        tools = asyncio.run(server.handle_list_tools())
+        self.assertNotIn("debug_memory", [tool.name for tool in tools])
+
+    def test_endpoint_and_tool_report_allocations(self):
+        os.environ["DEBUG_MEMORY"] = "true"
+        os.environ["DEBUG_MEMORY_REQUESTS"] = "true"
+        server, client = self._load()
+
+        response = client.get("/debug/memory?limit=5")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertLessEqual(len(body["top"]), 5)
+        self.assertEqual(body["gauges"]["sessions"], 0)
+        self.assertIn("buffered_output_bytes", body["gauges"])
+        self.assertEqual(client.get("/debug/memory?group_by=x").status_code, 400)
+
+        asyncio.run(server.handle_call_tool("run_command", {"command": "pwd"}))
+        result = asyncio.run(server.handle_call_tool("debug_memory", {"limit": 3}))
+        self.assertIn("diff", json.loads(result[0].text))
+        stats = json.loads(asyncio.run(server.handle_call_tool("show_stats", {}))[0].text)
+        self.assertEqual(stats["memory"]["request_peaks"]["run_command"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import signal
+import importlib
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import unittest
+
+from cli_use.policy import PolicyStore, install_sighup_handler
+
+
+class TestPolicyStore(unittest.TestCase):
+    def test_reload_swaps_and_notifies(self):
+        store = PolicyStore(lambda version: {"version": version})
+        seen = []
+        store.subscribe(seen.append)
+        old = store.current
+        new = store.reload()
+        self.assertEqual(old, {"version": 1})
+        self.assertEqual(new, {"version": 2})
+        self.assertIs(store.current, new)
+        self.assertEqual(seen, [new])
+
+    def test_overlapping_reloads_notify_in_version_order(self):
+        store = PolicyStore(lambda version: {"version": version})
+        installed = []
+
+        def listener(policy):
+            # The first reload's listener is slow; a second reload overlaps it
+            if policy["version"] == 2:
+                time.sleep(0.2)
+            installed.append(policy)
+
+        store.subscribe(listener)
+        first = threading.Thread(target=store.reload)
+        first.start()
+        time.sleep(0.05)
+        store.reload()
+        first.join()
+        self.assertEqual([p["version"] for p in installed], [2, 3])
+        self.assertIs(installed[-1], store.current)
+
+    def test_failed_reload_keeps_current_policy(self):
+        calls = []
+
+        def loader(version):
+            calls.append(version)
+            if version > 1:
+                raise ValueError("broken policy")
+            return {"version": version}
+
+        store = PolicyStore(loader)
+        with self.assertRaises(ValueError):
+            store.reload()
+        self.assertEqual(store.current, {"version": 1})
+        self.assertEqual(store.version, 1)
+        self.assertEqual(store.last_error, "broken policy")
+
+    @unittest.skipUnless(hasattr(signal, "SIGHUP"), "SIGHUP is not available")
+    def test_sighup_reloads_off_the_event_loop(self):
+        release = threading.Event()
+
+        def loader(version):
+            if version > 1:
+                release.wait(5)
+            return {"version": version}
+
+        store = PolicyStore(loader)
+
+        async def scenario():
+            install_sighup_handler(lambda: [store])
+            try:
+                os.kill(os.getpid(), signal.SIGHUP)
+                # The loop keeps running while the loader is blocked
+                started = time.monotonic()
+                await asyncio.sleep(0.2)
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertEqual(store.version, 1)
+                release.set()
+                deadline = time.monotonic() + 5
+                while store.version == 1 and time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+            finally:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+
+        asyncio.run(scenario())
+        self.assertEqual(store.current, {"version": 2})
+
+    def test_check_for_changes_detects_file_updates(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "policy.json")
+            with open(path, "w") as f:
+                f.write("1")
+
+            def loader(version):
+                with open(path) as f:
+                    return f.read()
+
+            store = PolicyStore(loader, path=path)
+            self.assertFalse(store.check_for_changes())
+            with open(path, "w") as f:
+                f.write("22")
+            self.assertTrue(store.check_for_changes())
+            self.assertEqual(store.current, "22")
+            self.assertEqual(store.version, 2)
+
+
+class TestPolicyReloadInServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.policy_path = os.path.join(self.tempdir.name, "policy.json")
+        self._write_policy({"allowed_commands": ["pwd"], "allowed_flags": []})
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["POLICY_FILE"] = self.policy_path
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("POLICY_FILE", None)
+        self.tempdir.cleanup()
+
+    def _write_policy(self, policy):
+        with open(self.policy_path, "w") as f:
+            json.dump(policy, f)
+
+    def _run(self, command):
+        return asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": command})
+        )
+
+    def test_reload_tool_applies_new_policy(self):
+        self.assertIn("Security violation", self._run("echo hi")[0].text)
+        old_config = self.server.executor.security_config
+
+        self._write_policy({"allowed_commands": ["pwd", "echo"], "allowed_flags": "all"})
+        result = asyncio.run(self.server.handle_call_tool("reload_policy", {}))
+        self.assertIn("version 2 installed", result[0].text)
+        self.assertEqual(self.server.executor.security_config.version, 2)
+        self.assertEqual(self._run("echo hi")[0].text.strip(), "hi")
+
+        # Work that captured the previous policy keeps validating against it
+        with self.assertRaises(self.server.CommandSecurityError):
+            self.server.executor.validate_command("echo hi", old_config)
+
+    def test_invalid_policy_is_rejected(self):
+        self._write_policy({"allowed_commandz": ["echo"]})
+        result = asyncio.run(self.server.handle_call_tool("reload_policy", {}))
+        self.assertIn("Policy reload failed", result[0].text)
+        self.assertEqual(self.server.executor.security_config.version, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
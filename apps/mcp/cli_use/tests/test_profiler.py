@@ -0,0 +1,144 @@
+import os
+import importlib
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+
+from starlette.testclient import TestClient
+
+from cli_use.profiler import Profiler, ProfilerBusyError, StackSampler
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+class BusyThread:
+    def __enter__(self):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=busy_loop, args=(self.stop,), name="busy")
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+class TestStackSampler(unittest.TestCase):
+    def test_collapsed_stacks_name_the_hot_function(self):
+        with BusyThread():
+            profile = StackSampler(interval=0.002).sample(0.3)
+        self.assertGreater(profile.samples, 10)
+        lines = profile.collapsed().splitlines()
+        hot = [line for line in lines if line.startswith("thread:busy;")]
+        self.assertTrue(hot)
+        stack, count = hot[0].rsplit(" ", 1)
+        self.assertIn(f"{__name__}:busy_loop", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_idle_threads_are_skipped_by_default(self):
+        event = threading.Event()
+        waiter = threading.Thread(target=event.wait, name="waiter")
+        waiter.start()
+        try:
+            profile = StackSampler(interval=0.002).sample(0.05)
+            with_idle = StackSampler(interval=0.002).sample(0.05, include_idle=True)
+        finally:
+            event.set()
+            waiter.join()
+        self.assertFalse(any(s.startswith("thread:waiter") for s in profile.stacks))
+        self.assertTrue(any(s.startswith("thread:waiter") for s in with_idle.stacks))
+
+    def test_overhead_is_measured_and_bounded(self):
+        with BusyThread():
+            profile = StackSampler(interval=0.001, max_overhead=0.0001).sample(0.3)
+        self.assertGreater(profile.sampling_seconds, 0)
+        self.assertLess(profile.overhead, 1)
+        # The budget cannot be met, so the sampler backs off
+        self.assertGreater(profile.interval, 0.001)
+
+
+class TestProfiler(unittest.TestCase):
+    def test_disabled(self):
+        with self.assertRaises(RuntimeError):
+            Profiler().run(1)
+
+    def test_duration_must_be_finite_and_positive(self):
+        profiler = Profiler(enabled=True, max_seconds=0.2)
+        for seconds in (float("nan"), float("inf"), 0, -1):
+            with self.assertRaises(ValueError):
+                profiler.run(seconds)
+        # A rejected duration does not leave the profiler busy
+        self.assertGreater(profiler.run(0.05).samples, 0)
+
+    def test_no_thread_while_idle_and_one_profile_at_a_time(self):
+        profiler = Profiler(enabled=True, max_seconds=0.2)
+
+        async def scenario():
+            self.assertNotIn(
+                "cli_use-profiler", [t.name for t in threading.enumerate()]
+            )
+            first = asyncio.create_task(profiler.profile(10))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(ProfilerBusyError):
+                await profiler.profile(1)
+            return await first
+
+        started = time.monotonic()
+        profile = asyncio.run(scenario())
+        # Capped at max_seconds
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertAlmostEqual(profile.duration, 0.2, delta=0.1)
+        self.assertEqual(profiler.snapshot()["runs"], 1)
+
+
+class TestProfileEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+
+    def tearDown(self):
+        os.environ.pop("DEBUG_PROFILER", None)
+        self.tempdir.cleanup()
+
+    def _load(self):
+        import cli_use.server as server_module
+        from cli_use import cli
+
+        server = importlib.reload(server_module)
+        return server, TestClient(cli.create_sse_app(0))
+
+    def test_endpoint_is_opt_in(self):
+        server, client = self._load()
+        self.assertEqual(client.get("/debug/profile?seconds=0.1").status_code, 404)
+        tools = asyncio.run(server.handle_list_tools())
+        self.assertNotIn("debug_profile", [tool.name for tool in tools])
+
+    def test_endpoint_returns_collapsed_stacks(self):
+        os.environ["DEBUG_PROFILER"] = "true"
+        server, client = self._load()
+        with BusyThread():
+            response = client.get("/debug/profile?seconds=0.2")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("thread:busy;", response.text)
+        self.assertIn("x-profile-overhead", response.headers)
+        for seconds in ("-1", "nan", "inf", "soon"):
+            response = client.get(f"/debug/profile?seconds={seconds}")
+            self.assertEqual(response.status_code, 400, seconds)
+
+        result = asyncio.run(server.handle_call_tool("debug_profile", {"seconds": 0.1}))
+        self.assertIn('"samples"', result[0].text)
+        for seconds in ("NaN", [1]):
+            result = asyncio.run(server.handle_call_tool("debug_profile", {"seconds": seconds}))
+            self.assertTrue(result[0].error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+import os
+import importlib
+import asyncio
+import json
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import uvicorn
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from cli_use.ratelimit import (
+    AdmissionConfig,
+    AdmissionController,
+    AdmissionMiddleware,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refills_at_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        bucket.consume()
+        bucket.consume()
+        self.assertAlmostEqual(bucket.wait_time(), 0.5)
+        clock.now = 0.5
+        self.assertEqual(bucket.wait_time(), 0.0)
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(rate=0, capacity=0)
+        for _ in range(1000):
+            bucket.consume()
+        self.assertEqual(bucket.wait_time(), 0.0)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_noisy_session_does_not_drain_other_sessions(self):
+        clock = FakeClock()
+        controller = AdmissionController(
+            AdmissionConfig(session_rate=1, session_burst=3, global_rate=100, global_burst=100),
+            clock=clock,
+        )
+        admitted = [controller.admit_call("noisy").admitted for _ in range(5)]
+        self.assertEqual(admitted, [True, True, True, False, False])
+        rejected = controller.admit_call("noisy")
+        self.assertGreater(rejected.retry_after, 0)
+        self.assertTrue(controller.admit_call("quiet").admitted)
+
+    def test_process_slots(self):
+        controller = AdmissionController(
+            AdmissionConfig(max_processes=2, max_session_processes=1)
+        )
+        self.assertTrue(controller.try_acquire_process("a").admitted)
+        self.assertFalse(controller.try_acquire_process("a").admitted)
+        self.assertTrue(controller.try_acquire_process("b").admitted)
+        decision = controller.try_acquire_process("c")
+        self.assertFalse(decision.admitted)
+        self.assertEqual(decision.reason, "global process limit reached")
+        controller.release_process("a")
+        self.assertTrue(controller.try_acquire_process("c").admitted)
+        snapshot = controller.snapshot()
+        self.assertEqual(snapshot["global"]["processes"], 2)
+        self.assertEqual(snapshot["rejected"]["processes"], 2)
+
+    def test_forgotten_session_is_dropped_after_its_last_process(self):
+        controller = AdmissionController(AdmissionConfig())
+        controller.admit_call("gone")
+        self.assertTrue(controller.try_acquire_process("gone").admitted)
+        controller.forget_session("gone")
+        self.assertEqual(len(controller.snapshot()["sessions"]), 1)
+        controller.release_process("gone")
+        self.assertEqual(controller.snapshot()["sessions"], {})
+
+    def test_snapshot_does_not_expose_session_ids(self):
+        controller = AdmissionController(AdmissionConfig())
+        controller.admit_call("4f1c0e9ab2d84b7e9d3a1c5e7f9b2d40")
+        (key,) = controller.snapshot()["sessions"]
+        self.assertNotIn("4f1c0e9a", key)
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    def setUp(self):
+        async def messages(request):
+            body = await request.body()
+            return PlainTextResponse(body.decode(), status_code=202)
+
+        self.controller = AdmissionController(
+            AdmissionConfig(session_rate=0.1, session_burst=1, global_rate=0)
+        )
+        self.known = {"s1", "s2"}
+        app = Starlette(
+            routes=[Route("/messages/", messages, methods=["POST"])],
+            middleware=[
+                Middleware(
+                    AdmissionMiddleware,
+                    controller=self.controller,
+                    is_known_session=self.known.__contains__,
+                )
+            ],
+        )
+        self.client = TestClient(app)
+
+    def _call(self, session: str, method: str = "tools/call"):
+        payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": {}}
+        return self.client.post(f"/messages/?session_id={session}", content=json.dumps(payload))
+
+    def test_rejects_tool_calls_over_budget_with_retry_after(self):
+        first = self._call("s1")
+        self.assertEqual(first.status_code, 202)
+        self.assertIn("tools/call", first.text)
+        second = self._call("s1")
+        self.assertEqual(second.status_code, 429)
+        self.assertGreaterEqual(int(second.headers["retry-after"]), 1)
+        self.assertEqual(second.json()["error"], "rate_limited")
+
+    def test_other_methods_and_sessions_pass(self):
+        self._call("s1")
+        self.assertEqual(self._call("s1", method="tools/list").status_code, 202)
+        self.assertEqual(self._call("s2").status_code, 202)
+
+    def test_unknown_sessions_share_one_bucket(self):
+        self.assertEqual(self._call("made-up-1").status_code, 202)
+        self.assertEqual(self._call("made-up-2").status_code, 429)
+        self.assertEqual(len(self.controller.snapshot()["sessions"]), 1)
+        self.assertEqual(self._call("s1").status_code, 202)
+
+
+class TestProcessAdmissionInTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["MAX_SESSION_PROCESSES"] = "1"
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("MAX_SESSION_PROCESSES", None)
+        self.tempdir.cleanup()
+
+    def test_run_command_rejected_when_no_slot(self):
+        self.assertTrue(self.server.admission.try_acquire_process("local").admitted)
+        result = asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": "pwd"})
+        )
+        self.assertIn("session process limit reached", result[0].text)
+        self.server.admission.release_process("local")
+        result = asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": "pwd"})
+        )
+        self.assertTrue(any("return code: 0" in tc.text for tc in result))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestAdmissionOverSse(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["ALLOWED_COMMANDS"] = "sleep"
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+        import cli_use.cli as cli
+
+        self.port = free_port()
+        config = uvicorn.Config(
+            cli.create_sse_app(self.port), host="127.0.0.1", port=self.port, log_level="warning"
+        )
+        self.uvicorn = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.uvicorn.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.uvicorn.started and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def tearDown(self):
+        self.uvicorn.should_exit = True
+        self.thread.join(timeout=10)
+        os.environ.pop("ALLOWED_COMMANDS", None)
+        self.tempdir.cleanup()
+
+    def test_calls_and_processes_share_one_key_that_is_forgotten(self):
+        seen = []
+
+        async def scenario():
+            async with sse_client(f"http://127.0.0.1:{self.port}/sse") as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    call = asyncio.create_task(
+                        session.call_tool("run_command", {"command": "sleep 0.5"})
+                    )
+                    while not self.server.admission.snapshot()["global"]["processes"]:
+                        await asyncio.sleep(0.01)
+                    seen.append(self.server.admission.snapshot()["sessions"])
+                    await call
+
+        asyncio.run(scenario())
+        (budget,) = seen[0].values()
+        self.assertEqual(budget["processes"], 1)
+        self.assertLess(budget["calls"]["available"], budget["calls"]["capacity"])
+        deadline = time.monotonic() + 5
+        while self.server.admission.snapshot()["sessions"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.server.admission.snapshot()["sessions"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
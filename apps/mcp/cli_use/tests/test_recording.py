@@ -0,0 +1,183 @@
+import os
+import importlib
+import asyncio
+import contextlib
+import gzip
+import json
+import tempfile
+import unittest
+
+import anyio
+from click.testing import CliRunner
+from mcp import ClientSession
+from mcp.shared.memory import create_client_server_memory_streams
+
+from cli_use.recording import TrafficRecorder, iter_recording, load_sessions
+from cli_use.replay import ReplayReport, percentile, replay
+
+
+class TestReplayReport(unittest.TestCase):
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    def test_summary(self):
+        report = ReplayReport()
+        report.add("tools/call", 0.010)
+        report.add("tools/call", 0.030, tool_error=True)
+        report.add("tools/list", 0.002, error=True)
+        report.finished = report.started + 2.0
+        summary = report.summary()
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["throughput_rps"], 1.5)
+        self.assertAlmostEqual(summary["error_rate"], 0.3333)
+        self.assertEqual(summary["methods"]["tools/call"]["tool_errors"], 1)
+        self.assertEqual(summary["methods"]["tools/call"]["p99_ms"], 30.0)
+        self.assertIn("tools/list", report.format())
+
+
+class TestRecordAndReplay(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    @contextlib.asynccontextmanager
+    async def connect(self, recorder=None):
+        """An initialized client session to the server over memory streams."""
+        app = self.server.server
+        async with create_client_server_memory_streams() as (client_streams, server_streams):
+            if recorder is not None:
+                server_streams = recorder.wrap(*server_streams)
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(
+                    app.run, *server_streams, app.create_initialization_options()
+                )
+                async with ClientSession(*client_streams) as session:
+                    await session.initialize()
+                    yield session
+                tg.cancel_scope.cancel()
+
+    def record(self, path):
+        recorder = TrafficRecorder(path)
+
+        async def scenario():
+            async with self.connect(recorder) as session:
+                await session.list_tools()
+                await session.call_tool("run_command", {"command": "pwd"})
+                await session.call_tool("run_command", {"command": "rm -rf x"})
+
+        asyncio.run(scenario())
+        recorder.close()
+        return recorder
+
+    def test_recording_format(self):
+        path = os.path.join(self.tempdir.name, "traffic.jsonl.gz")
+        recorder = self.record(path)
+        self.assertEqual(recorder.snapshot()["sessions"], 1)
+
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(json.loads(f.readline())["v"], 1)
+        entries = [entry for _, entry in iter_recording(path)]
+        self.assertEqual(len(entries), recorder.messages)
+        self.assertEqual({entry["d"] for entry in entries}, {">", "<"})
+        offsets = [entry["t"] for entry in entries]
+        self.assertEqual(offsets, sorted(offsets))
+
+        sessions = load_sessions(path)
+        self.assertEqual(len(sessions), 1)
+        methods = [request.method for request in sessions[0]]
+        self.assertEqual(methods, ["tools/list", "tools/call", "tools/call"])
+        self.assertEqual(sessions[0][0].offset, 0)
+        self.assertEqual(sessions[0][2].params["arguments"]["command"], "rm -rf x")
+
+    def test_each_server_start_is_a_new_run(self):
+        path = os.path.join(self.tempdir.name, "traffic.jsonl")
+        self.record(path)
+        self.record(path)
+        self.assertEqual(len(load_sessions(path)), 2)
+
+    def test_replay(self):
+        path = os.path.join(self.tempdir.name, "traffic.jsonl")
+        self.record(path)
+        sessions = load_sessions(path)
+
+        report = asyncio.run(replay(sessions, self.connect, speed=None))
+        summary = report.summary()
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["error_rate"], 0)
+        # The denied rm is a tool error, not a protocol error
+        self.assertEqual(summary["methods"]["tools/call"]["tool_errors"], 1)
+
+        report = asyncio.run(replay(sessions, self.connect, speed=10, concurrency=2, repeat=3))
+        summary = report.summary()
+        self.assertEqual(summary["sessions"], 3)
+        self.assertEqual(summary["requests"], 9)
+        self.assertEqual(summary["methods"]["tools/call"]["tool_errors"], 3)
+        self.assertGreater(summary["overall"]["p99_ms"], 0)
+
+    def test_truncated_recording_is_read_up_to_the_cut(self):
+        path = os.path.join(self.tempdir.name, "traffic.jsonl.gz")
+        self.record(path)
+        complete = len(load_sessions(path)[0])
+        # A writer that never closed the file leaves no gzip trailer
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:-8])
+        self.assertEqual(len(load_sessions(path)[0]), complete)
+
+        path = os.path.join(self.tempdir.name, "traffic.jsonl")
+        self.record(path)
+        with open(path, "a") as f:
+            f.write('{"t": 1.5, "s"')
+        self.assertEqual(len(load_sessions(path)[0]), complete)
+
+    def test_replay_reports_unreadable_recordings(self):
+        from cli_use.cli import cli
+
+        path = os.path.join(self.tempdir.name, "traffic.jsonl.gz")
+        with open(path, "w") as f:
+            f.write("not gzip\n")
+        result = CliRunner().invoke(cli, ["replay", path])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("Cannot read", result.output)
+
+    def test_sse_shutdown_closes_the_recording(self):
+        from starlette.testclient import TestClient
+
+        path = os.path.join(self.tempdir.name, "traffic.jsonl.gz")
+        os.environ["RECORD_FILE"] = path
+        try:
+            import cli_use.server as server_module
+            from cli_use import cli
+
+            server = importlib.reload(server_module)
+            with TestClient(cli.create_sse_app(0)) as client:
+                self.assertEqual(client.get("/health").status_code, 200)
+        finally:
+            os.environ.pop("RECORD_FILE")
+        self.assertIsNone(server.recorder._thread)
+        # The gzip trailer was written
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(json.loads(f.read().splitlines()[0])["v"], 1)
+
+    def test_disabled_recorder_returns_streams_unchanged(self):
+        recorder = TrafficRecorder()
+        streams = (object(), object())
+        self.assertEqual(recorder.wrap(*streams), streams)
+        self.assertFalse(recorder.snapshot()["enabled"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import importlib
+import asyncio
+import json
+import tempfile
+import unittest
+
+from cli_use.rules import compile_rules
+
+
+class TestCompiledRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = compile_rules(
+            [
+                {"command": "git", "flags": ["--no-pager", "-s"], "deny_flags": ["-c"]},
+                {"command": "npm*", "flags": "all"},
+                {"command": "npx", "allow": False},
+                {"command": "py*.test"},
+                {"regex": r"python3(\.\d+)?", "flags": ["-m"]},
+                {"command": "cat", "paths": ["src/**", "README.md"]},
+            ]
+        )
+
+    def test_exact_prefix_and_pattern_lookup(self):
+        self.assertEqual(self.rules.match("git").pattern, "git")
+        self.assertEqual(self.rules.match("npm").pattern, "npm*")
+        self.assertEqual(self.rules.match("npmx").pattern, "npm*")
+        self.assertFalse(self.rules.match("npx").allow)
+        self.assertEqual(self.rules.match("python3.11").pattern, r"python3(\.\d+)?")
+        self.assertEqual(self.rules.match("pyfoo.test").pattern, "py*.test")
+        self.assertIsNone(self.rules.match("python2"))
+        self.assertIsNone(self.rules.match("gi"))
+
+    def test_flags(self):
+        git = self.rules.match("git")
+        self.assertTrue(git.flag_allowed("--no-pager"))
+        self.assertFalse(git.flag_allowed("-c"))
+        self.assertFalse(git.flag_allowed("--exec-path"))
+        self.assertIsNone(self.rules.match("pyfoo.test").flag_allowed("-x"))
+        self.assertTrue(self.rules.match("npm").flag_allowed("--anything=1"))
+
+    def test_paths(self):
+        cat = self.rules.match("cat")
+        self.assertTrue(cat.path_allowed("src/a/b.py"))
+        self.assertTrue(cat.path_allowed("README.md"))
+        self.assertFalse(cat.path_allowed("secrets/key.pem"))
+
+    def test_deny_rules_win_over_broader_allow_rules(self):
+        rules = compile_rules([{"regex": "sudo.*", "allow": False}, {"command": "*"}])
+        self.assertFalse(rules.match("sudo").allow)
+        self.assertTrue(rules.match("ls").allow)
+        rules = compile_rules(
+            [{"command": "git*", "flags": "all"}, {"command": "git-sh?ll", "allow": False}]
+        )
+        self.assertFalse(rules.match("git-shell").allow)
+        self.assertEqual(rules.match("git-log").pattern, "git*")
+        rules = compile_rules([{"command": "rm"}, {"command": "r*", "allow": False}])
+        self.assertFalse(rules.match("rm").allow)
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            compile_rules([{"regex": "("}])
+        with self.assertRaises(ValueError):
+            compile_rules([{"command": "git", "regex": "git"}])
+        with self.assertRaises(ValueError):
+            compile_rules([{"command": "git", "flagz": []}])
+
+
+class TestRulesInExecutor(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tempdir.name, "src"))
+        policy_path = os.path.join(self.tempdir.name, "policy.json")
+        with open(policy_path, "w") as f:
+            json.dump(
+                {
+                    "allowed_commands": ["pwd"],
+                    "allowed_flags": [],
+                    "rules": [
+                        {"command": "echo", "flags": ["-n"]},
+                        {"command": "ls", "paths": ["src", "src/**"], "flags": "all"},
+                    ],
+                },
+                f,
+            )
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["POLICY_FILE"] = policy_path
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+        self.executor = self.server.executor
+
+    def tearDown(self):
+        os.environ.pop("POLICY_FILE", None)
+        self.tempdir.cleanup()
+
+    def test_rule_allows_command_and_flags(self):
+        command, args = self.executor.validate_command("echo -n hi")
+        self.assertEqual((command, args), ("echo", ["-n", "hi"]))
+        with self.assertRaises(self.server.CommandSecurityError):
+            self.executor.validate_command("echo -e hi")
+        with self.assertRaises(self.server.CommandSecurityError):
+            self.executor.validate_command("cat README.md")
+
+    def test_rule_restricts_paths(self):
+        self.executor.validate_command("ls -la src")
+        with self.assertRaises(self.server.CommandSecurityError):
+            self.executor.validate_command("ls ./")
+
+    def test_rule_restricts_bare_file_names(self):
+        with open(os.path.join(self.tempdir.name, "secrets.pem"), "w") as f:
+            f.write("key\n")
+        self.assertEqual(self.executor.validate_command("ls src"), ("ls", ["src"]))
+        with self.assertRaises(self.server.CommandSecurityError):
+            self.executor.validate_command("ls secrets.pem")
+        result = asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": "ls secrets.pem"})
+        )
+        self.assertIn("not allowed", result[0].text)
+
+    def test_rules_listed_in_security_rules(self):
+        result = asyncio.run(self.server.handle_call_tool("show_security_rules", {}))
+        self.assertIn("echo: flags -n", result[0].text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import importlib
+import asyncio
+import json
+import subprocess
+import tempfile
+import time
+import unittest
+
+from cli_use.rusage import (
+    ResourceStats,
+    ResourceUsage,
+    command_name,
+    run_with_rusage,
+    wait_with_rusage,
+)
+
+# Allocates ~64 MiB and burns some CPU in a grandchild of the shell
+HEAVY = "python3 -c 'b = bytearray(64 * 1024 * 1024); sum(range(3 * 10 ** 6))'"
+
+
+class TestRunWithRusage(unittest.TestCase):
+    def test_usage_covers_the_child_tree(self):
+        result = run_with_rusage(["/bin/sh", "-c", f"{HEAVY} && echo out; echo err >&2; exit 3"])
+        self.assertEqual((result.returncode, result.stdout, result.stderr), (3, "out\n", "err\n"))
+        self.assertGreater(result.rusage.cpu_user_seconds, 0.01)
+        self.assertGreater(result.rusage.max_rss_bytes, 64 * 1024 * 1024)
+
+    def test_timeout_kills_and_reaps(self):
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_with_rusage(["/bin/sh", "-c", "echo partial; sleep 5"], timeout=0.3)
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_timeout_covers_background_processes_holding_the_pipes(self):
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired) as raised:
+            run_with_rusage(["/bin/sh", "-c", "sleep 8 & echo hi"], timeout=0.5)
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(raised.exception.output, "hi\n")
+
+    def test_output_is_decoded_as_text_and_counted_in_bytes(self):
+        result = run_with_rusage(["/bin/sh", "-c", r"printf 'caf\303\251\r\nx\r'; printf e >&2"])
+        self.assertEqual((result.stdout, result.stderr), ("café\nx\n", "e"))
+        self.assertEqual((result.stdout_bytes, result.stderr_bytes), (9, 1))
+
+    def test_already_reaped_child_has_no_usage(self):
+        process = subprocess.Popen(["true"])
+        process.wait()
+        self.assertIsNone(wait_with_rusage(process))
+
+    def test_dict_round_trip(self):
+        usage = ResourceUsage(cpu_user_seconds=1.5, max_rss_bytes=10)
+        self.assertEqual(ResourceUsage.from_dict({**usage.to_dict(), "new_field": 1}), usage)
+
+
+class TestResourceStats(unittest.TestCase):
+    def test_aggregates_per_command_name_heaviest_first(self):
+        stats = ResourceStats(max_commands=2)
+        stats.record("make -j8", ResourceUsage(cpu_user_seconds=3.0, max_rss_bytes=100))
+        stats.record("make test", ResourceUsage(cpu_system_seconds=1.0, max_rss_bytes=300))
+        stats.record("/bin/ls -l | head", ResourceUsage(cpu_user_seconds=0.01))
+        stats.record("git status", ResourceUsage(cpu_user_seconds=0.5))
+        snapshot = stats.snapshot()
+        self.assertEqual(list(snapshot["commands"]), ["make", "(other)", "ls"])
+        make = snapshot["commands"]["make"]
+        self.assertEqual(make["count"], 2)
+        self.assertEqual(make["max_rss_bytes"], 300)
+        self.assertEqual(make["cpu_seconds_mean"], 2.0)
+        self.assertEqual(stats.snapshot(limit=1)["tracked"], 3)
+
+    def test_command_name(self):
+        self.assertEqual(command_name("/usr/bin/git status | head"), "git")
+        self.assertEqual(command_name("echo 'unterminated"), "echo")
+        self.assertEqual(command_name(""), "")
+
+
+class TestResourceUsageInTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def call(self, name, arguments):
+        return asyncio.run(self.server.handle_call_tool(name, arguments))
+
+    def test_trailer_is_optional(self):
+        completion = self.call("run_command", {"command": "ls"})[-1].text
+        self.assertEqual(completion, "\nCommand completed with return code: 0")
+
+        completion = self.call("run_command", {"command": "ls", "resource_usage": True})[-1].text
+        first, trailer = completion.strip().split("\n")
+        self.assertEqual(first, "Command completed with return code: 0")
+        self.assertTrue(trailer.startswith("Resource usage: "))
+        usage = json.loads(trailer[len("Resource usage: ") :])
+        self.assertGreater(usage["max_rss_bytes"], 0)
+        self.assertIn("voluntary_context_switches", usage)
+
+    def test_usage_is_aggregated_in_stats(self):
+        for _ in range(2):
+            self.call("run_command", {"command": "ls -l"})
+        self.call("run_command", {"command": "pwd"})
+        stats = json.loads(self.call("show_stats", {})[0].text)["commands"]
+        self.assertEqual(stats["commands"]["ls"]["count"], 2)
+        self.assertEqual(stats["commands"]["pwd"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import importlib
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from cli_use import scheduler as scheduler_module
+from cli_use.scheduler import (
+    CommandScheduler,
+    classify_command,
+    parse_priority_rules,
+    priority_prefix,
+)
+
+
+class TestPriorityRules(unittest.TestCase):
+    def test_classify_by_name_and_pattern(self):
+        rules = parse_priority_rules("interactive=cat,git status*;batch=npm run build*")
+        self.assertEqual(classify_command("cat foo.txt", rules), "interactive")
+        self.assertEqual(classify_command("git status --short", rules), "interactive")
+        self.assertEqual(classify_command("npm run build -- --prod", rules), "batch")
+        self.assertEqual(classify_command("git push", rules), "normal")
+
+    def test_unknown_class_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_priority_rules("urgent=ls")
+
+    def test_priority_prefix(self):
+        with mock.patch.object(scheduler_module, "_NICE", "/usr/bin/nice"), mock.patch.object(
+            scheduler_module, "_IONICE", "/usr/bin/ionice"
+        ):
+            self.assertEqual(priority_prefix("normal"), [])
+            self.assertEqual(
+                priority_prefix("batch"),
+                ["/usr/bin/nice", "-n", "10", "/usr/bin/ionice", "-c", "2", "-n", "7"],
+            )
+
+
+class TestCommandScheduler(unittest.TestCase):
+    def test_interactive_jumps_queued_batch_work(self):
+        scheduler = CommandScheduler(workers=1)
+        gate = threading.Event()
+        order = []
+
+        def job(name):
+            if name == "blocker":
+                gate.wait(5)
+            order.append(name)
+            return name
+
+        async def scenario():
+            blocker = asyncio.create_task(scheduler.run("normal", job, "blocker"))
+            await asyncio.sleep(0.05)
+            batch = asyncio.create_task(scheduler.run("batch", job, "batch"))
+            await asyncio.sleep(0.01)
+            interactive = asyncio.create_task(scheduler.run("interactive", job, "interactive"))
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.snapshot()["queued"]["batch"], 1)
+            gate.set()
+            return await asyncio.gather(blocker, batch, interactive)
+
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            scheduler.shutdown()
+        self.assertEqual(results, ["blocker", "batch", "interactive"])
+        self.assertEqual(order, ["blocker", "interactive", "batch"])
+
+    def test_exceptions_propagate(self):
+        scheduler = CommandScheduler(workers=1)
+
+        def boom():
+            raise RuntimeError("boom")
+
+        try:
+            with self.assertRaises(RuntimeError):
+                asyncio.run(scheduler.run("normal", boom))
+        finally:
+            scheduler.shutdown()
+
+
+class TestRunCommandPriority(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        self.server.scheduler.shutdown()
+        self.tempdir.cleanup()
+
+    def test_batch_priority_executes(self):
+        result = asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": "pwd", "priority": "batch"})
+        )
+        self.assertTrue(any("return code: 0" in tc.text for tc in result))
+
+    def test_unknown_priority(self):
+        result = asyncio.run(
+            self.server.handle_call_tool("run_command", {"command": "pwd", "priority": "urgent"})
+        )
+        self.assertIn("Unknown priority", result[0].text)
+
+
+if __name__ == "__main__":
+    unittest.main()
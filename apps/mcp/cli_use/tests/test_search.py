@@ -0,0 +1,166 @@
+import os
+import importlib
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from cli_use.search import ContentSearcher, required_literal
+
+
+class TestContentSearcher(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        self._write("src/app.py", "import os\ndef main():\n    return 'needle'\n")
+        self._write("src/util.py", "def helper():\n    pass\n")
+        self._write("docs/readme.md", "The needle is documented here.\n")
+        self._write("build/out.py", "needle = 1\n")
+        self._write(".gitignore", "build/\n*.log\n")
+        self._write("debug.log", "needle in a log\n")
+        with open(os.path.join(self.root, "blob.bin"), "wb") as f:
+            f.write(b"needle\0\0binary")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _write(self, rel: str, content: str) -> None:
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test_literal_search_respects_gitignore_and_skips_binary(self):
+        searcher = ContentSearcher(workers=1)
+        matches = list(searcher.search(self.root, "needle", literal=True))
+        paths = sorted(m.path for m in matches)
+        self.assertEqual(paths, ["docs/readme.md", "src/app.py"])
+        app = next(m for m in matches if m.path == "src/app.py")
+        self.assertEqual(app.line_number, 3)
+        self.assertEqual(app.line, "    return 'needle'")
+
+    def test_regex_with_globs(self):
+        searcher = ContentSearcher(workers=1)
+        matches = list(searcher.search(self.root, r"def \w+\(", globs=["*.py"]))
+        self.assertEqual(
+            sorted(m.format() for m in matches),
+            ["src/app.py:2:def main():", "src/util.py:1:def helper():"],
+        )
+
+    def test_gitignore_can_be_disabled(self):
+        searcher = ContentSearcher(workers=1)
+        matches = list(
+            searcher.search(self.root, "needle", literal=True, respect_gitignore=False)
+        )
+        self.assertIn("build/out.py", {m.path for m in matches})
+        self.assertIn("debug.log", {m.path for m in matches})
+
+    def test_anchored_directory_pattern_matches_only_at_the_root(self):
+        self._write(".gitignore", "/dist/\n")
+        self._write("dist/bundle.js", "needle\n")
+        self._write("src/dist/keep.js", "needle\n")
+        searcher = ContentSearcher(workers=1)
+        paths = {m.path for m in searcher.search(self.root, "needle", literal=True)}
+        self.assertNotIn("dist/bundle.js", paths)
+        self.assertIn("src/dist/keep.js", paths)
+
+    def test_parallel_search_honours_limit(self):
+        for i in range(40):
+            self._write(f"many/file{i}.txt", "alpha\nneedle one\nneedle two\n")
+        searcher = ContentSearcher(workers=2, min_parallel_files=0)
+        try:
+            matches = list(searcher.search(self.root, "needle", max_results=25))
+            self.assertEqual(len(matches), 25)
+            everything = list(searcher.search(self.root, "needle", max_results=1000))
+            self.assertEqual(len(everything), 82)
+        finally:
+            searcher.shutdown()
+
+    def test_required_literal(self):
+        self.assertEqual(required_literal("needle"), "needle")
+        self.assertEqual(required_literal(r"hello\.world"), "hello.world")
+        self.assertEqual(required_literal("(foo)?barbaz"), "barbaz")
+        self.assertIsNone(required_literal("foo|bar"))
+        self.assertIsNone(required_literal("(?i)needle"))
+
+    def test_required_literal_skips_repetition_counts(self):
+        self.assertIsNone(required_literal("ax{10}"))
+        self.assertIsNone(required_literal("ab{2,3}c"))
+        self.assertEqual(required_literal("abc{2}def"), "def")
+        self._write("src/xs.txt", "axxxxxxxxxx\n")
+        searcher = ContentSearcher(workers=1)
+        self.assertEqual(
+            [m.path for m in searcher.search(self.root, "ax{10}")], ["src/xs.txt"]
+        )
+
+
+class TestSearchTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["ALLOWED_COMMANDS"] = "ls,cat,pwd,grep"
+        with open(os.path.join(self.tempdir.name, "notes.txt"), "w") as f:
+            f.write("first line\nsecond needle line\n")
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("ALLOWED_COMMANDS", None)
+        self.tempdir.cleanup()
+
+    def _reload(self, allowed_commands):
+        os.environ["ALLOWED_COMMANDS"] = allowed_commands
+        self.server = importlib.reload(self.server)
+
+    def test_search_tool_returns_matches(self):
+        result = asyncio.run(
+            self.server.handle_call_tool("search", {"pattern": "needle"})
+        )
+        self.assertIn("notes.txt:2:second needle line", result[0].text)
+
+    def test_search_tool_rejects_path_outside_allowed_dir(self):
+        result = asyncio.run(
+            self.server.handle_call_tool("search", {"pattern": "root", "path": "/etc"})
+        )
+        self.assertTrue(any("Security violation" in tc.text for tc in result))
+
+    def test_search_tool_reports_invalid_pattern(self):
+        result = asyncio.run(
+            self.server.handle_call_tool("search", {"pattern": "("})
+        )
+        self.assertTrue(any("Invalid pattern" in tc.text for tc in result))
+
+    def test_search_tool_rejects_non_positive_max_results(self):
+        for value in (0, -1):
+            result = asyncio.run(
+                self.server.handle_call_tool(
+                    "search", {"pattern": "needle", "max_results": value}
+                )
+            )
+            self.assertIn("max_results must be at least 1", result[0].text)
+
+    def test_search_tool_follows_the_grep_policy(self):
+        self._reload("ls,cat,pwd")
+        with mock.patch.object(self.server.audit, "record") as record:
+            result = asyncio.run(
+                self.server.handle_call_tool("search", {"pattern": "needle"})
+            )
+        self.assertIn("Command 'grep' is not allowed", result[0].text)
+        command, decision = record.call_args.args[:2]
+        self.assertEqual((command, decision), ("grep .", "denied"))
+        self.assertEqual(record.call_args.kwargs["tool"], "search")
+
+    def test_search_is_audited(self):
+        with mock.patch.object(self.server.audit, "record") as record:
+            asyncio.run(self.server.handle_call_tool("search", {"pattern": "needle"}))
+        command, decision = record.call_args.args[:2]
+        self.assertEqual((command, decision), ("grep .", "allowed"))
+        self.assertEqual(record.call_args.kwargs["matches"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import os
+import importlib
+import asyncio
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import httpx
+import uvicorn
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from cli_use.sessions import SessionConfig, SessionRegistry, SseSession, set_heartbeat_interval
+
+
+class TestSessionConfig(unittest.TestCase):
+    def tearDown(self):
+        for key in ("SSE_HEARTBEAT_INTERVAL", "SSE_IDLE_TIMEOUT"):
+            os.environ.pop(key, None)
+
+    def test_from_env(self):
+        os.environ["SSE_HEARTBEAT_INTERVAL"] = "5"
+        os.environ["SSE_IDLE_TIMEOUT"] = "0"
+        config = SessionConfig.from_env()
+        self.assertEqual((config.heartbeat_interval, config.idle_timeout), (5.0, 0.0))
+        self.assertEqual((config.max_age, config.send_timeout), (0.0, 30.0))
+
+    def test_negative_limits_are_rejected(self):
+        os.environ["SSE_IDLE_TIMEOUT"] = "-1"
+        with self.assertRaises(ValueError):
+            SessionConfig.from_env()
+
+    def test_heartbeat_cannot_be_disabled(self):
+        for value in ("0", "-5", "nan"):
+            os.environ["SSE_HEARTBEAT_INTERVAL"] = value
+            with self.assertRaises(ValueError):
+                SessionConfig.from_env()
+        with self.assertRaises(ValueError):
+            set_heartbeat_interval(0)
+
+
+class TestExpiry(unittest.TestCase):
+    def session(self, calls=()):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return SseSession(1, "default", "client", set(calls), loop)
+
+    def test_idle_sessions_expire_unless_a_call_runs(self):
+        config = SessionConfig(idle_timeout=10)
+        session = self.session()
+        self.assertIsNone(session.expired(session.last_active + 5, config))
+        self.assertEqual(session.expired(session.last_active + 11, config), "idle")
+        busy = self.session(calls=["call"])
+        self.assertIsNone(busy.expired(busy.last_active + 11, config))
+
+    def test_max_age_applies_to_active_sessions(self):
+        config = SessionConfig(idle_timeout=0, max_age=60)
+        session = self.session(calls=["call"])
+        session.touch()
+        self.assertEqual(session.expired(session.created + 61, config), "max_age")
+
+    def test_blocked_writes_mark_a_session_stalled(self):
+        config = SessionConfig(idle_timeout=0, send_timeout=5)
+        session = self.session()
+        blocked = asyncio.Event()
+
+        async def send(message):
+            blocked.set()
+            await asyncio.sleep(30)
+
+        async def scenario():
+            task = asyncio.create_task(session.wrap_send(send)({"type": "http.response.body"}))
+            await blocked.wait()
+            now = time.monotonic()
+            self.assertIsNone(session.expired(now, config))
+            self.assertEqual(session.expired(now + 6, config), "stalled")
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertIsNone(session.expired(now + 6, config))
+
+        asyncio.run(scenario())
+
+
+class TestRegistry(unittest.TestCase):
+    def test_reaping_cancels_the_session_block(self):
+        registry = SessionRegistry(SessionConfig(idle_timeout=10))
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def scenario():
+            async with registry.open(send, "default", "client", set()) as session:
+                self.assertEqual(len(registry), 1)
+                self.assertEqual(registry.reap(session.last_active + 11), [session])
+                await asyncio.sleep(30)
+            return session
+
+        started = time.monotonic()
+        session = asyncio.run(scenario())
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(session.closed_reason, "idle")
+        # The event stream is ended for the client
+        self.assertEqual(sent, [{"type": "http.response.body", "body": b"", "more_body": False}])
+        snapshot = registry.snapshot()
+        self.assertEqual((snapshot["open"], snapshot["opened"]), (0, 1))
+        self.assertEqual(snapshot["closed"]["idle"], 1)
+        registry.stop()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerTestCase(unittest.TestCase):
+    env = {}
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ.update(self.env)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+        import cli_use.cli as cli
+
+        self.port = free_port()
+        config = uvicorn.Config(
+            cli.create_sse_app(self.port), host="127.0.0.1", port=self.port, log_level="warning"
+        )
+        self.uvicorn = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.uvicorn.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.uvicorn.started and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def tearDown(self):
+        self.uvicorn.should_exit = True
+        self.thread.join(timeout=10)
+        for key in self.env:
+            os.environ.pop(key, None)
+        self.tempdir.cleanup()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def read_stream(self, timeout):
+        """Lines of a raw /sse stream until the server ends it or ``timeout`` passes."""
+        lines = []
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            async with client.stream(
+                "GET", f"{self.url}/sse", headers={"Accept-Encoding": "identity"}
+            ) as response:
+                try:
+                    async with asyncio.timeout(timeout):
+                        async for line in response.aiter_lines():
+                            lines.append(line)
+                except TimeoutError:
+                    lines.append(None)
+        return lines
+
+
+class TestHeartbeats(ServerTestCase):
+    env = {"SSE_HEARTBEAT_INTERVAL": "0.1"}
+
+    def test_idle_streams_carry_keep_alive_comments(self):
+        lines = asyncio.run(self.read_stream(0.55))
+        self.assertEqual(lines[0], "event: endpoint")
+        self.assertGreaterEqual(sum(line.startswith(": ping") for line in lines[1:-1]), 3)
+        # Still open when the client gave up
+        self.assertIsNone(lines[-1])
+
+
+class TestIdleSessions(ServerTestCase):
+    env = {"SSE_IDLE_TIMEOUT": "0.3", "ALLOWED_COMMANDS": "sleep"}
+
+    def test_idle_session_is_closed_and_counted(self):
+        async def scenario():
+            task = asyncio.create_task(self.read_stream(10))
+            while httpx.get(f"{self.url}/health").json()["sessions"] != 1:
+                await asyncio.sleep(0.02)
+            return await task
+
+        started = time.monotonic()
+        lines = asyncio.run(scenario())
+        self.assertIsNotNone(lines[-1], "the server did not end the stream")
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(httpx.get(f"{self.url}/health").json()["sessions"], 0)
+        stats = httpx.get(f"{self.url}/stats").json()["sessions"]
+        self.assertEqual(stats["closed"]["idle"], 1)
+
+    def test_running_call_keeps_the_session_open(self):
+        async def scenario():
+            async with sse_client(f"{self.url}/sse") as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    return await session.call_tool("run_command", {"command": "sleep 1.5"})
+
+        result = asyncio.run(scenario())
+        self.assertFalse(result.isError)
+        self.assertEqual(self.server.sse_sessions.snapshot()["closed"]["idle"], 0)
+
+
+class TestMaxSessionAge(ServerTestCase):
+    env = {"SSE_MAX_SESSION_AGE": "0.5", "ALLOWED_COMMANDS": "sleep", "KILL_GRACE_PERIOD": "1"}
+
+    def test_old_session_is_closed_and_its_calls_cancelled(self):
+        async def scenario():
+            async with sse_client(f"{self.url}/sse") as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    with self.assertRaises(Exception):
+                        await asyncio.wait_for(
+                            session.call_tool("run_command", {"command": "sleep 30"}), 10
+                        )
+
+        started = time.monotonic()
+        asyncio.run(scenario())
+        self.assertLess(time.monotonic() - started, 5)
+        # The close is counted once the server has ended the response, which
+        # may be after the client saw the stream end
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            closed = httpx.get(f"{self.url}/stats").json()["sessions"]["closed"]
+            if closed["max_age"]:
+                break
+            time.sleep(0.05)
+        self.assertEqual(closed["max_age"], 1)
+        calls = self.server.in_flight.snapshot()
+        self.assertEqual((calls["running"], calls["cancelled"]), (0, 1))
+        self.assertEqual(httpx.get(f"{self.url}/health").json()["sessions"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
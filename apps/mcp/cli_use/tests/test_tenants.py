@@ -0,0 +1,141 @@
+import os
+import importlib
+import asyncio
+import json
+import tempfile
+import unittest
+
+
+class TestTenants(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        root = self.tempdir.name
+        self.default_dir = os.path.join(root, "default")
+        self.alpha_dir = os.path.join(root, "alpha")
+        for path in (self.default_dir, self.alpha_dir):
+            os.makedirs(path)
+        with open(os.path.join(self.alpha_dir, "alpha.txt"), "w") as f:
+            f.write("alpha only\n")
+        with open(os.path.join(root, "alpha-policy.json"), "w") as f:
+            json.dump({"allowed_commands": ["pwd", "cat", "echo", "grep"]}, f)
+        tenants_file = os.path.join(root, "tenants.json")
+        with open(tenants_file, "w") as f:
+            json.dump(
+                {"tenants": {"alpha": {"allowed_dir": "alpha", "policy_file": "alpha-policy.json"}}},
+                f,
+            )
+        os.environ["ALLOWED_DIR"] = self.default_dir
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["TENANTS_FILE"] = tenants_file
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+
+    def tearDown(self):
+        os.environ.pop("TENANTS_FILE", None)
+        self.tempdir.cleanup()
+
+    def _call(self, tenant_name, tool, arguments):
+        async def call():
+            tenant = self.server.tenants.get(tenant_name)
+            token = self.server.tenants.bind(tenant)
+            try:
+                # Handlers run in tasks spawned by the session, which inherit the binding
+                return await asyncio.create_task(self.server.handle_call_tool(tool, arguments))
+            finally:
+                self.server.tenants.unbind(token)
+
+        return asyncio.run(call())
+
+    def test_registry_contains_tenants(self):
+        self.assertEqual(sorted(self.server.tenants.names()), ["alpha", "default"])
+        self.assertIs(self.server.tenants.default.executor, self.server.executor)
+
+    def test_commands_run_in_tenant_directory_with_tenant_policy(self):
+        result = self._call("alpha", "run_command", {"command": "pwd"})
+        self.assertEqual(os.path.realpath(result[0].text.strip()), os.path.realpath(self.alpha_dir))
+        result = self._call("alpha", "run_command", {"command": "echo hi"})
+        self.assertEqual(result[0].text.strip(), "hi")
+
+        result = asyncio.run(self.server.handle_call_tool("run_command", {"command": "echo hi"}))
+        self.assertIn("Security violation", result[0].text)
+
+    def test_tenants_are_isolated(self):
+        result = self._call("default", "run_command", {"command": f"cat {self.alpha_dir}/alpha.txt"})
+        self.assertIn("outside of allowed directory", result[0].text)
+        result = self._call("alpha", "search", {"pattern": "alpha only"})
+        self.assertIn("alpha.txt:1:alpha only", result[0].text)
+
+    def test_sibling_directory_sharing_a_prefix_is_outside(self):
+        sibling = self.alpha_dir + "10"
+        os.makedirs(sibling)
+        with open(os.path.join(sibling, "secret.txt"), "w") as f:
+            f.write("not alpha's\n")
+        result = self._call("alpha", "run_command", {"command": f"cat {sibling}/secret.txt"})
+        self.assertIn("outside of allowed directory", result[0].text)
+        self.assertFalse(self.server.tenants.get("alpha").executor._is_path_safe(sibling))
+        self.assertTrue(self.server.tenants.get("alpha").executor._is_path_safe(self.alpha_dir))
+
+    def test_reload_policy_targets_current_tenant(self):
+        self._call("alpha", "reload_policy", {})
+        self.assertEqual(self.server.tenants.get("alpha").policy_store.version, 2)
+        self.assertEqual(self.server.policy_store.version, 1)
+
+    def test_stats_are_scoped_to_the_tenant(self):
+        self._call("alpha", "run_command", {"command": "echo hi"})
+        alpha = json.loads(self._call("alpha", "show_stats", {})[0].text)
+        self.assertEqual(alpha["tenant"], "alpha")
+        self.assertIn("echo", alpha["commands"]["commands"])
+        self.assertNotIn("tenants", alpha)
+        default = json.loads(self._call("default", "show_stats", {})[0].text)
+        self.assertNotIn("echo", default["commands"]["commands"])
+        admin = self.server.collect_stats()
+        self.assertIn("echo", admin["tenants"]["alpha"]["commands"]["commands"])
+        self.assertIn("echo", admin["commands"]["commands"])
+        self.assertEqual(admin["tenants"]["alpha"]["allowed_dir"], self.alpha_dir)
+
+    def test_http_endpoints_hide_other_tenants(self):
+        from starlette.testclient import TestClient
+        from cli_use import cli
+
+        os.environ["ADMIN_TOKEN"] = "s3cret"
+        try:
+            client = TestClient(cli.create_sse_app(0))
+        finally:
+            os.environ.pop("ADMIN_TOKEN")
+        health = client.get("/t/alpha/health").json()
+        self.assertEqual(
+            (health["tenant"], health["allowed_dir"], health["policy_version"]),
+            ("alpha", self.alpha_dir, 1),
+        )
+        health = client.get("/health").json()
+        self.assertEqual(health["tenant"], "default")
+        self.assertNotIn(self.alpha_dir, json.dumps(health))
+        self.assertNotIn("tenants", client.get("/stats?tenant=alpha").json())
+        self.assertEqual(client.get("/t/nope/stats").status_code, 404)
+
+        self.assertEqual(client.get("/admin/stats").status_code, 401)
+        response = client.get("/admin/stats", headers={"Authorization": "Bearer s3cret"})
+        self.assertEqual(sorted(response.json()["tenants"]), ["alpha", "default"])
+
+    def test_admin_endpoint_is_off_without_a_token(self):
+        from starlette.testclient import TestClient
+        from cli_use import cli
+
+        os.environ.pop("ADMIN_TOKEN", None)
+        client = TestClient(cli.create_sse_app(0))
+        self.assertEqual(client.get("/admin/stats").status_code, 404)
+
+    def test_invalid_registration(self):
+        with self.assertRaises(ValueError):
+            self.server.tenants.register("alpha", self.alpha_dir)
+        with self.assertRaises(ValueError):
+            self.server.tenants.register("../escape", self.alpha_dir)
+        with self.assertRaises(ValueError):
+            self.server.tenants.register("missing", os.path.join(self.tempdir.name, "nope"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import importlib
+import asyncio
+import tempfile
+import unittest
+
+from cli_use.terminal import TerminalNormalizer, normalize_output
+
+SPINNER_LOG = (
+    "\x1b]0;build\x07\x1b[1mBuilding\x1b[0m\n"
+    + "".join(f"\r\x1b[2K\x1b[36m{frame}\x1b[0m compiling" for frame in "|/-\\" * 50)
+    + "\r\x1b[2K\x1b[32mdone\x1b[0m compiling\n"
+    + "".join(f"\rDownloading {p:3d}%" for p in range(0, 101, 10))
+    + "\nstatus: 1\nqueued: 9\n\x1b[2A\x1b[2Kstatus: 2\n\x1b[2Kqueued: 8\n"
+    + "héllo ✓\n"
+)
+
+
+def feed_in_chunks(mode, data, size):
+    normalizer = TerminalNormalizer(mode)
+    out = [normalizer.feed(data[i : i + size]) for i in range(0, len(data), size)]
+    return "".join(out) + normalizer.close()
+
+
+class TestModes(unittest.TestCase):
+    def test_raw(self):
+        self.assertEqual(normalize_output(SPINNER_LOG, "raw"), SPINNER_LOG)
+
+    def test_stripped(self):
+        self.assertEqual(
+            normalize_output(SPINNER_LOG, "stripped"),
+            "Building\ndone compiling\nDownloading 100%\n"
+            "status: 1\nqueued: 9\nstatus: 2\nqueued: 8\nhéllo ✓\n",
+        )
+
+    def test_rendered(self):
+        self.assertEqual(
+            normalize_output(SPINNER_LOG, "rendered"),
+            "Building\ndone compiling\nDownloading 100%\nstatus: 2\nqueued: 8\nhéllo ✓\n",
+        )
+
+    def test_rendered_overwrites_like_a_terminal(self):
+        self.assertEqual(normalize_output("abcdef\rXY\n", "rendered"), "XYcdef\n")
+        self.assertEqual(normalize_output("abcdef\rXY\n", "stripped"), "XY\n")
+        self.assertEqual(normalize_output("wait |\b/\b-\bok\n", "rendered"), "wait ok\n")
+        self.assertEqual(normalize_output("abcdef\x1b[3D\x1b[K!\n", "rendered"), "abc!\n")
+        self.assertEqual(normalize_output("a\x1b[5Gb\n", "rendered"), "a   b\n")
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            TerminalNormalizer("html")
+
+
+class TestStreaming(unittest.TestCase):
+    def test_chunking_does_not_change_the_result(self):
+        data = SPINNER_LOG.encode()
+        for mode in ("raw", "stripped", "rendered"):
+            expected = normalize_output(SPINNER_LOG, mode)
+            for size in (1, 2, 7, 64):
+                self.assertEqual(feed_in_chunks(mode, data, size), expected, (mode, size))
+
+    def test_redraws_without_newline_do_not_accumulate(self):
+        for mode in ("stripped", "rendered"):
+            normalizer = TerminalNormalizer(mode)
+            for i in range(10000):
+                self.assertEqual(normalizer.feed(f"\r\x1b[2Kprogress {i}"), "")
+            self.assertLess(sum(map(len, normalizer._pending + normalizer._screen)), 100)
+            self.assertEqual(normalizer.close(), "progress 9999")
+
+    def test_rendered_emits_rows_that_scroll_out_of_reach(self):
+        normalizer = TerminalNormalizer("rendered", rows=3)
+        self.assertEqual(normalizer.feed("one\ntwo\nthree\nfour\n"), "one\ntwo\n")
+        self.assertEqual(normalizer.close(), "three\nfour\n")
+
+
+class TestOutputModeInTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+        with open(os.path.join(self.tempdir.name, "build.log"), "w") as f:
+            f.write("\x1b[31mred\x1b[0m\n50%\r100%\n")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def run_command(self, **arguments):
+        result = asyncio.run(self.server.handle_call_tool("run_command", arguments))
+        return result[0].text
+
+    def test_pipe_output_is_raw_unless_requested(self):
+        # Pipes are read in text mode, which already turns \r into \n
+        self.assertEqual(self.run_command(command="cat build.log"), "\x1b[31mred\x1b[0m\n50%\n100%\n")
+        self.assertEqual(
+            self.run_command(command="cat build.log", output="stripped"), "red\n50%\n100%\n"
+        )
+
+    def test_unknown_output_mode(self):
+        self.assertIn("Unknown output mode", self.run_command(command="pwd", output="html"))
+
+    def test_pty_output_is_normalized_while_reading(self):
+        executor = self.server.executor
+        command = "printf '\\033[1mhi\\033[0m\\r\\033[Khello\\n'"
+        result = executor._execute_with_pty(command, output_mode="rendered")
+        self.assertEqual(result.stdout, "hello\n")
+        raw = executor._execute_with_pty(command, output_mode="raw")
+        self.assertIn("\x1b[1mhi", raw.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import importlib
+import asyncio
+import gzip
+import json
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+
+import anyio
+import mcp.types as types
+import uvicorn
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.shared.message import SessionMessage
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from cli_use.transport import CompressionConfig, CompressionMiddleware, TransportMetrics, negotiate
+
+
+def make_app(config, metrics):
+    async def big(request):
+        return JSONResponse({"text": "line of output\n" * 1000})
+
+    async def small(request):
+        return JSONResponse({"ok": True})
+
+    async def events(request):
+        async def stream():
+            for i in range(3):
+                yield f"event: message\ndata: {{\"n\": {i}}}\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return Starlette(
+        routes=[Route("/big", big), Route("/small", small), Route("/events", events)],
+        middleware=[Middleware(CompressionMiddleware, config=config, metrics=metrics)],
+    )
+
+
+class TestNegotiate(unittest.TestCase):
+    def test_server_preference_and_quality(self):
+        self.assertEqual(negotiate("gzip, zstd", ("zstd", "gzip")), "zstd")
+        self.assertEqual(negotiate("gzip, zstd;q=0", ("zstd", "gzip")), "gzip")
+        self.assertEqual(negotiate("*", ("gzip",)), "gzip")
+        self.assertIsNone(negotiate("br", ("zstd", "gzip")))
+        self.assertIsNone(negotiate("", ("gzip",)))
+
+    def test_config_from_env(self):
+        os.environ["COMPRESSION"] = "none"
+        try:
+            self.assertEqual(CompressionConfig.from_env().encodings, ())
+            os.environ["COMPRESSION"] = "brotli"
+            with self.assertRaises(ValueError):
+                CompressionConfig.from_env()
+        finally:
+            os.environ.pop("COMPRESSION")
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.metrics = TransportMetrics()
+        self.client = TestClient(
+            make_app(CompressionConfig(("gzip",), min_size=1024), self.metrics)
+        )
+
+    def get_raw(self, path, accept="gzip"):
+        with self.client.stream("GET", path, headers={"Accept-Encoding": accept}) as response:
+            return response, b"".join(response.iter_raw())
+
+    def test_large_response_is_compressed(self):
+        response, raw = self.get_raw("/big")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(int(response.headers["content-length"]), len(raw))
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        self.assertEqual(json.loads(gzip.decompress(raw))["text"], "line of output\n" * 1000)
+        http = self.metrics.snapshot()["http"]
+        self.assertEqual(http["responses"], {"gzip": 1})
+        self.assertLess(http["wire_bytes"] * 10, http["body_bytes"])
+
+    def test_small_response_and_unsupported_client_are_not_compressed(self):
+        response, raw = self.get_raw("/small")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(json.loads(raw), {"ok": True})
+        response, raw = self.get_raw("/big", accept="identity")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(self.metrics.snapshot()["http"]["responses"], {"identity": 2})
+
+    def test_event_stream_is_flushed_per_event(self):
+        app = make_app(CompressionConfig(("gzip",), min_size=1024), self.metrics)
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/events",
+            "raw_path": b"/events",
+            "query_string": b"",
+            "root_path": "",
+            "scheme": "http",
+            "server": ("test", 80),
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        messages = []
+
+        async def receive():
+            await asyncio.sleep(1)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(app(scope, receive, send))
+        headers = dict(messages[0]["headers"])
+        self.assertEqual(headers[b"content-encoding"], b"gzip")
+        self.assertNotIn(b"content-length", headers)
+        decoder = zlib.decompressobj(31)
+        # Every chunk decodes on its own: nothing waits in the compressor
+        events = [decoder.decompress(m["body"]).decode() for m in messages[1:]]
+        self.assertEqual(events[:3], [f'event: message\ndata: {{"n": {i}}}\n\n' for i in range(3)])
+        self.assertTrue(decoder.eof)
+
+
+class TestSerializationMetrics(unittest.TestCase):
+    def test_messages_are_serialized_once_and_timed(self):
+        metrics = TransportMetrics()
+        message = types.JSONRPCMessage(
+            types.JSONRPCResponse(jsonrpc="2.0", id=1, result={"content": [{"text": "x" * 10000}]})
+        )
+        expected = message.model_dump_json(by_alias=True, exclude_none=True)
+
+        async def scenario():
+            send, receive = anyio.create_memory_object_stream(1)
+            _, write = metrics.wrap(None, send)
+            await write.send(SessionMessage(message))
+            return await receive.receive()
+
+        received = asyncio.run(scenario())
+        self.assertEqual(received.message.model_dump_json(by_alias=True), expected)
+        self.assertEqual(received.message.root.id, 1)
+        snapshot = metrics.snapshot()["serialization"]
+        self.assertEqual(snapshot["messages"], 1)
+        self.assertEqual(snapshot["bytes"], len(expected))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestCompressedSseSession(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        os.environ["COMPRESSION"] = "gzip"
+        import cli_use.server as server_module
+        import cli_use.cli as cli
+
+        self.server = importlib.reload(server_module)
+        with open(os.path.join(self.tempdir.name, "big.txt"), "w") as f:
+            f.write("compressible command output\n" * 20000)
+
+        self.port = free_port()
+        config = uvicorn.Config(
+            cli.create_sse_app(self.port), host="127.0.0.1", port=self.port, log_level="warning"
+        )
+        self.uvicorn = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.uvicorn.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.uvicorn.started and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def tearDown(self):
+        self.uvicorn.should_exit = True
+        self.thread.join(timeout=10)
+        os.environ.pop("COMPRESSION", None)
+        self.tempdir.cleanup()
+
+    def test_tool_output_is_compressed_on_the_wire(self):
+        async def scenario():
+            async with sse_client(f"http://127.0.0.1:{self.port}/sse") as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    return await session.call_tool("run_command", {"command": "cat big.txt"})
+
+        result = asyncio.run(scenario())
+        self.assertEqual(result.content[0].text, "compressible command output\n" * 20000)
+        stats = self.server.collect_stats()["transport"]
+        self.assertGreaterEqual(stats["http"]["responses"]["gzip"], 1)
+        self.assertGreater(stats["http"]["compression_ratio"], 10)
+        self.assertGreater(stats["serialization"]["bytes"], 20000 * 28)
+        self.assertEqual(stats["compression"]["encodings"], ["gzip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,368 @@
+import os
+import importlib
+import asyncio
+import socket
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from cli_use.cancellation import CancelToken, CommandCancelled
+from cli_use.workers import (
+    HELLO,
+    PROTOCOL_VERSION,
+    REJECT,
+    RUN,
+    FrameAuth,
+    WorkerAgent,
+    WorkerError,
+    WorkerPool,
+    encode_json_frame,
+    parse_address,
+    read_frame,
+)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestProtocol(unittest.TestCase):
+    def test_frame_round_trip(self):
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(encode_json_frame(RUN, 7, {"command": "ls"}))
+            frame_type, job_id, payload = read_frame(right)
+        self.assertEqual((frame_type, job_id, payload), (RUN, 7, b'{"command": "ls"}'))
+
+    def test_signed_frames_cannot_be_replayed_or_reflected(self):
+        server = FrameAuth.derive("secret", "server", "s-nonce", "w-nonce")
+        worker = FrameAuth.derive("secret", "worker", "s-nonce", "w-nonce")
+        left, right = socket.socketpair()
+        with left, right:
+            frame = server.sign(encode_json_frame(RUN, 7, {"command": "ls"}))
+            left.sendall(frame)
+            self.assertEqual(read_frame(right, worker)[:2], (RUN, 7))
+            # The same frame again is out of sequence
+            left.sendall(frame)
+            with self.assertRaises(ConnectionError):
+                read_frame(right, worker)
+        # A worker's own frames are not accepted as the server's
+        echo = FrameAuth.derive("secret", "worker", "s-nonce", "w-nonce")
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(worker.sign(encode_json_frame(RUN, 1, {})))
+            with self.assertRaises(ConnectionError):
+                read_frame(right, echo)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("unix:/tmp/w.sock"), (socket.AF_UNIX, "/tmp/w.sock"))
+        self.assertEqual(parse_address("tcp:127.0.0.1:9000"), (socket.AF_INET, ("127.0.0.1", 9000)))
+        self.assertEqual(parse_address(":9000"), (socket.AF_INET, ("0.0.0.0", 9000)))
+        with self.assertRaises(ValueError):
+            parse_address("nowhere")
+
+    def test_tcp_requires_token(self):
+        with self.assertRaises(ValueError):
+            WorkerPool().listen("tcp:127.0.0.1:0")
+        with self.assertRaises(WorkerError):
+            WorkerAgent("tcp:127.0.0.1:9", name="a").connect()
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(token="secret", dispatch="all", heartbeat_timeout=1.0)
+        self.address = self.pool.listen("tcp:127.0.0.1:0")
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.agents = {}
+
+    def tearDown(self):
+        for agent in self.agents.values():
+            agent.stop()
+        self.pool.close()
+        self.tempdir.cleanup()
+
+    def start_agent(self, name, labels=(), slots=1, token="secret"):
+        directory = os.path.realpath(os.path.join(self.tempdir.name, name))
+        os.makedirs(directory, exist_ok=True)
+        agent = WorkerAgent(
+            self.address,
+            name=name,
+            labels=labels,
+            slots=slots,
+            directory=directory,
+            token=token,
+            heartbeat_interval=0.2,
+        )
+        self.agents[name] = agent
+        threading.Thread(target=agent.run_forever, daemon=True).start()
+        self.assertTrue(wait_for(lambda: name in self.pool.snapshot()["workers"]))
+        return directory
+
+    def test_dispatch_by_labels(self):
+        self.start_agent("a", labels=["linux"])
+        gpu_dir = self.start_agent("b", labels=["linux", "gpu"])
+        for _ in range(3):
+            result = self.pool.run("pwd", labels=["gpu"])
+            self.assertEqual(result.stdout.strip(), gpu_dir)
+        with self.assertRaises(WorkerError):
+            self.pool.run("pwd", labels=["arm64"])
+
+    def test_commands_are_confined_to_the_worker_roots(self):
+        directory = self.start_agent("a")
+        subdir = os.path.join(directory, "sub")
+        os.makedirs(subdir)
+        self.assertEqual(self.pool.run("pwd", cwd=subdir).stdout.strip(), subdir)
+        sibling = directory + "-other"
+        os.makedirs(sibling)
+        for outside in (self.tempdir.name, sibling):
+            with self.assertRaises(WorkerError) as raised:
+                self.pool.run("pwd", cwd=outside)
+            self.assertIn("outside the roots", str(raised.exception))
+        self.assertEqual(self.pool.snapshot()["workers"]["a"]["running"], 0)
+
+    def test_spreads_load_across_workers(self):
+        dirs = {self.start_agent(name) for name in ("a", "b", "c")}
+        results = []
+
+        def run():
+            results.append(self.pool.run("sleep 0.3; pwd", timeout=10).stdout.strip())
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(results), dirs)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_reports_resource_usage(self):
+        self.start_agent("a")
+        result = self.pool.run("python3 -c 'sum(range(2 * 10 ** 6))'", timeout=10)
+        self.assertEqual(result.returncode, 0)
+        self.assertGreater(result.rusage.cpu_seconds, 0)
+        self.assertGreater(result.rusage.max_rss_bytes, 1024 * 1024)
+
+    def test_streams_output_and_reports_exit_status(self):
+        self.start_agent("a")
+        chunks = []
+        result = self.pool.run(
+            "echo out; echo err >&2; exit 3",
+            on_output=lambda stream, chunk: chunks.append((stream, chunk)),
+        )
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, "out\n")
+        self.assertEqual(result.stderr, "err\n")
+        self.assertIn(("stdout", b"out\n"), chunks)
+
+    def test_timeout(self):
+        self.start_agent("a")
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run("sleep 5", timeout=0.3)
+        self.assertEqual(self.pool.snapshot()["workers"]["a"]["running"], 0)
+
+    def test_timeout_covers_background_processes_holding_the_pipes(self):
+        self.start_agent("a")
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run("sleep 30 & echo hi", timeout=0.3)
+        # Reported by the worker, not by the pool's fallback 5 s later
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertTrue(wait_for(lambda: self.pool.snapshot()["workers"]["a"]["running"] == 0))
+
+    def test_cancel_frees_slot_and_stops_remote_process_group(self):
+        directory = self.start_agent("a")
+        pidfile = os.path.join(directory, "pid")
+        cancel = CancelToken()
+        errors = []
+
+        def run():
+            try:
+                self.pool.run("echo $$ > pid; sleep 30 & wait", timeout=60, cancel=cancel)
+            except CommandCancelled as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(wait_for(lambda: os.path.exists(pidfile) and os.path.getsize(pidfile)))
+        with open(pidfile) as f:
+            pgid = int(f.read())
+        cancel.cancel()
+        thread.join(timeout=1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.pool.snapshot()["workers"]["a"]["running"], 0)
+
+        def group_gone():
+            try:
+                os.killpg(pgid, 0)
+            except ProcessLookupError:
+                return True
+            return False
+
+        self.assertTrue(wait_for(group_gone, timeout=3))
+
+    def test_worker_loss_fails_running_commands(self):
+        self.start_agent("a")
+        errors = []
+
+        def run():
+            try:
+                self.pool.run("sleep 5", timeout=10)
+            except WorkerError as e:
+                errors.append(str(e))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(wait_for(lambda: self.pool.snapshot()["workers"]["a"]["running"] == 1))
+        self.agents["a"].stop()
+        thread.join(5)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("Worker a", errors[0])
+        self.assertTrue(wait_for(lambda: not self.pool.snapshot()["workers"]))
+        self.assertEqual(self.pool.snapshot()["lost_jobs"], 1)
+
+    def test_rejects_bad_token(self):
+        agent = WorkerAgent(self.address, name="intruder", token="wrong")
+        with self.assertRaises(WorkerError):
+            agent.connect()
+        self.assertEqual(self.pool.snapshot()["workers"], {})
+
+    def test_worker_refuses_a_server_without_the_token(self):
+        impostor = WorkerPool(token="guess")
+        address = impostor.listen("tcp:127.0.0.1:0")
+        try:
+            agent = WorkerAgent(address, name="a", token="secret")
+            with self.assertRaises(WorkerError) as raised:
+                agent.connect()
+            self.assertIn("does not know the worker token", str(raised.exception))
+        finally:
+            impostor.close()
+
+
+class TestUnixSocketWorker(unittest.TestCase):
+    def test_unix_socket_without_token(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pool = WorkerPool(dispatch="all")
+            path = os.path.join(tempdir, "workers.sock")
+            address = pool.listen(f"unix:{path}")
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            agent = WorkerAgent(address, name="local", directory=tempdir)
+            threading.Thread(target=agent.run_forever, daemon=True).start()
+            try:
+                self.assertTrue(wait_for(lambda: pool.snapshot()["workers"]))
+                self.assertEqual(pool.run("echo hi").stdout, "hi\n")
+            finally:
+                agent.stop()
+                pool.close()
+
+    def test_malformed_hello_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pool = WorkerPool(dispatch="all")
+            path = os.path.join(tempdir, "workers.sock")
+            pool.listen(f"unix:{path}")
+            try:
+                for hello in (
+                    {"version": PROTOCOL_VERSION, "name": "x", "slots": "many"},
+                    {"version": PROTOCOL_VERSION, "name": "x", "labels": 5},
+                    {"version": PROTOCOL_VERSION, "name": ["x"]},
+                    ["not", "an", "object"],
+                ):
+                    with socket.socket(socket.AF_UNIX) as sock:
+                        sock.settimeout(5)
+                        sock.connect(path)
+                        sock.sendall(encode_json_frame(HELLO, 0, hello))
+                        self.assertEqual(read_frame(sock)[0], REJECT)
+                self.assertEqual(pool.snapshot()["workers"], {})
+                agent = WorkerAgent(f"unix:{path}", name="local", directory=tempdir)
+                threading.Thread(target=agent.run_forever, daemon=True).start()
+                try:
+                    self.assertTrue(wait_for(lambda: pool.snapshot()["workers"]))
+                finally:
+                    agent.stop()
+            finally:
+                pool.close()
+
+
+class TestRemoteExecutionInTool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["ALLOWED_DIR"] = self.tempdir.name
+        # Start from the default policy regardless of earlier tests
+        for key in ("ALLOWED_COMMANDS", "ALLOWED_FLAGS", "ALLOW_SHELL_OPERATORS"):
+            os.environ.pop(key, None)
+        import cli_use.server as server_module
+
+        self.server = importlib.reload(server_module)
+        with open(os.path.join(self.tempdir.name, "remote.txt"), "w") as f:
+            f.write("from the worker\n")
+        self.address = self.server.workers.listen(
+            f"unix:{os.path.join(self.tempdir.name, 'workers.sock')}"
+        )
+        self.agents = []
+        self.start_agent("builder", self.tempdir.name)
+
+    def tearDown(self):
+        for agent in self.agents:
+            agent.stop()
+        self.server.workers.close()
+        self.tempdir.cleanup()
+
+    def start_agent(self, name, root):
+        agent = WorkerAgent(self.address, name=name, labels=[name], directory=root)
+        self.agents.append(agent)
+        threading.Thread(target=agent.run_forever, daemon=True).start()
+        self.assertTrue(wait_for(lambda: name in self.server.workers.snapshot()["workers"]))
+
+    def test_labelled_command_runs_on_worker(self):
+        result = asyncio.run(
+            self.server.handle_call_tool(
+                "run_command", {"command": "cat remote.txt", "labels": ["builder"]}
+            )
+        )
+        self.assertEqual(result[0].text, "from the worker\n")
+        self.assertEqual(self.server.workers.snapshot()["dispatched"], 1)
+
+    def test_worker_refuses_a_tenant_outside_its_roots(self):
+        with tempfile.TemporaryDirectory() as elsewhere:
+            self.start_agent("stranger", elsewhere)
+            result = asyncio.run(
+                self.server.handle_call_tool(
+                    "run_command", {"command": "cat remote.txt", "labels": ["stranger"]}
+                )
+            )
+        self.assertTrue(result[0].error)
+        self.assertIn("outside the roots of worker stranger", result[0].text)
+
+    def test_unlabelled_command_runs_locally_when_the_last_worker_leaves(self):
+        self.agents.pop().stop()
+        self.assertTrue(wait_for(lambda: not self.server.workers.snapshot()["workers"]))
+        # should_dispatch() saw a worker that was gone by the time one was selected
+        with mock.patch.object(self.server.workers, "should_dispatch", return_value=True):
+            result = asyncio.run(
+                self.server.handle_call_tool("run_command", {"command": "cat remote.txt"})
+            )
+        self.assertEqual(result[0].text, "from the worker\n")
+        self.assertEqual(self.server.workers.snapshot()["dispatched"], 0)
+
+    def test_policy_is_enforced_before_dispatch(self):
+        result = asyncio.run(
+            self.server.handle_call_tool(
+                "run_command", {"command": "rm remote.txt", "labels": ["builder"]}
+            )
+        )
+        self.assertIn("Security violation", result[0].text)
+        self.assertEqual(self.server.workers.snapshot()["dispatched"], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir.name, "remote.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()